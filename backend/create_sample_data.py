@@ -1,8 +1,40 @@
-from pymongo import MongoClient
-from datetime import datetime, timedelta
+"""Generate GYMBLE sample data, from a single demo gym up to production-like scale.
+
+With no arguments this creates one small gym with the usual demo logins. For index
+and query benchmarking, scale it up:
+
+    python create_sample_data.py --gyms 2000 --members-per-gym 500 --years 3 --workers 8 --drop
+
+Every gym is generated from its own random stream derived from --seed and the gym
+index, so the same arguments (and --end-date) always produce the same documents
+regardless of --workers. Documents are written with batched insert_many calls from
+a pool of worker processes, one MongoClient per worker.
+
+The distributions are meant to look like real gyms: member counts are log-normal
+across gyms, sign-ups grow over time, members churn at the end of a plan period,
+check-ins cluster in the morning and evening with quieter weekends, and lifts
+progress over a member's tenure. Derived collections (exercise_stats,
+nutrition_summaries, progress buckets, template versions) are not generated, but
+--drop clears them so they do not point at members that no longer exist.
+"""
+import argparse
+import math
+import os
+import random
+import time
 import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
 from enum import Enum
+from multiprocessing import Pool
+from pathlib import Path
+
 import bcrypt
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
 
 # Define enums to match those in server.py
 class PlanType(str, Enum):
@@ -24,142 +56,549 @@ class UserRole(str, Enum):
 
 class PaymentMethod(str, Enum):
     CASH = "cash"
-    CARD = "card"
+    GOOGLE_PAY = "google_pay"
+    PHONE_PE = "phone_pe"
+    PAYTM = "paytm"
     UPI = "upi"
-    BANK_TRANSFER = "bank_transfer"
+    CARD = "card"
+
+SAMPLE_PASSWORD = "password123"
+DEMO_OWNER_EMAIL = "owner@gym.com"
+DEMO_MEMBER_EMAIL = "member@example.com"
+
+SAMPLE_COLLECTIONS = [
+    "gyms", "users", "plans", "members", "payments", "attendance",
+    "workout_templates", "diet_templates", "plan_assignments",
+    "workout_progress", "diet_progress",
+]
+
+# Built by the API from the collections above; stale once those are regenerated
+DERIVED_COLLECTIONS = [
+    "exercise_stats", "nutrition_summaries", "workout_progress_buckets",
+    "diet_progress_buckets", "template_versions",
+]
+
+# (type, name, price, duration_days, how often members pick it, chance of renewing)
+PLAN_CATALOG = [
+    (PlanType.BASIC, "Basic Plan", 1500, 30, 50, 0.75),
+    (PlanType.PREMIUM, "Quarterly Premium", 4000, 90, 25, 0.7),
+    (PlanType.VIP, "Half-yearly VIP", 7500, 180, 15, 0.65),
+    (PlanType.FAMILY, "Annual Family", 18000, 365, 10, 0.6),
+]
+
+PAYMENT_METHOD_WEIGHTS = {
+    PaymentMethod.UPI: 35,
+    PaymentMethod.CASH: 25,
+    PaymentMethod.GOOGLE_PAY: 15,
+    PaymentMethod.PHONE_PE: 12,
+    PaymentMethod.PAYTM: 5,
+    PaymentMethod.CARD: 8,
+}
+
+# Relative check-ins per hour of day (UTC is used as local time): morning and evening peaks
+CHECK_IN_HOUR_WEIGHTS = [0, 0, 0, 0, 0, 2, 10, 14, 11, 6, 4, 3, 3, 2, 2, 3, 6, 11, 14, 12, 7, 3, 1, 0]
+# Monday..Sunday
+WEEKDAY_WEIGHTS = [1.0, 1.0, 0.95, 0.95, 0.85, 0.65, 0.4]
+
+# (name, category, muscle groups, difficulty, [(exercise, sets, reps, starting kg or None)])
+WORKOUT_CATALOG = [
+    ("Push Day", "Strength", ["Chest", "Shoulders", "Triceps"], "Intermediate",
+     [("Bench Press", 4, "8-10", 50), ("Overhead Press", 3, "8-10", 30), ("Tricep Dips", 3, "12", None)]),
+    ("Pull Day", "Strength", ["Back", "Biceps"], "Intermediate",
+     [("Deadlift", 4, "5", 80), ("Barbell Row", 4, "8-10", 45), ("Bicep Curl", 3, "12", 12.5)]),
+    ("Leg Day", "Strength", ["Quads", "Hamstrings", "Glutes"], "Intermediate",
+     [("Squat", 4, "6-8", 60), ("Romanian Deadlift", 3, "10", 50), ("Walking Lunges", 3, "12", None)]),
+    ("Full Body Starter", "Strength", ["Full Body"], "Beginner",
+     [("Goblet Squat", 3, "12", 12.5), ("Dumbbell Press", 3, "12", 10), ("Lat Pulldown", 3, "12", 30)]),
+]
 
-# Connect to MongoDB - use GYMBLE instead of gymble (case sensitive)
-client = MongoClient('mongodb://localhost:27017')
-db = client.GYMBLE
+# (name, goal, calories, protein, carbs, fat, [(meal, time, [(food, quantity, calories)])])
+DIET_CATALOG = [
+    ("Lean Cut", "Weight Loss", 1800, 140.0, 160.0, 55.0, [
+        ("Breakfast", "7:00 AM", [("Oats", "60g", 230), ("Egg Whites", "4", 70)]),
+        ("Lunch", "1:00 PM", [("Grilled Chicken", "150g", 250), ("Brown Rice", "1 cup", 215)]),
+        ("Dinner", "8:00 PM", [("Paneer Tikka", "150g", 400), ("Salad", "1 bowl", 80)]),
+    ]),
+    ("Mass Builder", "Muscle Gain", 3000, 180.0, 380.0, 85.0, [
+        ("Breakfast", "7:00 AM", [("Whole Eggs", "4", 310), ("Toast", "4 slices", 320)]),
+        ("Lunch", "1:00 PM", [("Chicken Curry", "250g", 450), ("Rice", "2 cups", 410)]),
+        ("Snack", "5:00 PM", [("Whey Shake", "1 scoop", 150), ("Banana", "2", 210)]),
+        ("Dinner", "9:00 PM", [("Dal", "1 bowl", 230), ("Roti", "4", 400)]),
+    ]),
+]
+
+FIRST_NAMES = ["Aarav", "Vivaan", "Aditya", "Arjun", "Sai", "Reyansh", "Ishaan", "Rohan", "Kabir", "Dev",
+               "Ananya", "Diya", "Saanvi", "Aadhya", "Ira", "Myra", "Kiara", "Pari", "Anika", "Meera"]
+LAST_NAMES = ["Sharma", "Verma", "Patel", "Reddy", "Nair", "Iyer", "Khan", "Singh", "Gupta", "Das",
+              "Joshi", "Mehta", "Kapoor", "Rao", "Bose", "Chopra", "Menon", "Pillai", "Shah", "Ali"]
 
 # Helper function to hash passwords
 def hash_password(password):
     return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
 
-# Create a gym if none exists
-gym_id = str(uuid.uuid4())
-existing_gym = db.gyms.find_one({})
-if existing_gym:
-    gym_id = existing_gym["id"]
-    print(f"Using existing gym with ID: {gym_id}")
-else:
+def new_id(rng):
+    """uuid4-shaped id drawn from the gym's random stream, so ids are reproducible"""
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+def round_weight(kg):
+    return round(kg / 2.5) * 2.5
+
+class BatchWriter:
+    """Buffers documents per collection and writes them with insert_many"""
+    def __init__(self, db, batch_size):
+        self.db = db
+        self.batch_size = batch_size
+        self.buffers = defaultdict(list)
+        self.counts = defaultdict(int)
+
+    def add(self, collection, document):
+        buffer = self.buffers[collection]
+        buffer.append(document)
+        if len(buffer) >= self.batch_size:
+            self.flush(collection)
+
+    def flush(self, collection=None):
+        collections = [collection] if collection else list(self.buffers)
+        for name in collections:
+            buffer = self.buffers[name]
+            if not buffer:
+                continue
+            if self.db is not None:
+                self.db[name].insert_many(buffer, ordered=False)
+            self.counts[name] += len(buffer)
+            buffer.clear()
+
+worker_db = None
+
+def init_worker(mongo_url, db_name):
+    global worker_db
+    worker_db = MongoClient(mongo_url)[db_name] if mongo_url else None
+
+def generate_plans(rng, gym_id, created_at):
+    plans = []
+    for plan_type, name, price, duration_days, weight, renewal in PLAN_CATALOG:
+        # Not every gym sells every plan, but all of them sell the basic one
+        if plan_type != PlanType.BASIC and rng.random() < 0.3:
+            continue
+        plans.append({
+            "id": new_id(rng),
+            "gym_id": gym_id,
+            "name": name,
+            "description": f"{name} membership with access to all equipment",
+            "price": float(round(price * rng.uniform(0.8, 1.3), -1)),
+            "duration_days": duration_days,
+            "plan_type": plan_type.value,
+            "features": ["Access to gym equipment", "Locker access"],
+            "auto_renewal": True,
+            "created_at": created_at,
+            "is_active": True,
+            "_weight": weight,
+            "_renewal": renewal,
+        })
+    return plans
+
+def generate_templates(rng, gym_id, owner_name, created_at):
+    workouts = []
+    for name, category, muscles, difficulty, exercises in WORKOUT_CATALOG:
+        workouts.append({
+            "id": new_id(rng),
+            "gym_id": gym_id,
+            "name": name,
+            "description": f"{name} routine",
+            "category": category,
+            "target_muscle_groups": muscles,
+            "estimated_duration": 60,
+            "difficulty_level": difficulty,
+            "exercises": [
+                {
+                    "exercise_name": exercise,
+                    "sets": sets,
+                    "reps": reps,
+                    "weight": f"{kg}kg" if kg else "bodyweight",
+                    "rest_time": "90 seconds",
+                    "notes": None,
+                }
+                for exercise, sets, reps, kg in exercises
+            ],
+            "created_by": owner_name,
+            "created_at": created_at,
+            "is_active": True,
+            "version": 1,
+            "current_version_id": None,
+            "_exercises": exercises,
+        })
+
+    diets = []
+    for name, goal, calories, protein, carbs, fat, meals in DIET_CATALOG:
+        diets.append({
+            "id": new_id(rng),
+            "gym_id": gym_id,
+            "name": name,
+            "description": f"{name} meal plan",
+            "goal": goal,
+            "total_calories": calories,
+            "protein_target": protein,
+            "carbs_target": carbs,
+            "fat_target": fat,
+            "meals": [
+                {
+                    "meal_type": meal_type,
+                    "time": meal_time,
+                    "items": [{"food_name": food, "quantity": quantity, "calories": kcal} for food, quantity, kcal in items],
+                }
+                for meal_type, meal_time, items in meals
+            ],
+            "created_by": owner_name,
+            "created_at": created_at,
+            "is_active": True,
+            "version": 1,
+            "current_version_id": None,
+            "_meals": meals,
+        })
+    return workouts, diets
+
+def without_private(document):
+    return {key: value for key, value in document.items() if not key.startswith("_")}
+
+def membership_periods(rng, plan, joined_at, end):
+    """Start dates of the paid periods: members renew until they churn or history ends"""
+    periods = [joined_at]
+    duration = timedelta(days=plan["duration_days"])
+    while periods[-1] + duration < end and rng.random() < plan["_renewal"]:
+        periods.append(periods[-1] + duration)
+    return periods
+
+def visit_days(rng, first_day, last_day, visits_per_week):
+    """Days (midnight datetimes) on which the member shows up"""
+    day = first_day.replace(hour=0, minute=0, second=0, microsecond=0)
+    daily_rate = visits_per_week / sum(WEEKDAY_WEIGHTS)
+    days = []
+    while day < last_day:
+        if rng.random() < daily_rate * WEEKDAY_WEIGHTS[day.weekday()]:
+            days.append(day)
+        day += timedelta(days=1)
+    return days
+
+def generate_member(rng, writer, config, gym, plans, workouts, diets, email):
+    end, start = config["end"], config["start"]
+    gym_id = gym["id"]
+
+    # Sign-ups grow over time: sqrt skews join dates towards the recent end of the window
+    joined_at = start + (end - start) * math.sqrt(rng.random())
+    joined_at = joined_at.replace(microsecond=0)
+    plan = rng.choices(plans, [p["_weight"] for p in plans])[0]
+    periods = membership_periods(rng, plan, joined_at, end)
+    end_date = periods[-1] + timedelta(days=plan["duration_days"])
+    last_day = min(end_date, end)
+
+    name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+    member_id = new_id(rng)
+    phone = f"+91 9{rng.randrange(10 ** 8, 10 ** 9)}"
+
+    writer.add("users", {
+        "id": new_id(rng),
+        "email": email,
+        "password_hash": config["password_hash"],
+        "name": name,
+        "phone": phone,
+        "role": UserRole.MEMBER.value,
+        "gym_id": gym_id,
+        "created_at": joined_at,
+        "is_active": True,
+    })
+
+    preferred_method = rng.choices(list(PAYMENT_METHOD_WEIGHTS), list(PAYMENT_METHOD_WEIGHTS.values()))[0]
+    for period_start in periods:
+        method = preferred_method if rng.random() < 0.8 else rng.choice(list(PaymentMethod))
+        payment_date = period_start + timedelta(minutes=rng.randrange(0, 12 * 60))
+        writer.add("payments", {
+            "id": new_id(rng),
+            "gym_id": gym_id,
+            "member_id": member_id,
+            "member_name": name,
+            "amount": plan["price"],
+            "payment_date": payment_date,
+            "payment_method": method.value,
+            "status": "paid",
+            "transaction_id": None if method == PaymentMethod.CASH else f"TXN{rng.getrandbits(40):012X}",
+            "notes": None,
+            "plan_id": plan["id"],
+            "plan_name": plan["name"],
+            "updated_at": payment_date,
+        })
+
+    # Gamma-distributed habits: most members come 2-4 times a week, a few every day
+    visits_per_week = min(7.0, max(0.3, rng.gammavariate(2.0, 1.5)))
+    days = visit_days(rng, joined_at, last_day, visits_per_week)
+    preferred_hour = rng.choices(range(24), CHECK_IN_HOUR_WEIGHTS)[0]
+
+    workout = None
+    diet = None
+    if rng.random() < config["progress_share"]:
+        workout = rng.choice(workouts)
+        if rng.random() < 0.5:
+            diet = rng.choice(diets)
+    assignments = {}
+    for kind, template in (("workout", workout), ("diet", diet)):
+        if template is None:
+            continue
+        assignment_id = new_id(rng)
+        assignments[kind] = assignment_id
+        writer.add("plan_assignments", {
+            "id": assignment_id,
+            "gym_id": gym_id,
+            "member_id": member_id,
+            "member_name": name,
+            "plan_type": kind,
+            "plan_id": template["id"],
+            "plan_name": template["name"],
+            "assigned_by": gym["_owner_name"],
+            "assigned_at": joined_at,
+            "start_date": joined_at,
+            "end_date": None,
+            "is_active": True,
+            "notes": None,
+            "template_version_id": None,
+            "updated_at": joined_at,
+        })
+
+    last_visit = None
+    tenure_days = max(1, (last_day - joined_at).days)
+    for day in days:
+        # Members mostly keep to their usual slot, sometimes they come at another peak
+        hour = preferred_hour if rng.random() < 0.7 else rng.choices(range(24), CHECK_IN_HOUR_WEIGHTS)[0]
+        check_in = day + timedelta(hours=hour, minutes=rng.randrange(60), seconds=rng.randrange(60))
+        duration = int(min(180, max(20, rng.gauss(70, 20))))
+        check_out = check_in + timedelta(minutes=duration)
+        last_visit = check_in
+        writer.add("attendance", {
+            "id": new_id(rng),
+            "gym_id": gym_id,
+            "member_id": member_id,
+            "member_name": name,
+            "check_in_time": check_in,
+            "check_out_time": check_out,
+            "duration_minutes": duration,
+            "qr_code_data": f"GYMBLE_ATTENDANCE:{gym_id}:{int(check_in.timestamp() // 30)}",
+            "ip_address": None,
+            "device_info": "sample-data",
+        })
+
+        if workout and rng.random() < 0.6:
+            # Progressive overload: up to +30% over the member's tenure
+            progress = 1 + 0.3 * (check_in - joined_at).days / tenure_days
+            exercises_progress = []
+            for exercise, sets, reps, kg in workout["_exercises"]:
+                weight = round_weight(kg * progress) if kg else None
+                completed_sets = sets if rng.random() < 0.8 else sets - 1
+                exercises_progress.append({
+                    "exercise_name": exercise,
+                    "completed_sets": completed_sets,
+                    "completed_reps": [int(reps.split("-")[0]) for _ in range(completed_sets)],
+                    "weights_used": [f"{weight}kg" if weight else "bodyweight"] * completed_sets,
+                    "weights_kg": [weight] * completed_sets,
+                    "notes": None,
+                })
+            writer.add("workout_progress", {
+                "id": new_id(rng),
+                "gym_id": gym_id,
+                "member_id": member_id,
+                "assignment_id": assignments["workout"],
+                "workout_template_id": workout["id"],
+                "workout_name": workout["name"],
+                "scheduled_date": day,
+                "completed_at": check_out,
+                "duration_minutes": duration,
+                "exercises_progress": exercises_progress,
+                "overall_rating": rng.choices([3, 4, 5], [2, 5, 3])[0],
+                "notes": None,
+                "status": "completed",
+                "personal_records": [],
+                "template_version_id": None,
+                "updated_at": check_out,
+            })
+
+        if diet and rng.random() < 0.5:
+            meals_progress = []
+            total = 0
+            for meal_type, _, items in diet["_meals"]:
+                calories = int(sum(kcal for _, _, kcal in items) * rng.uniform(0.75, 1.25))
+                total += calories
+                meals_progress.append({
+                    "meal_type": meal_type,
+                    "items_consumed": [food for food, _, _ in items],
+                    "total_calories": calories,
+                    "notes": None,
+                })
+            writer.add("diet_progress", {
+                "id": new_id(rng),
+                "gym_id": gym_id,
+                "member_id": member_id,
+                "assignment_id": assignments["diet"],
+                "diet_template_id": diet["id"],
+                "diet_name": diet["name"],
+                "date": day,
+                "meals_progress": meals_progress,
+                "total_calories_consumed": total,
+                "water_intake_liters": round(rng.uniform(1.5, 4.0), 1),
+                "overall_rating": rng.choices([2, 3, 4, 5], [1, 3, 4, 2])[0],
+                "notes": None,
+                "status": "completed",
+                "template_version_id": None,
+                "updated_at": day + timedelta(hours=22),
+            })
+
+    if end_date <= end:
+        status = MembershipStatus.EXPIRED
+    elif rng.random() < 0.02:
+        status = MembershipStatus.SUSPENDED
+    else:
+        status = MembershipStatus.ACTIVE
+
+    writer.add("members", {
+        "id": member_id,
+        "gym_id": gym_id,
+        "name": name,
+        "email": email,
+        "password_hash": config["password_hash"],
+        "phone": phone,
+        "address": f"{rng.randrange(1, 999)} {rng.choice(LAST_NAMES)} Road",
+        "date_of_birth": f"{rng.randrange(1965, 2006)}-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}",
+        "emergency_contact": f"+91 9{rng.randrange(10 ** 8, 10 ** 9)}",
+        "plan_id": plan["id"],
+        "membership_status": status.value,
+        "start_date": periods[-1],
+        "end_date": end_date,
+        "created_at": joined_at,
+        "last_visit": last_visit,
+        "total_visits": len(days),
+        "auto_renewal": True,
+    })
+
+def generate_gym(task):
+    """Generate one gym with all of its members and history; returns documents written per collection"""
+    index, config = task
+    rng = random.Random(f"{config['seed']}:{index}")
+    writer = BatchWriter(worker_db, config["batch_size"])
+
+    gym_id = new_id(rng)
+    created_at = config["start"] - timedelta(days=rng.randrange(30, 365))
+    owner_name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+    owner_email = DEMO_OWNER_EMAIL if index == 0 else f"owner{index}@sample.gymble"
     gym = {
         "id": gym_id,
-        "name": "Sample Gym",
-        "address": "123 Fitness Street",
+        "name": f"{rng.choice(LAST_NAMES)} Fitness {index}",
+        "owner_id": new_id(rng),
+        "address": f"{rng.randrange(1, 999)} Fitness Street",
         "phone": "+91 9876543210",
-        "email": "sample@gym.com",
-        "created_at": datetime.utcnow(),
-        "is_active": True
+        "email": owner_email,
+        "description": None,
+        "qr_code_data": None,
+        "upi_id": f"gym{index}@upi",
+        "created_at": created_at,
+        "is_active": True,
+        "_owner_name": owner_name,
     }
-    db.gyms.insert_one(gym)
-    print(f"Created new gym with ID: {gym_id}")
-
-# Create a gym owner if none exists
-owner_email = "owner@gym.com"
-existing_owner = db.users.find_one({"email": owner_email})
-if existing_owner:
-    print(f"Using existing gym owner: {owner_email}")
-else:
-    owner = {
-        "id": str(uuid.uuid4()),
+    writer.add("gyms", without_private(gym))
+    writer.add("users", {
+        "id": gym["owner_id"],
         "email": owner_email,
-        "password_hash": hash_password("password123"),
-        "name": "Gym Owner",
+        "password_hash": config["password_hash"],
+        "name": owner_name,
         "phone": "+91 9876543210",
-        "role": UserRole.OWNER,
-        "gym_id": gym_id,
-        "created_at": datetime.utcnow()
-    }
-    db.users.insert_one(owner)
-    print(f"Created new gym owner: {owner_email}")
-
-# Create a plan if none exists
-plan_id = str(uuid.uuid4())
-existing_plan = db.plans.find_one({"gym_id": gym_id})
-if existing_plan:
-    plan_id = existing_plan["id"]
-    print(f"Using existing plan with ID: {plan_id}")
-else:
-    plan = {
-        "id": plan_id,
-        "gym_id": gym_id,
-        "name": "Basic Plan",
-        "description": "Basic membership with access to all equipment",
-        "price": 1500,
-        "duration_days": 30,
-        "plan_type": PlanType.BASIC,
-        "features": ["Access to gym equipment", "Locker access"],
-        "auto_renewal": True,
-        "created_at": datetime.utcnow(),
-        "is_active": True
-    }
-    db.plans.insert_one(plan)
-    print(f"Created new plan with ID: {plan_id}")
-
-# Create a member if none exists
-member_email = "member@example.com"
-existing_member = db.members.find_one({"email": member_email})
-if existing_member:
-    print(f"Using existing member: {member_email}")
-else:
-    # Create user account for member
-    password_hash = hash_password("password123")
-    user = {
-        "id": str(uuid.uuid4()),
-        "email": member_email,
-        "password_hash": password_hash,
-        "name": "John Member",
-        "phone": "+91 9876543211",
-        "role": UserRole.MEMBER,
+        "role": UserRole.OWNER.value,
         "gym_id": gym_id,
-        "created_at": datetime.utcnow()
-    }
-    db.users.insert_one(user)
-    
-    # Create member profile
-    member_id = str(uuid.uuid4())
-    start_date = datetime.utcnow()
-    end_date = start_date + timedelta(days=30)
-    
-    member = {
-        "id": member_id,
-        "gym_id": gym_id,
-        "name": "John Member",
-        "email": member_email,
-        "password_hash": password_hash,
-        "phone": "+91 9876543211",
-        "address": "456 Fitness Avenue",
-        "date_of_birth": "1990-01-01",
-        "emergency_contact": "+91 9876543212",
-        "plan_id": plan_id,
-        "membership_status": MembershipStatus.ACTIVE,
-        "start_date": start_date,
-        "end_date": end_date,
-        "created_at": datetime.utcnow(),
-        "total_visits": 0,
-        "auto_renewal": True
-    }
-    db.members.insert_one(member)
-    
-    # Create payment record
-    payment = {
-        "id": str(uuid.uuid4()),
-        "gym_id": gym_id,
-        "member_id": member_id,
-        "member_name": "John Member",
-        "amount": 1500,
-        "payment_method": PaymentMethod.CASH,
-        "plan_id": plan_id,
-        "plan_name": "Basic Plan",
-        "payment_date": datetime.utcnow(),
-        "payment_status": "completed"
+        "created_at": created_at,
+        "is_active": True,
+    })
+
+    plans = generate_plans(rng, gym_id, created_at)
+    workouts, diets = generate_templates(rng, gym_id, owner_name, created_at)
+    for plan in plans:
+        writer.add("plans", without_private(plan))
+    for template in workouts:
+        writer.add("workout_templates", without_private(template))
+    for template in diets:
+        writer.add("diet_templates", without_private(template))
+
+    # Log-normal gym sizes around --members-per-gym
+    mean = config["members_per_gym"]
+    member_count = max(1, int(rng.lognormvariate(math.log(mean) - 0.125, 0.5)))
+    for number in range(member_count):
+        email = DEMO_MEMBER_EMAIL if index == 0 and number == 0 else f"member{index}-{number}@sample.gymble"
+        generate_member(rng, writer, config, gym, plans, workouts, diets, email)
+
+    writer.flush()
+    return dict(writer.counts)
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate GYMBLE sample data at any scale")
+    parser.add_argument("--gyms", type=int, default=1)
+    parser.add_argument("--members-per-gym", type=int, default=25, help="Average members per gym (log-normal)")
+    parser.add_argument("--years", type=float, default=1.0, help="Years of attendance, payment and progress history")
+    parser.add_argument("--end-date", help="Last day of history (YYYY-MM-DD), defaults to today")
+    parser.add_argument("--progress-share", type=float, default=0.35, help="Share of members that log workouts")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--drop", action="store_true", help="Drop the sample collections first")
+    parser.add_argument("--dry-run", action="store_true", help="Generate and count documents without writing them")
+    args = parser.parse_args()
+
+    mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+    db_name = os.environ.get('DB_NAME', 'GYMBLE')
+    db = MongoClient(mongo_url)[db_name]
+
+    if args.drop and not args.dry_run:
+        for name in SAMPLE_COLLECTIONS + DERIVED_COLLECTIONS:
+            db[name].drop()
+        print(f"Dropped {', '.join(SAMPLE_COLLECTIONS + DERIVED_COLLECTIONS)}")
+    elif not args.dry_run and db.users.find_one({"email": DEMO_OWNER_EMAIL}):
+        print(f"{DEMO_OWNER_EMAIL} already exists; re-run with --drop to regenerate the sample data")
+        return
+
+    end = datetime.strptime(args.end_date, "%Y-%m-%d") if args.end_date else datetime.utcnow()
+    end = end.replace(hour=0, minute=0, second=0, microsecond=0)
+    config = {
+        "seed": args.seed,
+        "members_per_gym": args.members_per_gym,
+        "start": end - timedelta(days=int(args.years * 365)),
+        "end": end,
+        "progress_share": args.progress_share,
+        "batch_size": args.batch_size,
+        # One shared hash: bcrypt per member would dominate the run time
+        "password_hash": hash_password(SAMPLE_PASSWORD),
     }
-    db.payments.insert_one(payment)
-    
-    print(f"Created new member: {member_email}")
-
-print("\nSample data creation complete!")
-print("\nLogin credentials:")
-print(f"Gym Owner: {owner_email} / password123")
-print(f"Member: {member_email} / password123")
\ No newline at end of file
+
+    tasks = [(index, config) for index in range(args.gyms)]
+    worker_args = (None if args.dry_run else mongo_url, db_name)
+    totals = defaultdict(int)
+    started = time.perf_counter()
+
+    def report(done, counts):
+        for name, count in counts.items():
+            totals[name] += count
+        if done % max(1, args.gyms // 20) == 0 or done == args.gyms:
+            elapsed = time.perf_counter() - started
+            documents = sum(totals.values())
+            print(f"{done}/{args.gyms} gyms, {documents} documents, {documents / elapsed:.0f} docs/s")
+
+    if args.workers <= 1:
+        init_worker(*worker_args)
+        for done, task in enumerate(tasks, start=1):
+            report(done, generate_gym(task))
+    else:
+        with Pool(args.workers, initializer=init_worker, initargs=worker_args) as pool:
+            for done, counts in enumerate(pool.imap_unordered(generate_gym, tasks), start=1):
+                report(done, counts)
+
+    print("\nSample data creation complete!")
+    for name in SAMPLE_COLLECTIONS:
+        print(f"  {name}: {totals[name]}")
+    print("\nLogin credentials:")
+    print(f"Gym Owner: {DEMO_OWNER_EMAIL} / {SAMPLE_PASSWORD}")
+    print(f"Member: {DEMO_MEMBER_EMAIL} / {SAMPLE_PASSWORD}")
+    print("Other owners and members: owner<gym>@sample.gymble, member<gym>-<n>@sample.gymble, same password")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Summarise `python -X importtime -c "import server"` and check it against a startup budget.
+
+    python import_profile.py                      # top packages by import time
+    python import_profile.py --budget-ms 1500     # exit 1 when `import server` is slower
+    python import_profile.py --json profile.json  # full report for CI artifacts
+
+Each run imports server.py in a fresh interpreter, so nothing is cached in sys.modules;
+the fastest of --runs runs is reported to keep noise from other processes out. Times
+come from -X importtime, which adds some overhead of its own, so budgets set with this
+tool are only comparable with numbers from this tool.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent
+
+# Modules server.py only needs on specific routes; none of them may load at import time
+LAZY_MODULES = ("numpy", "qrcode", "PIL", "bcrypt", "pandas", "boto3")
+
+def parse_importtime(stderr):
+    """(module, self_us, cumulative_us, depth) for every line -X importtime printed"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return entries
+
+def import_once(module):
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+def profile_imports(module="server", runs=3, top=15):
+    """Import `module` `runs` times in fresh interpreters and summarise the fastest run"""
+    best = None
+    for _ in range(runs):
+        entries = import_once(module)
+        total_us = next(cumulative for name, _, cumulative, _ in reversed(entries) if name == module)
+        if best is None or total_us < best[0]:
+            best = (total_us, entries)
+    total_us, entries = best
+
+    packages = defaultdict(int)
+    for name, self_us, _, _ in entries:
+        packages[name.split(".")[0]] += self_us
+    # Direct imports of the profiled module, with everything they pulled in
+    direct = [(name, cumulative) for name, _, cumulative, depth in entries if depth == 1]
+
+    return {
+        "module": module,
+        "runs": runs,
+        "import_ms": total_us / 1000,
+        "module_self_ms": next(self_us for name, self_us, _, _ in reversed(entries) if name == module) / 1000,
+        "modules_imported": len(entries),
+        "top_packages": [
+            {"package": package, "self_ms": self_us / 1000}
+            for package, self_us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+        ],
+        "top_direct_imports": [
+            {"module": name, "cumulative_ms": cumulative / 1000}
+            for name, cumulative in sorted(direct, key=lambda item: item[1], reverse=True)[:top]
+        ],
+        "lazy_modules_loaded": sorted({name.split(".")[0] for name, _, _, _ in entries} & set(LAZY_MODULES)),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile the import time of the GYMBLE API")
+    parser.add_argument("--module", default="server")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=None,
+                        help="Fail when the import takes longer (default: IMPORT_TIME_BUDGET_MS, if set)")
+    parser.add_argument("--json", dest="json_path", help="Also write the report to this file")
+    args = parser.parse_args()
+    budget_ms = args.budget_ms or (float(os.environ["IMPORT_TIME_BUDGET_MS"]) if os.environ.get("IMPORT_TIME_BUDGET_MS") else None)
+
+    report = profile_imports(args.module, args.runs, args.top)
+    report["budget_ms"] = budget_ms
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+    print(f"import {report['module']}: {report['import_ms']:.1f}ms (best of {report['runs']}), "
+          f"{report['modules_imported']} modules, {report['module_self_ms']:.1f}ms in the module body")
+    print("\nSlowest direct imports (cumulative):")
+    for entry in report["top_direct_imports"]:
+        print(f"  {entry['module']:40} {entry['cumulative_ms']:8.1f}ms")
+    print("\nSlowest packages (self time, summed):")
+    for entry in report["top_packages"]:
+        print(f"  {entry['package']:40} {entry['self_ms']:8.1f}ms")
+
+    failed = False
+    if report["lazy_modules_loaded"]:
+        print(f"\nLoaded at import time but expected lazily: {', '.join(report['lazy_modules_loaded'])}")
+        failed = True
+    if budget_ms is not None:
+        within = report["import_ms"] <= budget_ms
+        print(f"\nBudget {budget_ms:.0f}ms: {'ok' if within else 'EXCEEDED'}")
+        failed = failed or not within
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,392 @@
+"""Asyncio load generator for a locally running GYMBLE API.
+
+Start the server (uvicorn server:app --port 8001) against a throwaway database, then:
+
+    python load_test.py --gyms 20 --members-per-gym 50 --duration 120 --output load_report.json
+
+Each run registers its own owners, gyms, plans and members (emails are tagged with a
+run id, so runs never collide) and then drives two phases:
+
+- morning_burst: every member of every gym checks in through POST /attendance within
+  --burst-seconds, while owners keep the dashboard open.
+- steady: --concurrency virtual users pick scenarios by weight: member app launches,
+  dashboard refreshes, owner searches and the odd check-out/check-in, pausing for a
+  random think time (mean --think-time seconds) between them.
+
+The report contains p50/p95/p99 latency, error rate and throughput per route and phase,
+plus how many of the requested users setup actually produced. The run aborts when more
+than --max-setup-failures of them could not be created or logged in.
+
+Start the server with RATE_LIMIT_ENABLED=false. A handful of owners polling from one
+address exhausts the per-owner dashboard and per-user scan limits within seconds, and
+setup logs every member in through the per-IP auth limit; with the limiter on, the run
+measures the limiter rather than the API. 429 responses are reported as rate_limited,
+separately from errors, so a run against a limited server shows how much was refused.
+RATE_LIMIT_EXEMPT_IPS=127.0.0.1 only lifts the per-IP auth limit. Access tokens are
+refreshed before they expire, so runs may last longer than ACCESS_TOKEN_EXPIRE_MINUTES.
+"""
+import argparse
+import asyncio
+import json
+import random
+import string
+import time
+import uuid
+from collections import Counter, defaultdict
+
+import httpx
+
+MEMBER_PASSWORD = "loadtest123"
+
+# Refresh access tokens this long before the server says they expire
+TOKEN_REFRESH_MARGIN_SECONDS = 60
+
+# Scenario -> relative weight in the steady phase
+STEADY_MIX = {
+    "member_app_launch": 50,
+    "dashboard_refresh": 25,
+    "owner_search": 15,
+    "scan": 10,
+}
+
+class RouteStats:
+    """Latencies and status codes per route template, for one phase"""
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.status_codes = defaultdict(lambda: defaultdict(int))
+        self.errors = defaultdict(int)
+        self.rate_limited = defaultdict(int)
+        self.started = time.perf_counter()
+        self.elapsed = None
+
+    def record(self, route, elapsed, status_code):
+        self.latencies[route].append(elapsed)
+        self.status_codes[route][str(status_code)] += 1
+        if status_code == 429:
+            self.rate_limited[route] += 1
+        elif status_code == "error" or status_code >= 400:
+            self.errors[route] += 1
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+
+    def summary(self):
+        routes = {}
+        for route, latencies in sorted(self.latencies.items()):
+            ordered = sorted(latencies)
+            count = len(ordered)
+            routes[route] = {
+                "count": count,
+                "errors": self.errors[route],
+                "error_rate": self.errors[route] / count,
+                "rate_limited": self.rate_limited[route],
+                "throughput_rps": count / self.elapsed if self.elapsed else None,
+                "mean_ms": sum(ordered) / count * 1000,
+                "p50_ms": percentile(ordered, 50) * 1000,
+                "p95_ms": percentile(ordered, 95) * 1000,
+                "p99_ms": percentile(ordered, 99) * 1000,
+                "max_ms": ordered[-1] * 1000,
+                "status_codes": dict(self.status_codes[route]),
+            }
+        total = sum(len(latencies) for latencies in self.latencies.values())
+        return {
+            "elapsed_seconds": self.elapsed,
+            "requests": total,
+            "errors": sum(self.errors.values()),
+            "rate_limited": sum(self.rate_limited.values()),
+            "throughput_rps": total / self.elapsed if self.elapsed else None,
+            "routes": routes,
+        }
+
+def percentile(ordered, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return 0.0
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+class Credentials:
+    """One virtual user's token pair; renewed through /auth/refresh shortly before expiry"""
+    def __init__(self, tokens):
+        self.lock = asyncio.Lock()  # refresh tokens are single use, so only one refresh at a time
+        self.update(tokens)
+
+    def update(self, tokens):
+        self.access_token = tokens["access_token"]
+        self.refresh_token = tokens.get("refresh_token")
+        expires_in = tokens.get("expires_in")
+        self.refresh_at = time.monotonic() + expires_in - TOKEN_REFRESH_MARGIN_SECONDS if expires_in else None
+
+class LoadClient:
+    """httpx client that times every call and files it under its route template"""
+    def __init__(self, base_url, max_connections):
+        self.http = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=30.0,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        )
+        self.stats = None
+
+    async def access_token(self, auth):
+        """The user's access token, refreshed first when it is about to expire"""
+        if auth.refresh_token and auth.refresh_at is not None and time.monotonic() >= auth.refresh_at:
+            async with auth.lock:
+                if time.monotonic() >= auth.refresh_at:
+                    tokens = json_or_none(await self.call("POST", "/auth/refresh", json={"refresh_token": auth.refresh_token}))
+                    if tokens:
+                        auth.update(tokens)
+        return auth.access_token
+
+    async def call(self, method, route, auth=None, path=None, **kwargs):
+        headers = {"Authorization": f"Bearer {await self.access_token(auth)}"} if auth else {}
+        start = time.perf_counter()
+        try:
+            response = await self.http.request(method, path or route, headers=headers, **kwargs)
+            status_code = response.status_code
+        except httpx.HTTPError:
+            response, status_code = None, "error"
+        if self.stats is not None:
+            self.stats.record(f"{method} {route}", time.perf_counter() - start, status_code)
+        return response
+
+    async def close(self):
+        await self.http.aclose()
+
+def json_or_none(response):
+    if response is None or response.status_code >= 400:
+        return None
+    return response.json()
+
+def setup_failure(failures, step, response):
+    """Count a failed setup call by step and status code"""
+    failures[f"{step} {response.status_code if response is not None else 'error'}"] += 1
+
+async def setup_gym(client, run_id, index, members_per_gym, semaphore, failures):
+    """Owner account, gym, plan and members; returns the credentials the scenarios need"""
+    async with semaphore:
+        owner_email = f"owner-{run_id}-{index}@loadtest.gymble"
+        response = await client.call("POST", "/auth/register", json={
+            "email": owner_email,
+            "password": MEMBER_PASSWORD,
+            "name": f"Load Owner {index}",
+            "phone": "+919876543210",
+            "role": "owner",
+        })
+        tokens = json_or_none(response)
+        if not tokens:
+            setup_failure(failures, "register_owner", response)
+            return None
+        owner = Credentials(tokens)
+
+        gym = json_or_none(await client.call("POST", "/gyms", auth=owner, json={
+            "name": f"Load Gym {run_id}-{index}",
+            "address": f"{index} Load Street",
+            "phone": "+919876543210",
+            "email": owner_email,
+        }))
+        plan = json_or_none(await client.call("POST", "/plans", auth=owner, json={
+            "name": "Monthly",
+            "description": "Load test plan",
+            "price": 1500.0,
+            "duration_days": 30,
+            "plan_type": "basic",
+        }))
+        if not gym or not plan:
+            failures["create_gym"] += 1
+            return None
+
+    members = []
+    for member_index in range(members_per_gym):
+        async with semaphore:
+            email = f"member-{run_id}-{index}-{member_index}@loadtest.gymble"
+            name = f"Member {random.choice(string.ascii_uppercase)}{member_index}"
+            response = await client.call("POST", "/members", auth=owner, json={
+                "name": name,
+                "email": email,
+                "password": MEMBER_PASSWORD,
+                "phone": "+919876543210",
+                "plan_id": plan["id"],
+                "payment_method": "cash",
+                "payment_amount": 1500.0,
+            })
+            member = json_or_none(response)
+            if not member:
+                setup_failure(failures, "create_member", response)
+                continue
+            response = await client.call("POST", "/auth/login", json={
+                "email": email,
+                "password": MEMBER_PASSWORD,
+            })
+            login = json_or_none(response)
+            if not login:
+                setup_failure(failures, "login_member", response)
+                continue
+            members.append({"id": member["id"], "name": name, "auth": Credentials(login)})
+
+    return {"index": index, "owner": owner, "members": members, "qr_code": None, "qr_fetched": 0.0}
+
+async def current_qr_code(client, gym):
+    """The gym's front-desk screen refreshes its QR code at most every 30 seconds"""
+    if gym["qr_code"] is None or time.monotonic() - gym["qr_fetched"] > 30:
+        qr = json_or_none(await client.call("GET", "/attendance/qr-code", auth=gym["owner"]))
+        if qr:
+            gym["qr_code"], gym["qr_fetched"] = qr["qr_code_data"], time.monotonic()
+    return gym["qr_code"]
+
+async def scan(client, gym, member, action="check-in"):
+    qr_code = await current_qr_code(client, gym)
+    if qr_code:
+        await client.call("POST", "/attendance", auth=member["auth"], json={
+            "qr_code": qr_code,
+            "member_id": member["id"],
+            "action": action,
+        })
+
+async def member_app_launch(client, gym, member):
+    # The member app fires these together on launch
+    await asyncio.gather(
+        client.call("GET", "/members/me", auth=member["auth"]),
+        client.call("GET", "/attendance/my-status", auth=member["auth"]),
+        client.call("GET", "/announcements/me", auth=member["auth"]),
+        client.call("GET", "/plan-assignments/my", auth=member["auth"]),
+        client.call("GET", "/payments/me", auth=member["auth"]),
+    )
+
+async def dashboard_refresh(client, gym):
+    await asyncio.gather(
+        client.call("GET", "/dashboard/stats", auth=gym["owner"]),
+        client.call("GET", "/attendance/live-updates", auth=gym["owner"]),
+    )
+
+async def owner_search(client, gym):
+    query = random.choice(gym["members"])["name"][:8] if gym["members"] else "Member"
+    await client.call("GET", "/members/search/{query}", auth=gym["owner"], path=f"/members/search/{query}")
+
+async def morning_burst(client, gyms, burst_seconds, dashboard_interval):
+    """Every member checks in at a random moment of the burst window; owners poll the dashboard"""
+    deadline = time.monotonic() + burst_seconds
+
+    async def delayed_scan(gym, member):
+        await asyncio.sleep(random.uniform(0, burst_seconds))
+        await scan(client, gym, member)
+
+    async def dashboard_poller(gym):
+        while time.monotonic() < deadline:
+            await dashboard_refresh(client, gym)
+            await asyncio.sleep(dashboard_interval)
+
+    await asyncio.gather(
+        *(delayed_scan(gym, member) for gym in gyms for member in gym["members"]),
+        *(dashboard_poller(gym) for gym in gyms),
+    )
+
+async def steady(client, gyms, duration, concurrency, think_time):
+    """Closed-loop virtual users drawing scenarios from STEADY_MIX, with think time between them"""
+    deadline = time.monotonic() + duration
+    scenarios, weights = zip(*STEADY_MIX.items())
+    gyms = [gym for gym in gyms if gym["members"]]
+    if not gyms:
+        raise RuntimeError("No gym has members to drive the steady phase")
+
+    async def virtual_user():
+        while time.monotonic() < deadline:
+            gym = random.choice(gyms)
+            scenario = random.choices(scenarios, weights)[0]
+            if scenario == "member_app_launch":
+                await member_app_launch(client, gym, random.choice(gym["members"]))
+            elif scenario == "dashboard_refresh":
+                await dashboard_refresh(client, gym)
+            elif scenario == "owner_search":
+                await owner_search(client, gym)
+            else:
+                await scan(client, gym, random.choice(gym["members"]), random.choice(["check-out", "check-in"]))
+            if think_time > 0:
+                await asyncio.sleep(min(random.expovariate(1 / think_time), deadline - time.monotonic()))
+
+    await asyncio.gather(*(virtual_user() for _ in range(concurrency)))
+
+async def run(args):
+    random.seed(args.seed)
+    run_id = uuid.uuid4().hex[:8]
+    client = LoadClient(args.base_url, max_connections=args.concurrency * 5)
+    report = {
+        "run_id": run_id,
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "phases": {},
+    }
+
+    try:
+        print(f"Setting up {args.gyms} gyms x {args.members_per_gym} members (run {run_id})...")
+        semaphore = asyncio.Semaphore(args.setup_concurrency)
+        failures = Counter()
+        client.stats = RouteStats()
+        gyms = await asyncio.gather(*(
+            setup_gym(client, run_id, index, args.members_per_gym, semaphore, failures) for index in range(args.gyms)
+        ))
+        client.stats.finish()
+        report["phases"]["setup"] = client.stats.summary()
+
+        gyms = [gym for gym in gyms if gym]
+        requested = args.gyms * args.members_per_gym
+        ready = sum(len(gym["members"]) for gym in gyms)
+        report["setup"] = {
+            "requested_gyms": args.gyms,
+            "ready_gyms": len(gyms),
+            "requested_members": requested,
+            "ready_members": ready,
+            "failures": dict(failures),
+        }
+        print(f"Setup: {len(gyms)}/{args.gyms} gyms, {ready}/{requested} members ready")
+        for failure, count in sorted(failures.items()):
+            print(f"  failed {failure}: {count}")
+        if requested and 1 - ready / requested > args.max_setup_failures:
+            raise SystemExit(f"Aborting: {requested - ready} of {requested} members failed setup "
+                             f"(limit {args.max_setup_failures:.0%}); see the failures above")
+
+        print(f"Morning scan burst over {args.burst_seconds}s...")
+        client.stats = RouteStats()
+        await morning_burst(client, gyms, args.burst_seconds, args.dashboard_interval)
+        client.stats.finish()
+        report["phases"]["morning_burst"] = client.stats.summary()
+
+        print(f"Steady mix with {args.concurrency} virtual users for {args.duration}s...")
+        client.stats = RouteStats()
+        await steady(client, gyms, args.duration, args.concurrency, args.think_time)
+        client.stats.finish()
+        report["phases"]["steady"] = client.stats.summary()
+    finally:
+        await client.close()
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for phase, summary in report["phases"].items():
+        print(f"\n{phase}: {summary['requests']} requests, {summary['errors']} errors, "
+              f"{summary['rate_limited']} rate limited, {summary['throughput_rps']:.1f} req/s")
+        for route, stats in summary["routes"].items():
+            print(f"  {route:40} n={stats['count']:6} p50={stats['p50_ms']:7.1f}ms p95={stats['p95_ms']:7.1f}ms "
+                  f"p99={stats['p99_ms']:7.1f}ms err={stats['error_rate']:.1%} 429={stats['rate_limited']}")
+    if any(summary["rate_limited"] for summary in report["phases"].values()):
+        print("\nThe server rate limited this run; restart it with RATE_LIMIT_ENABLED=false to measure throughput")
+    print(f"\nReport written to {args.output}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive a realistic request mix against a local GYMBLE API")
+    parser.add_argument("--base-url", default="http://localhost:8001/api")
+    parser.add_argument("--gyms", type=int, default=5)
+    parser.add_argument("--members-per-gym", type=int, default=20)
+    parser.add_argument("--burst-seconds", type=float, default=30, help="Window in which every member checks in")
+    parser.add_argument("--dashboard-interval", type=float, default=5, help="Seconds between dashboard polls during the burst")
+    parser.add_argument("--duration", type=float, default=60, help="Length of the steady phase in seconds")
+    parser.add_argument("--concurrency", type=int, default=50, help="Virtual users in the steady phase")
+    parser.add_argument("--think-time", type=float, default=1.0,
+                        help="Mean seconds a steady-phase virtual user pauses between scenarios (0 for none)")
+    parser.add_argument("--setup-concurrency", type=int, default=10)
+    parser.add_argument("--max-setup-failures", type=float, default=0.05,
+                        help="Abort when this share of the requested members could not be set up")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="load_report.json")
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Copy workout/diet progress logs into per-member monthly buckets.
+
+Run this before starting the API with PROGRESS_STORAGE_MODE=buckets:
+
+    python migrate_progress_storage.py --kind all --batch-size 5000
+
+The migration is safe to re-run: entries are added with $addToSet, so a log that
+was already copied into its bucket is not duplicated. The source collections are
+left untouched and can be dropped once the buckets have been verified.
+"""
+import argparse
+import os
+from collections import defaultdict
+from pathlib import Path
+
+from dotenv import load_dotenv
+from pymongo import MongoClient, UpdateOne
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# Source collection -> date field used to pick the month bucket
+PROGRESS_COLLECTIONS = {
+    "workout": ("workout_progress", "scheduled_date"),
+    "diet": ("diet_progress", "date"),
+}
+
+def flush(buckets, batch, date_field):
+    # Delta sync finds buckets by updated_at, so it must cover the newest copied entry
+    operations = [
+        UpdateOne(
+            {"gym_id": gym_id, "member_id": member_id, "month": month},
+            {
+                "$addToSet": {"entries": {"$each": entries}},
+                "$max": {"updated_at": max(entry.get("updated_at") or entry[date_field] for entry in entries)}
+            },
+            upsert=True
+        )
+        for (gym_id, member_id, month), entries in batch.items()
+    ]
+    if operations:
+        buckets.bulk_write(operations, ordered=False)
+    batch.clear()
+
+def migrate(db, kind, batch_size, dry_run=False):
+    name, date_field = PROGRESS_COLLECTIONS[kind]
+    source = db[name]
+    buckets = db[f"{name}_buckets"]
+    if not dry_run:
+        buckets.create_index([("gym_id", 1), ("member_id", 1), ("month", -1)], unique=True)
+
+    batch = defaultdict(list)
+    copied = 0
+    cursor = source.find({}, {"_id": 0}).sort([("member_id", 1), (date_field, 1)]).batch_size(batch_size)
+    for record in cursor:
+        month = record[date_field].strftime("%Y-%m")
+        batch[(record["gym_id"], record["member_id"], month)].append(record)
+        copied += 1
+        if copied % batch_size == 0:
+            if not dry_run:
+                flush(buckets, batch, date_field)
+            else:
+                batch.clear()
+            print(f"{name}: {copied} logs processed")
+
+    if not dry_run:
+        flush(buckets, batch, date_field)
+    print(f"{name}: {copied} logs {'would be' if dry_run else 'were'} copied into {buckets.name}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate progress logs into monthly bucket documents")
+    parser.add_argument("--kind", choices=["workout", "diet", "all"], default="all")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true", help="Only count the logs that would be copied")
+    args = parser.parse_args()
+
+    client = MongoClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+    db = client[os.environ.get('DB_NAME', 'GYMBLE')]
+
+    kinds = list(PROGRESS_COLLECTIONS) if args.kind == "all" else [args.kind]
+    for kind in kinds:
+        migrate(db, kind, args.batch_size, args.dry_run)
+
+    print("\nProgress migration complete! Set PROGRESS_STORAGE_MODE=buckets to serve reads from the buckets.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Production entry point: runs the API in several uvicorn worker processes.
+
+    python serve.py --workers 4 --port 8001
+
+Every worker imports server.py on its own and opens its own MongoDB connection pool
+at startup (see connect_to_mongo), so nothing is shared across the fork. On SIGTERM
+or SIGINT each worker stops accepting connections, gives in-flight requests up to
+--graceful-timeout seconds to finish, then closes its pool.
+
+Settings default to environment variables so container platforms can set them:
+WEB_CONCURRENCY (workers), HOST, PORT, GRACEFUL_TIMEOUT, KEEP_ALIVE, FORWARDED_ALLOW_IPS.
+The pool itself is tuned with the MONGO_* variables listed in .env.example.
+"""
+import argparse
+import logging
+import os
+
+import uvicorn
+
+logger = logging.getLogger("gymble.serve")
+
+def default_workers():
+    return int(os.environ.get("WEB_CONCURRENCY") or os.cpu_count() or 1)
+
+def warn_about_per_process_state(workers):
+    """State that lives in one worker's memory is not seen by the others"""
+    if workers < 2:
+        return
+    if os.environ.get("RATE_LIMIT_BACKEND", "memory").lower() != "mongo":
+        logger.warning("RATE_LIMIT_BACKEND=memory: each of the %d workers enforces its own buckets; "
+                       "set RATE_LIMIT_BACKEND=mongo to share them", workers)
+    logger.warning("The announcement stream broker is in-process: /announcements/stream clients only "
+                   "receive announcements created through the same worker until a shared broker is "
+                   "configured; /announcements/feed is unaffected")
+    logger.warning("Failed-login throttling is in-process: each of the %d workers gives an email or IP its "
+                   "own LOGIN_FREE_FAILURES_PER_EMAIL/_PER_IP and backoff, so guesses spread over the "
+                   "workers get up to %d times as many before the throttle applies", workers, workers)
+    logger.warning("The analytics cache is in-process: new members and payments only invalidate it in "
+                   "the worker that handled them, so other workers may serve figures up to "
+                   "ANALYTICS_CACHE_SECONDS old")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the GYMBLE API with multiple worker processes")
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8001")))
+    parser.add_argument("--workers", type=int, default=default_workers(),
+                        help="Worker processes (default: WEB_CONCURRENCY or the number of CPUs)")
+    parser.add_argument("--graceful-timeout", type=int, default=int(os.environ.get("GRACEFUL_TIMEOUT", "30")),
+                        help="Seconds in-flight requests get to finish on shutdown; open event streams are cut after this")
+    parser.add_argument("--keep-alive", type=int, default=int(os.environ.get("KEEP_ALIVE", "5")),
+                        help="Seconds an idle keep-alive connection is held open")
+    parser.add_argument("--forwarded-allow-ips", default=os.environ.get("FORWARDED_ALLOW_IPS"),
+                        help="Proxy addresses trusted for X-Forwarded-For, so per-IP limits see client addresses")
+    parser.add_argument("--log-level", default=os.environ.get("LOG_LEVEL", "info"))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    max_pool_size = int(os.environ.get("MONGO_MAX_POOL_SIZE", "50"))
+    logger.info("Starting %d workers on %s:%d (up to %d MongoDB connections in total)",
+                args.workers, args.host, args.port, args.workers * max_pool_size)
+    warn_about_per_process_state(args.workers)
+
+    uvicorn.run(
+        "server:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        lifespan="on",
+        timeout_graceful_shutdown=args.graceful_timeout,
+        timeout_keep_alive=args.keep_alive,
+        proxy_headers=args.forwarded_allow_ips is not None,
+        forwarded_allow_ips=args.forwarded_allow_ips,
+        log_level=args.log_level,
+    )
+
+if __name__ == "__main__":
+    main()
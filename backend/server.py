@@ -1,4 +1,5 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Request
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Request, Header
+from fastapi.encoders import jsonable_encoder
 
 
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
@@ -41,6 +42,8 @@ app.add_api_route("/", get_health, methods=["GET"])  # root route
 
 
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import DuplicateKeyError, BulkWriteError
+from pydantic import ValidationError
 import os
 
 
@@ -49,27 +52,599 @@ from pathlib import Path
 from pydantic import BaseModel, Field, EmailStr, validator
 from typing import List, Optional
 import uuid
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from enum import Enum
 import jwt
-import bcrypt
-from fastapi.responses import JSONResponse, HTMLResponse
-import qrcode
+from fastapi.responses import JSONResponse, HTMLResponse, StreamingResponse, Response
 import io
+import csv
+import json
 import base64
 import hashlib
+import hmac
 import time
+import asyncio
 from datetime import timedelta
-import calendar
+import math
 import re
+from collections import defaultdict
+from pymongo import UpdateOne, ReturnDocument
+from pymongo import monitoring
+import bisect
+import contextvars
+import threading
+import gzip
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; clients then get gzip
+    brotli = None
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Request metrics
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROUND_TRIP_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50)
+RESPONSE_SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+    
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            self.counts[index] += 1
+
+class MetricsRegistry:
+    """Minimal in-process Prometheus registry: counters, gauges and histograms with labels"""
+    def __init__(self):
+        self.descriptions: dict = {}  # name -> (type, help)
+        self.values: dict = defaultdict(float)  # (name, labels) -> counter/gauge value
+        self.histograms: dict = {}  # (name, labels) -> Histogram
+    
+    def describe(self, name: str, metric_type: str, help_text: str):
+        self.descriptions[name] = (metric_type, help_text)
+    
+    def inc(self, name: str, value: float = 1, **labels):
+        self.values[(name, tuple(sorted(labels.items())))] += value
+    
+    def set(self, name: str, value: float, **labels):
+        self.values[(name, tuple(sorted(labels.items())))] = value
+    
+    def observe(self, name: str, value: float, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+    
+    @staticmethod
+    def format_labels(labels, extra=()) -> str:
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ""
+        escaped = []
+        for key, value in pairs:
+            value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            escaped.append(f'{key}="{value}"')
+        return "{" + ",".join(escaped) + "}"
+    
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        series = defaultdict(list)
+        for (name, labels), value in sorted(self.values.items()):
+            series[name].append(f"{name}{self.format_labels(labels)} {value:g}")
+        for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                series[name].append(f"{name}_bucket{self.format_labels(labels, [('le', f'{bound:g}')])} {cumulative}")
+            series[name].append(f"{name}_bucket{self.format_labels(labels, [('le', '+Inf')])} {histogram.count}")
+            series[name].append(f"{name}_sum{self.format_labels(labels)} {histogram.sum:g}")
+            series[name].append(f"{name}_count{self.format_labels(labels)} {histogram.count}")
+        
+        lines = []
+        for name in sorted(series):
+            if name in self.descriptions:
+                metric_type, help_text = self.descriptions[name]
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+            lines.extend(series[name])
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+metrics.describe("gymble_http_request_duration_seconds", "histogram", "HTTP request latency by route")
+metrics.describe("gymble_http_responses_total", "counter", "HTTP responses by route and status code")
+metrics.describe("gymble_http_requests_in_flight", "gauge", "HTTP requests currently being served")
+metrics.describe("gymble_mongo_round_trips_per_request", "histogram", "MongoDB commands issued per HTTP request by route")
+metrics.describe("gymble_mongo_seconds_total", "counter", "Time spent in MongoDB commands by route")
+metrics.describe("gymble_http_response_size_bytes", "histogram", "Response body bytes sent by route, after compression")
+metrics.describe("gymble_http_response_bytes_total", "counter", "Response body bytes sent by route and content encoding")
+metrics.describe("gymble_mongo_commands_total", "counter", "MongoDB commands by collection and operation")
+metrics.describe("gymble_mongo_slow_commands_total", "counter", "MongoDB commands over SLOW_QUERY_MS by collection and operation")
+metrics.describe("gymble_mongo_command_seconds_total", "counter", "Time spent in MongoDB commands by collection and operation")
+metrics.describe("gymble_rate_limit_rejections_total", "counter", "Requests rejected with 429 by route group and bucket key type")
+metrics.describe("gymble_login_failures_total", "counter", "Failed login attempts")
+metrics.describe("gymble_login_throttled_total", "counter", "Login attempts rejected by backoff before the password check, by key type")
+
+class RequestStats:
+    """Per-request MongoDB usage, filled in by the command listener"""
+    __slots__ = ("round_trips", "mongo_seconds")
+    
+    def __init__(self):
+        self.round_trips = 0
+        self.mongo_seconds = 0.0
+
+# Motor copies the caller's context into its executor threads, so the listener sees this
+current_request_stats: contextvars.ContextVar = contextvars.ContextVar("current_request_stats", default=None)
+
+class RequestMongoListener(monitoring.CommandListener):
+    """Attributes every MongoDB command to the HTTP request that issued it"""
+    def record(self, event):
+        stats = current_request_stats.get()
+        if stats is not None:
+            stats.round_trips += 1
+            stats.mongo_seconds += event.duration_micros / 1_000_000
+    
+    def started(self, event):
+        pass
+    
+    def succeeded(self, event):
+        self.record(event)
+    
+    def failed(self, event):
+        self.record(event)
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status codes, in-flight requests and Mongo usage per route"""
+    def __init__(self, app):
+        self.app = app
+        self.in_flight = 0
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        
+        stats = RequestStats()
+        token = current_request_stats.set(stats)
+        status_code = 500
+        encoding = "identity"
+        body_bytes = 0
+        
+        async def send_wrapper(message):
+            nonlocal status_code, encoding, body_bytes
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                encoding = Headers(raw=message["headers"]).get("content-encoding", "identity")
+            elif message["type"] == "http.response.body":
+                body_bytes += len(message.get("body", b""))
+            await send(message)
+        
+        self.in_flight += 1
+        metrics.set("gymble_http_requests_in_flight", self.in_flight)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.in_flight -= 1
+            metrics.set("gymble_http_requests_in_flight", self.in_flight)
+            current_request_stats.reset(token)
+            
+            # Label by route template, never by raw path, to keep cardinality bounded
+            route = scope.get("route")
+            labels = {"method": scope["method"], "route": route.path if route else "unmatched"}
+            metrics.observe("gymble_http_request_duration_seconds", elapsed, **labels)
+            metrics.inc("gymble_http_responses_total", status=str(status_code), **labels)
+            metrics.observe("gymble_mongo_round_trips_per_request", stats.round_trips, buckets=ROUND_TRIP_BUCKETS, **labels)
+            metrics.inc("gymble_mongo_seconds_total", stats.mongo_seconds, **labels)
+            metrics.observe("gymble_http_response_size_bytes", body_bytes, buckets=RESPONSE_SIZE_BUCKETS, **labels)
+            metrics.inc("gymble_http_response_bytes_total", body_bytes, encoding=encoding, **labels)
+
+# Response compression: bodies under COMPRESSION_MIN_BYTES are not worth the CPU or the header
+COMPRESSION_ENABLED = os.environ.get('COMPRESSION_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', '1024'))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4  # brotli's fast end still beats gzip -6 on JSON
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml")
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick br or gzip from an Accept-Encoding header, honouring q-values; None means identity"""
+    weights = {}
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[coding.strip()] = weight
+    
+    candidates = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best, best_weight = None, 0.0
+    for coding in candidates:
+        weight = weights.get(coding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+class CompressionMiddleware:
+    """ASGI middleware compressing complete JSON/text responses with br or gzip.
+    
+    Streaming responses (the announcement event stream, CSV exports) pass through untouched,
+    so events are never held back in a compressor buffer.
+    """
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        start_message = None
+        
+        async def send_wrapper(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message  # held until we know the body
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                return await send(message)
+            
+            headers = MutableHeaders(raw=start_message["headers"])
+            initial, start_message = start_message, None
+            body = message.get("body", b"")
+            compressible = (
+                "content-encoding" not in headers
+                and headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+            )
+            if not compressible or message.get("more_body", False):
+                await send(initial)
+                return await send(message)
+            
+            headers.add_vary_header("Accept-Encoding")
+            if encoding and len(body) >= self.minimum_size:
+                body = compress_body(body, encoding)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+                message = {**message, "body": body}
+            await send(initial)
+            await send(message)
+        
+        await self.app(scope, receive, send_wrapper)
+
+# Registered first so it sits inside MetricsMiddleware, which then counts bytes on the wire
+if COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus scrape endpoint"""
+    for name, value in announcement_broker.metrics().items():
+        if isinstance(value, (int, float)):
+            metric_name = f"gymble_announcement_stream_{name}"
+            if metric_name not in metrics.descriptions:
+                metrics.describe(metric_name, "gauge", f"Announcement stream {name.replace('_', ' ')}")
+            metrics.set(metric_name, value)
+    for operation in query_monitor.report()["operations"]:
+        labels = {"collection": operation["collection"] or "", "operation": operation["operation"]}
+        metrics.set("gymble_mongo_commands_total", operation["count"], **labels)
+        metrics.set("gymble_mongo_slow_commands_total", operation["slow"], **labels)
+        metrics.set("gymble_mongo_command_seconds_total", operation["total_ms"] / 1000, **labels)
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
+# Query monitoring: commands slower than this are logged and grouped by filter shape
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '100'))
+SLOW_QUERY_MAX_SHAPES = int(os.environ.get('SLOW_QUERY_MAX_SHAPES', '500'))
+# /query-stats covers every tenant and shows literal filter values, so like /metrics it is an
+# operator endpoint that must not be reachable from the internet; it is off unless enabled
+QUERY_STATS_ENABLED = os.environ.get('QUERY_STATS_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+
+# Command name -> where its filter lives in the command document
+MONITORED_COMMANDS = {
+    "find": "filter",
+    "aggregate": "pipeline",
+    "count": "query",
+    "distinct": "query",
+    "findAndModify": "query",
+    "update": "updates",
+    "delete": "deletes",
+    "insert": None,
+    "getMore": None,
+}
+
+# Session and transport fields that must not be replayed through explain
+COMMAND_TRANSPORT_FIELDS = {"lsid", "txnNumber", "autocommit", "startTransaction", "readConcern", "writeConcern", "$db", "$clusterTime", "$readPreference"}
+
+def query_shape(value):
+    """Replace every literal in a filter with "?" while keeping field names and operators"""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in sorted(value.items())}
+    if isinstance(value, (list, tuple)) and value and all(isinstance(item, dict) for item in value):
+        return [query_shape(item) for item in value]
+    return "?"
+
+def command_shape(command_name: str, command: dict):
+    field = MONITORED_COMMANDS.get(command_name)
+    if field is None:
+        return None
+    spec = command.get(field)
+    if command_name == "aggregate":
+        # Only $match stages (and the first stage's name) decide index usage
+        stages = spec or []
+        shape = {
+            "match": [query_shape(stage["$match"]) for stage in stages if "$match" in stage],
+            "first_stage": next(iter(stages[0]), None) if stages else None,
+        }
+        return json.dumps(shape, sort_keys=True)
+    if command_name in ("update", "delete"):
+        statements = spec or []
+        spec = statements[0].get("q", {}) if statements else {}
+    shape = {"filter": query_shape(spec or {})}
+    if command_name == "find" and command.get("sort"):
+        shape["sort"] = list(command["sort"].keys())
+    return json.dumps(shape, sort_keys=True)
+
+class QueryMonitor(monitoring.CommandListener):
+    """Per-collection/per-operation latency and a slow-query log grouped by filter shape.
+    
+    Listener callbacks run on Motor's executor threads, so all state is guarded by a lock.
+    """
+    def __init__(self, slow_ms: float, max_shapes: int):
+        self.slow_ms = slow_ms
+        self.max_shapes = max_shapes
+        self.lock = threading.Lock()
+        self.pending: dict = {}  # (connection, request_id) -> (collection, operation, shape, command)
+        self.operations: dict = {}  # (collection, operation) -> stats
+        self.slow_queries: dict = {}  # (collection, operation, shape) -> stats
+        self.dropped_shapes = 0
+    
+    def started(self, event):
+        if event.command_name not in MONITORED_COMMANDS:
+            return
+        command = event.command
+        if event.command_name == "getMore":
+            collection = command.get("collection")
+        else:
+            collection = command.get(event.command_name)
+        shape = command_shape(event.command_name, command)
+        replay = {key: value for key, value in command.items() if key not in COMMAND_TRANSPORT_FIELDS} if shape else None
+        with self.lock:
+            self.pending[(event.connection_id, event.request_id)] = (collection, event.command_name, shape, replay)
+    
+    def finished(self, event, failed: bool):
+        with self.lock:
+            pending = self.pending.pop((event.connection_id, event.request_id), None)
+            if pending is None:
+                return
+            collection, operation, shape, replay = pending
+            elapsed_ms = event.duration_micros / 1000
+            
+            stats = self.operations.setdefault((collection, operation), {
+                "count": 0, "failures": 0, "slow": 0, "total_ms": 0.0, "max_ms": 0.0
+            })
+            stats["count"] += 1
+            stats["failures"] += failed
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+            if elapsed_ms < self.slow_ms:
+                return
+            stats["slow"] += 1
+            
+            key = (collection, operation, shape)
+            slow = self.slow_queries.get(key)
+            if slow is None:
+                if len(self.slow_queries) >= self.max_shapes:
+                    self.dropped_shapes += 1
+                    return
+                slow = self.slow_queries[key] = {
+                    "count": 0, "total_ms": 0.0, "max_ms": 0.0, "last_seen": None, "command": replay, "plan": None
+                }
+            slow["count"] += 1
+            slow["total_ms"] += elapsed_ms
+            slow["max_ms"] = max(slow["max_ms"], elapsed_ms)
+            slow["last_seen"] = datetime.utcnow()
+        
+        logging.getLogger(__name__).warning(
+            "Slow MongoDB %s on %s took %.1fms, shape %s", operation, collection, elapsed_ms, shape
+        )
+    
+    def succeeded(self, event):
+        self.finished(event, failed=False)
+    
+    def failed(self, event):
+        self.finished(event, failed=True)
+    
+    def report(self) -> dict:
+        with self.lock:
+            operations = [
+                {
+                    "collection": collection,
+                    "operation": operation,
+                    **stats,
+                    "avg_ms": stats["total_ms"] / stats["count"] if stats["count"] else 0.0,
+                }
+                for (collection, operation), stats in self.operations.items()
+            ]
+            slow_queries = [
+                {
+                    "collection": collection,
+                    "operation": operation,
+                    "shape": shape,
+                    "count": slow["count"],
+                    "avg_ms": slow["total_ms"] / slow["count"],
+                    "max_ms": slow["max_ms"],
+                    "last_seen": slow["last_seen"],
+                    "plan": slow["plan"],
+                }
+                for (collection, operation, shape), slow in self.slow_queries.items()
+            ]
+            dropped_shapes = self.dropped_shapes
+        
+        operations.sort(key=lambda item: item["total_ms"], reverse=True)
+        slow_queries.sort(key=lambda item: item["avg_ms"] * item["count"], reverse=True)
+        return {
+            "slow_query_ms": self.slow_ms,
+            "operations": operations,
+            "slow_queries": slow_queries,
+            "dropped_shapes": dropped_shapes,
+        }
+    
+    def unexplained(self) -> list:
+        with self.lock:
+            return [
+                (key, slow["command"])
+                for key, slow in self.slow_queries.items()
+                if slow["plan"] is None and slow["command"]
+            ]
+    
+    def set_plan(self, key, plan: dict):
+        with self.lock:
+            if key in self.slow_queries:
+                self.slow_queries[key]["plan"] = plan
+
+query_monitor = QueryMonitor(SLOW_QUERY_MS, SLOW_QUERY_MAX_SHAPES)
+
+def winning_plan_stages(explain: dict) -> list:
+    """Stage names of every winning plan in an explain result (aggregations nest them under $cursor)"""
+    stages = []
+    
+    def walk(node, in_plan):
+        if isinstance(node, dict):
+            if in_plan and "stage" in node:
+                stages.append(node["stage"])
+            for key, value in node.items():
+                walk(value, in_plan or key == "winningPlan")
+        elif isinstance(node, list):
+            for item in node:
+                walk(item, in_plan)
+    
+    walk(explain, False)
+    return stages
+
+# MongoDB connection pool, per worker process. Size it so that
+# workers x MONGO_MAX_POOL_SIZE stays under the server's connection limit.
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '50'))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '5'))
+MONGO_MAX_IDLE_TIME_MS = int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', '300000'))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', '5000'))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+# How long a request waits for a free pooled connection before failing
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '10000'))
+# 0 disables the socket timeout; streamed exports issue one getMore per batch, never one long read
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', '0'))
+
+# Created by connect_to_mongo() when a worker starts, never at import time, so every
+# worker process owns a client bound to its own event loop
+client: Optional[AsyncIOMotorClient] = None
+db = None
+
+def create_mongo_client() -> AsyncIOMotorClient:
+    return AsyncIOMotorClient(
+        os.environ['MONGO_URL'],
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+        connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS or None,
+        event_listeners=[RequestMongoListener(), query_monitor]
+    )
+
+# Registered before every other startup hook, so index builds and caches find `db` set
+@app.on_event("startup")
+async def connect_to_mongo():
+    global client, db
+    client = create_mongo_client()
+    db = client[os.environ['DB_NAME']]
+
+# Export tuning: documents fetched per cursor batch and bytes buffered per streamed chunk
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '1000'))
+EXPORT_CHUNK_BYTES = int(os.environ.get('EXPORT_CHUNK_BYTES', str(64 * 1024)))
+
+# Analytics results are cached per gym for one time bucket of this many seconds
+ANALYTICS_CACHE_SECONDS = int(os.environ.get('ANALYTICS_CACHE_SECONDS', '300'))
+
+# Stored idempotent responses expire after this many seconds (TTL index)
+IDEMPOTENCY_KEY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_KEY_TTL_SECONDS', str(24 * 60 * 60)))
+# A claim still in progress after this long belongs to a request whose process died; a retry may take it over
+IDEMPOTENCY_LEASE_SECONDS = int(os.environ.get('IDEMPOTENCY_LEASE_SECONDS', '60'))
+
+# Cached announcement lists re-check the gym's version counter at most this often
+ANNOUNCEMENT_VERSION_CHECK_SECONDS = float(os.environ.get('ANNOUNCEMENT_VERSION_CHECK_SECONDS', '5'))
+ANNOUNCEMENT_FEED_PAGE_SIZE = 50
+
+# Cached workout/diet templates re-check the gym's template version counters at most this often
+TEMPLATE_VERSION_CHECK_SECONDS = float(os.environ.get('TEMPLATE_VERSION_CHECK_SECONDS', '5'))
+
+# Announcement push stream: per-connection queue bound and keep-alive interval
+ANNOUNCEMENT_STREAM_QUEUE_SIZE = int(os.environ.get('ANNOUNCEMENT_STREAM_QUEUE_SIZE', '100'))
+ANNOUNCEMENT_STREAM_HEARTBEAT_SECONDS = float(os.environ.get('ANNOUNCEMENT_STREAM_HEARTBEAT_SECONDS', '15'))
+
+# Progress storage: "documents" (one document per log) or "buckets" (one document per member per month).
+# Run migrate_progress_storage.py before switching an existing database to "buckets".
+PROGRESS_STORAGE_MODE = os.environ.get('PROGRESS_STORAGE_MODE', 'documents')
+
+# Per-exercise session history kept for trend analysis (aggregate totals are never truncated)
+EXERCISE_HISTORY_LIMIT = int(os.environ.get('EXERCISE_HISTORY_LIMIT', '1000'))
+
+# Offline batch sync limits
+SYNC_MAX_OPERATIONS = int(os.environ.get('SYNC_MAX_OPERATIONS', '500'))
+SYNC_MAX_OFFLINE_HOURS = int(os.environ.get('SYNC_MAX_OFFLINE_HOURS', '72'))
+SYNC_OPERATION_TTL_SECONDS = int(os.environ.get('SYNC_OPERATION_TTL_SECONDS', str(30 * 24 * 60 * 60)))
+# An op_id claimed this long ago without a stored result was abandoned by a dead request
+SYNC_CLAIM_LEASE_SECONDS = int(os.environ.get('SYNC_CLAIM_LEASE_SECONDS', '60'))
+
+# Delta sync: documents per collection per page, and how far the returned cursor trails the
+# server clock so writes that were in flight during the query are picked up by the next call
+SYNC_DELTA_LIMIT = int(os.environ.get('SYNC_DELTA_LIMIT', '500'))
+SYNC_CURSOR_LAG_MS = int(os.environ.get('SYNC_CURSOR_LAG_MS', '2000'))
+
+# Rate limiting: "memory" keeps buckets per process, "mongo" shares them across workers and hosts
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+# Client addresses that skip the per-IP buckets, e.g. a load generator (comma separated)
+RATE_LIMIT_EXEMPT_IPS = {ip.strip() for ip in os.environ.get('RATE_LIMIT_EXEMPT_IPS', '').split(',') if ip.strip()}
+# The per-IP auth bucket covers login, register and token refresh. A whole gym on one Wi-Fi
+# shares an address, and behind a reverse proxy every client does unless the proxy is trusted
+# for X-Forwarded-For (serve.py --forwarded-allow-ips). Password guessing is slowed down
+# separately by the login backoff below, so this only needs to stop floods.
+AUTH_RATE_LIMIT_PER_MINUTE = int(os.environ.get('AUTH_RATE_LIMIT_PER_MINUTE', '300'))
+AUTH_RATE_LIMIT_BURST = int(os.environ.get('AUTH_RATE_LIMIT_BURST', '100'))
+# Token buckets per route group, as (requests per minute, burst) for each key type
+RATE_LIMITS = {
+    "scan": {"user": (20, 10), "gym": (600, 200)},
+    "dashboard": {"user": (60, 20), "gym": (240, 60)},
+    "auth": {"ip": (AUTH_RATE_LIMIT_PER_MINUTE, AUTH_RATE_LIMIT_BURST)},
+}
+
+# Login throttling: failures allowed per email / per client address before backoff starts,
+# doubling from LOGIN_BACKOFF_BASE_SECONDS up to LOGIN_BACKOFF_MAX_SECONDS
+LOGIN_FREE_FAILURES_PER_EMAIL = int(os.environ.get('LOGIN_FREE_FAILURES_PER_EMAIL', '5'))
+LOGIN_FREE_FAILURES_PER_IP = int(os.environ.get('LOGIN_FREE_FAILURES_PER_IP', '20'))
+LOGIN_BACKOFF_BASE_SECONDS = float(os.environ.get('LOGIN_BACKOFF_BASE_SECONDS', '1'))
+LOGIN_BACKOFF_MAX_SECONDS = float(os.environ.get('LOGIN_BACKOFF_MAX_SECONDS', '900'))
+# Failure counters are forgotten after this long without a new failure
+LOGIN_FAILURE_WINDOW_SECONDS = float(os.environ.get('LOGIN_FAILURE_WINDOW_SECONDS', '900'))
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -78,7 +653,13 @@ api_router = APIRouter(prefix="/api")
 # JWT Configuration
 SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'fallback-secret-key-for-development-only')
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30 * 24 * 60  # 30 days
+# Access tokens carry id/role/gym_id and are short-lived; clients renew them with the refresh token
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.environ.get('ACCESS_TOKEN_EXPIRE_MINUTES', '15'))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.environ.get('REFRESH_TOKEN_EXPIRE_DAYS', '30'))
+# How often each process reloads revoked access tokens and expired claims, both of which only live as
+# long as an access token. A logout, or a role/gym/name change that expires a user's claims, reaches
+# other processes within this window; used refresh tokens are checked against the database instead.
+TOKEN_REVOCATION_CHECK_SECONDS = float(os.environ.get('TOKEN_REVOCATION_CHECK_SECONDS', '5'))
 
 security = HTTPBearer()
 
@@ -114,6 +695,10 @@ class PlanType(str, Enum):
     VIP = "vip"
     FAMILY = "family"
 
+class ExportFormat(str, Enum):
+    CSV = "csv"
+    NDJSON = "ndjson"
+
 # Authentication Models
 class UserLogin(BaseModel):
     email: EmailStr
@@ -181,6 +766,22 @@ class Token(BaseModel):
     access_token: str
     token_type: str
     user: dict
+    refresh_token: Optional[str] = None
+    expires_in: Optional[int] = None  # access token lifetime in seconds
+
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
+
+class CurrentUser(BaseModel):
+    """The authenticated user, built from access-token claims without a database read"""
+    id: str
+    email: str
+    name: str
+    role: UserRole
+    gym_id: Optional[str] = None
 
 # Gym Models
 class Gym(BaseModel):
@@ -296,6 +897,7 @@ class Payment(BaseModel):
     notes: Optional[str] = None
     plan_id: str
     plan_name: str
+    updated_at: datetime = Field(default_factory=datetime.utcnow)  # change cursor for delta sync
 
 class PaymentCreate(BaseModel):
     member_id: str
@@ -327,6 +929,7 @@ class Announcement(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     is_active: bool = True
     priority: str = "normal"  # normal, high, urgent
+    updated_at: datetime = Field(default_factory=datetime.utcnow)  # change cursor for delta sync
 
 class AnnouncementCreate(BaseModel):
     title: str
@@ -368,6 +971,8 @@ class WorkoutTemplate(BaseModel):
     created_by: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
     is_active: bool = True
+    version: int = 1  # bumped on every update or delete
+    current_version_id: Optional[str] = None  # immutable snapshot of the current content
 
 class WorkoutTemplateCreate(BaseModel):
     name: str
@@ -407,6 +1012,8 @@ class DietTemplate(BaseModel):
     created_by: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
     is_active: bool = True
+    version: int = 1  # bumped on every update or delete
+    current_version_id: Optional[str] = None  # immutable snapshot of the current content
 
 class DietTemplateCreate(BaseModel):
     name: str
@@ -418,6 +1025,15 @@ class DietTemplateCreate(BaseModel):
     fat_target: Optional[float] = None
     meals: List[Meal] = []
 
+class TemplateVersion(BaseModel):
+    id: str  # content hash of gym_id, template_id, plan_type and body
+    gym_id: str
+    template_id: str
+    plan_type: str  # "workout" or "diet"
+    version: int
+    body: dict
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
 # Member Plan Assignment Models
 class MemberPlanAssignment(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -433,6 +1049,8 @@ class MemberPlanAssignment(BaseModel):
     end_date: Optional[datetime] = None
     is_active: bool = True
     notes: Optional[str] = None
+    template_version_id: Optional[str] = None  # template snapshot the assignment is pinned to
+    updated_at: datetime = Field(default_factory=datetime.utcnow)  # change cursor for delta sync
 
 class PlanAssignmentCreate(BaseModel):
     member_id: str
@@ -442,12 +1060,37 @@ class PlanAssignmentCreate(BaseModel):
     end_date: Optional[datetime] = None
     notes: Optional[str] = None
 
+class MemberCohortFilter(BaseModel):
+    plan_id: Optional[str] = None  # membership plan
+    membership_status: Optional[MembershipStatus] = None
+    joined_after: Optional[datetime] = None
+
+class BulkPlanAssignmentCreate(BaseModel):
+    member_ids: Optional[List[str]] = None
+    member_filter: Optional[MemberCohortFilter] = None
+    plan_type: str  # "workout" or "diet"
+    plan_id: str
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+    notes: Optional[str] = None
+
+class BulkPlanAssignmentResult(BaseModel):
+    plan_type: str
+    plan_id: str
+    plan_name: str
+    matched: int
+    assigned: int
+    already_assigned: List[str] = []  # member ids with an active assignment of this plan
+    not_found: List[str] = []  # requested member ids that are not in the gym
+    assignment_ids: List[str] = []
+
 # Member Progress Tracking Models
 class ExerciseProgress(BaseModel):
     exercise_name: str
     completed_sets: int
     completed_reps: List[int] = []  # reps completed in each set
     weights_used: List[str] = []    # weights used in each set
+    weights_kg: List[Optional[float]] = []  # weights_used normalised to kg at write time
     notes: Optional[str] = None
 
 class WorkoutProgress(BaseModel):
@@ -464,6 +1107,9 @@ class WorkoutProgress(BaseModel):
     overall_rating: Optional[int] = None  # 1-5 rating
     notes: Optional[str] = None
     status: str = "pending"  # "pending", "completed", "skipped"
+    personal_records: List[str] = []  # exercises with a new estimated 1RM in this session
+    template_version_id: Optional[str] = None
+    updated_at: datetime = Field(default_factory=datetime.utcnow)  # change cursor for delta sync
 
 class MealProgress(BaseModel):
     meal_type: str
@@ -485,6 +1131,8 @@ class DietProgress(BaseModel):
     overall_rating: Optional[int] = None  # 1-5 rating
     notes: Optional[str] = None
     status: str = "pending"  # "pending", "completed"
+    template_version_id: Optional[str] = None
+    updated_at: datetime = Field(default_factory=datetime.utcnow)  # change cursor for delta sync
 
 class WorkoutProgressCreate(BaseModel):
     assignment_id: str
@@ -546,6 +1194,81 @@ class MembershipData(BaseModel):
     plan_name: str
     count: int
 
+class PaymentMethodRevenue(BaseModel):
+    payment_method: str
+    revenue: float
+    count: int
+
+class RevenueAnalytics(BaseModel):
+    revenue_by_month: List[RevenueData] = []
+    revenue_by_method: List[PaymentMethodRevenue] = []
+    members_by_plan: List[MembershipData] = []
+
+class ExerciseStats(BaseModel):
+    exercise_name: str
+    sessions: int = 0
+    total_sets: int = 0
+    total_reps: int = 0
+    total_volume_kg: float = 0
+    best_weight_kg: Optional[float] = None
+    best_e1rm_kg: Optional[float] = None
+    best_e1rm_date: Optional[datetime] = None
+    last_performed: Optional[datetime] = None
+
+class NutritionPeriod(BaseModel):
+    period: str  # "2024-W05" for weeks, "2024-05" for months
+    days_logged: int = 0
+    average_calories: Optional[float] = None
+    calorie_adherence: Optional[float] = None  # calories consumed / target on days with a target
+    days_within_target: int = 0
+    average_water_liters: Optional[float] = None
+    completion_ratio: Optional[float] = None  # meals completed / meals planned
+
+class NutritionSummary(BaseModel):
+    member_id: str
+    weekly: List[NutritionPeriod] = []
+    monthly: List[NutritionPeriod] = []
+    updated_at: Optional[datetime] = None
+
+class SyncOperationType(str, Enum):
+    WORKOUT_PROGRESS = "workout_progress"
+    DIET_PROGRESS = "diet_progress"
+    ATTENDANCE = "attendance"
+
+class SyncOperation(BaseModel):
+    op_id: str  # client generated, unique per member
+    type: SyncOperationType
+    client_timestamp: datetime
+    payload: dict = {}
+
+class SyncBatchRequest(BaseModel):
+    operations: List[SyncOperation]
+
+class SyncAttendancePayload(BaseModel):
+    action: str  # "check-in" or "check-out"
+    qr_code_data: Optional[str] = None
+    numeric_code: Optional[str] = None
+    device_info: Optional[str] = None
+
+class SyncOperationResult(BaseModel):
+    op_id: str
+    status: str  # "applied", "duplicate", "rejected", or "pending" while another request applies it
+    resource_id: Optional[str] = None
+    detail: Optional[str] = None
+
+class SyncBatchResponse(BaseModel):
+    results: List[SyncOperationResult]
+    cursor: str
+
+class DeltaSyncResponse(BaseModel):
+    cursor: str
+    has_more: bool = False
+    plan_assignments: List[MemberPlanAssignment] = []
+    workout_progress: List[WorkoutProgress] = []
+    diet_progress: List[DietProgress] = []
+    payments: List[Payment] = []
+    announcements: List[Announcement] = []
+
 class SubscriptionUpdate(BaseModel):
     memberId: str
     newExpiry: datetime
@@ -553,19 +1276,24 @@ class SubscriptionUpdate(BaseModel):
     reason: Optional[str] = None
 
 # Helper functions
+# bcrypt, qrcode (which pulls in PIL), numpy and calendar are imported where they are used,
+# so worker startup does not pay for them; see tests/benchmarks/test_startup.py
 def hash_password(password: str) -> str:
+    import bcrypt
     return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
 
 def verify_password(password: str, hashed: str) -> bool:
+    import bcrypt
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
+    now = datetime.utcnow()
     if expires_delta:
-        expire = datetime.utcnow() + expires_delta
+        expire = now + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+        expire = now + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    to_encode.update({"exp": expire, "iat": now, "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -590,6 +1318,7 @@ def generate_dynamic_qr_code(gym_id: str) -> tuple[str, str, str, datetime]:
         numeric_code = (numeric_code + '000000')[:6]
     
     # Create QR code
+    import qrcode
     qr = qrcode.QRCode(
         version=1,
         error_correction=qrcode.constants.ERROR_CORRECT_L,
@@ -613,8 +1342,8 @@ def generate_dynamic_qr_code(gym_id: str) -> tuple[str, str, str, datetime]:
     
     return qr_data, img_base64, numeric_code, expires_at
 
-def validate_qr_code(qr_data: str, gym_id: str) -> bool:
-    """Validate if QR code is valid and not expired"""
+def validate_qr_code(qr_data: str, gym_id: str, at: Optional[float] = None) -> bool:
+    """Validate if QR code is valid and not expired (at `at`, a Unix timestamp, defaulting to now)"""
     try:
         parts = qr_data.split(':')
         if len(parts) != 3 or parts[0] != "GYMBLE_ATTENDANCE":
@@ -626,7 +1355,7 @@ def validate_qr_code(qr_data: str, gym_id: str) -> bool:
         if qr_gym_id != gym_id:
             return False
         
-        current_time = int(time.time())
+        current_time = int(at if at is not None else time.time())
         current_slot = (current_time // 300) * 300
         
         # Allow current slot and previous slot (10 minutes total validity)
@@ -636,10 +1365,10 @@ def validate_qr_code(qr_data: str, gym_id: str) -> bool:
     except:
         return False
 
-def validate_numeric_code(numeric_code: str, gym_id: str) -> bool:
-    """Validate if numeric code is valid and not expired"""
+def validate_numeric_code(numeric_code: str, gym_id: str, at: Optional[float] = None) -> bool:
+    """Validate if numeric code is valid and not expired (at `at`, a Unix timestamp, defaulting to now)"""
     try:
-        current_time = int(time.time())
+        current_time = int(at if at is not None else time.time())
         current_slot = (current_time // 300) * 300
         
         # Check current slot and previous slot (10 minutes total validity)
@@ -661,30 +1390,500 @@ def validate_numeric_code(numeric_code: str, gym_id: str) -> bool:
     except:
         return False
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+def to_naive_utc(value: datetime) -> datetime:
+    """Normalise a client supplied datetime to the naive UTC values stored in Mongo"""
+    if value.tzinfo:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+WEIGHT_PATTERN = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*(kg|kgs|kilograms?|lb|lbs|pounds?)?\s*$', re.IGNORECASE)
+POUNDS_TO_KG = 0.45359237
+
+def parse_weight_kg(weight: Optional[str]) -> Optional[float]:
+    """Parse a free-form weight such as "50kg", "110 lbs" or "20" (kg) into kilograms.
+
+    Returns None for bodyweight or anything that is not a plain number and unit.
+    """
+    if not weight:
+        return None
+    match = WEIGHT_PATTERN.match(weight)
+    if not match:
+        return None
+    value = float(match.group(1))
+    unit = (match.group(2) or "kg").lower()
+    if unit.startswith(("lb", "pound")):
+        value *= POUNDS_TO_KG
+    return round(value, 2)
+
+def estimate_one_rep_max(weight_kg: float, reps: int) -> float:
+    """Epley estimate of the one-rep max for a set"""
+    if reps <= 1:
+        return weight_kg
+    return weight_kg * (1 + reps / 30)
+
+def current_change_cursor(lag_ms: int = 0) -> str:
+    """Opaque change cursor handed to clients: server time in epoch milliseconds"""
+    return str(int(time.time() * 1000) - lag_ms)
+
+def datetime_to_change_cursor(value: datetime) -> str:
+    return str(int(value.replace(tzinfo=timezone.utc).timestamp() * 1000))
+
+def page_change_cursor(value: datetime, last_id: str) -> str:
+    """Cursor resuming after the document `last_id` among those changed at exactly `value`"""
+    return f"{datetime_to_change_cursor(value)}:{last_id}"
+
+def parse_change_cursor(cursor: str) -> tuple[datetime, Optional[str]]:
+    """(updated_at, last id) position of a cursor; the id is None for plain time cursors"""
+    millis, _, last_id = cursor.partition(":")
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
+        return datetime.utcfromtimestamp(int(millis) / 1000), last_id or None
+    except (ValueError, OverflowError, OSError):
+        raise HTTPException(status_code=400, detail="Invalid change cursor")
+
+def changed_after(position: tuple[datetime, Optional[str]]) -> dict:
+    """Query condition for documents ordered after a (updated_at, id) cursor position"""
+    since, last_id = position
+    if last_id is None:
+        return {"updated_at": {"$gt": since}}
+    return {"$or": [{"updated_at": {"$gt": since}}, {"updated_at": since, "id": {"$gt": last_id}}]}
+
+def export_value(value):
+    """Convert a stored document value into a plain CSV/JSON friendly value"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    return value
+
+def date_range_filter(start_date: Optional[datetime], end_date: Optional[datetime]) -> Optional[dict]:
+    """Build a Mongo range condition from optional inclusive start/exclusive end dates"""
+    condition = {}
+    if start_date:
+        condition["$gte"] = start_date
+    if end_date:
+        condition["$lt"] = end_date
+    return condition or None
+
+async def stream_export(cursor, columns: List[str], export_format: ExportFormat):
+    """Encode documents from a Mongo cursor incrementally as CSV or NDJSON chunks.
+
+    Rows are written into a small buffer that is flushed every EXPORT_CHUNK_BYTES,
+    so memory stays flat no matter how many documents the cursor yields.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if export_format == ExportFormat.CSV else None
+    if writer:
+        writer.writerow(columns)
+
+    async for document in cursor:
+        row = {column: export_value(document.get(column)) for column in columns}
+        if writer:
+            writer.writerow(["" if row[column] is None else row[column] for column in columns])
+        else:
+            buffer.write(json.dumps(row, default=str))
+            buffer.write("\n")
+
+        if buffer.tell() >= EXPORT_CHUNK_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def export_response(cursor, columns: List[str], export_format: ExportFormat, name: str) -> StreamingResponse:
+    media_type = "text/csv" if export_format == ExportFormat.CSV else "application/x-ndjson"
+    filename = f"gymble-{name}-{datetime.utcnow().strftime('%Y%m%d')}.{export_format.value}"
+    return StreamingResponse(
+        stream_export(cursor, columns, export_format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+# In-process analytics cache: (gym_id, name) -> (time bucket, value)
+analytics_cache: dict = {}
+
+async def cached_analytics(gym_id: str, name: str, compute):
+    """Return a cached analytics result for the current time bucket, computing it on a miss"""
+    bucket = int(time.time() // ANALYTICS_CACHE_SECONDS)
+    entry = analytics_cache.get((gym_id, name))
+    if entry and entry[0] == bucket:
+        return entry[1]
+    
+    value = await compute()
+    analytics_cache[(gym_id, name)] = (bucket, value)
+    return value
+
+def invalidate_analytics_cache(gym_id: str):
+    """Drop every cached analytics result of a gym, e.g. after a new payment"""
+    for key in [key for key in analytics_cache if key[0] == gym_id]:
+        analytics_cache.pop(key, None)
+
+# Transactions need a replica set or sharded cluster; detected once per process
+transactions_supported: Optional[bool] = None
+
+async def supports_transactions() -> bool:
+    global transactions_supported
+    if transactions_supported is None:
+        try:
+            hello = await client.admin.command('hello')
+            transactions_supported = bool(hello.get("setName") or hello.get("msg") == "isdbgrid")
+        except Exception:
+            transactions_supported = False
+    return transactions_supported
+
+async def run_transaction(operations):
+    """Run operations(session) inside a transaction when the deployment supports it.
+
+    On a standalone mongod the operations run sequentially with session=None.
+    """
+    if not await supports_transactions():
+        return await operations(None)
+    
+    async with await client.start_session() as session:
+        async with session.start_transaction():
+            return await operations(session)
+
+def idempotency_fingerprint(endpoint: str, payload: BaseModel) -> str:
+    """Keyed hash of the request body; payloads carry plaintext passwords, so a bare
+    sha256 stored next to the response could be brute-forced offline"""
+    return hmac.new(SECRET_KEY.encode(), f"{endpoint}:{payload.json()}".encode(), hashlib.sha256).hexdigest()
+
+async def run_idempotent(idempotency_key: Optional[str], current_user, endpoint: str, payload: BaseModel, handler):
+    """Execute handler() at most once per Idempotency-Key and replay its stored response on retries"""
+    if not idempotency_key:
+        return await handler()
+    
+    key_filter = {"user_id": current_user.id, "key": idempotency_key}
+    request_hash = idempotency_fingerprint(endpoint, payload)
+    now = datetime.utcnow()
+    try:
+        await db.idempotency_keys.insert_one({
+            **key_filter,
+            "endpoint": endpoint,
+            "request_hash": request_hash,
+            "status": "in_progress",
+            "claimed_at": now,
+            "created_at": now
+        })
+    except DuplicateKeyError:
+        existing = await db.idempotency_keys.find_one(key_filter)
+        if not existing:
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+        if existing["request_hash"] != request_hash:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+        if existing["status"] == "completed":
+            return JSONResponse(
+                content=existing["response"],
+                status_code=existing["status_code"],
+                headers={"Idempotent-Replayed": "true"}
+            )
+        
+        # Take over an expired claim; matching on the old claimed_at lets only one retry win
+        taken_over = None
+        if existing.get("claimed_at", existing["created_at"]) <= now - timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS):
+            taken_over = await db.idempotency_keys.find_one_and_update(
+                {**key_filter, "status": "in_progress", "claimed_at": existing.get("claimed_at")},
+                {"$set": {"claimed_at": now}}
+            )
+        if not taken_over:
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+    
+    try:
+        result = await handler()
+    except Exception:
+        # Nothing was committed, so let the client retry with the same key
+        await db.idempotency_keys.delete_one(key_filter)
+        raise
+    
+    await db.idempotency_keys.update_one(
+        key_filter,
+        {"$set": {"status": "completed", "status_code": 200, "response": jsonable_encoder(result, exclude={"password_hash"})}}
+    )
+    return result
+
+def issue_tokens(user: User) -> Token:
+    """Access token with the claims authorization needs, plus a refresh token to renew it"""
+    access_token = create_access_token(data={
+        "sub": user.email,
+        "id": user.id,
+        "name": user.name,
+        "role": UserRole(user.role).value,
+        "gym_id": user.gym_id,
+        "type": "access"
+    })
+    refresh_token = create_access_token(
+        data={"sub": user.email, "id": user.id, "type": "refresh"},
+        expires_delta=timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    )
+    return Token(
+        access_token=access_token,
+        token_type="bearer",
+        refresh_token=refresh_token,
+        expires_in=ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        user=user.dict(exclude={"password_hash"})
+    )
+
+def decode_token(token: str, token_type: str, verify_exp: bool = True) -> dict:
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM], options={"verify_exp": verify_exp})
     except jwt.PyJWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    # Tokens issued before typed tokens existed are access tokens
+    if payload.get("sub") is None or payload.get("type", "access") != token_type:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return payload
+
+class TokenRevocationList:
+    """Revoked token ids, and users whose older tokens must be re-checked against the database.
+    
+    Entries live in the revoked_tokens collection until the tokens they cover
+    expire. Each process reloads them at most every `check_seconds`, so
+    authenticating a request is CPU-only between reloads; revocations and claim
+    expiries made by other processes take effect within that window. Used and
+    revoked refresh tokens are kept as kind "refresh" and never loaded:
+    consume_token() checks the collection itself.
+    """
+    def __init__(self, check_seconds: float):
+        self.check_seconds = check_seconds
+        self.token_ids: set = set()
+        self.users: dict = {}  # user_id -> Unix time before which tokens are re-checked
+        self.loaded_at = float("-inf")
+    
+    async def refresh(self):
+        now = time.monotonic()
+        if now - self.loaded_at < self.check_seconds:
+            return
+        # Concurrent requests keep using the current lists while this one reloads
+        self.loaded_at = now
+        entries = await db.revoked_tokens.find(
+            {"kind": {"$ne": "refresh"}, "expires_at": {"$gt": datetime.utcnow()}}
+        ).to_list(None)
+        self.token_ids = {entry["_id"] for entry in entries if entry["kind"] == "token"}
+        self.users = {entry["user_id"]: entry["not_before"] for entry in entries if entry["kind"] == "user"}
+    
+    async def revoke_token(self, payload: dict):
+        jti = payload.get("jti")
+        expires_at = datetime.utcfromtimestamp(payload["exp"])
+        # An expired token is already rejected, so there is nothing to record
+        if not jti or expires_at <= datetime.utcnow():
+            return
+        kind = "refresh" if payload.get("type") == "refresh" else "token"
+        if kind == "token":
+            self.token_ids.add(jti)
+        await db.revoked_tokens.update_one(
+            {"_id": jti},
+            {"$set": {"kind": kind, "expires_at": expires_at}},
+            upsert=True
+        )
     
-    user = await db.users.find_one({"email": email})
-    if user is None:
-        raise HTTPException(status_code=401, detail="User not found")
-    return User(**user)
+    async def consume_token(self, payload: dict):
+        """Revoke a single-use token atomically; 401 when another request already used it"""
+        jti = payload.get("jti")
+        if not jti:
+            raise HTTPException(status_code=401, detail="Invalid token")
+        try:
+            await db.revoked_tokens.insert_one(
+                {"_id": jti, "kind": "refresh", "expires_at": datetime.utcfromtimestamp(payload["exp"])}
+            )
+        except DuplicateKeyError:
+            raise HTTPException(status_code=401, detail="Token revoked")
+    
+    async def expire_claims(self, user_id: str):
+        """Make tokens issued so far re-read the user, e.g. after its role or gym changed"""
+        not_before = time.time()
+        self.users[user_id] = not_before
+        await db.revoked_tokens.update_one(
+            {"_id": f"user:{user_id}"},
+            {"$set": {
+                "kind": "user",
+                "user_id": user_id,
+                "not_before": not_before,
+                # Refresh always re-reads the user, so only access tokens issued before now need the entry
+                "expires_at": datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+            }},
+            upsert=True
+        )
+    
+    def is_revoked(self, payload: dict) -> bool:
+        return payload.get("jti") in self.token_ids
+    
+    def claims_expired(self, payload: dict) -> bool:
+        not_before = self.users.get(payload.get("id"))
+        return not_before is not None and payload.get("iat", 0) <= not_before
+
+revocation_list = TokenRevocationList(TOKEN_REVOCATION_CHECK_SECONDS)
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> CurrentUser:
+    payload = decode_token(credentials.credentials, "access")
+    await revocation_list.refresh()
+    if revocation_list.is_revoked(payload):
+        raise HTTPException(status_code=401, detail="Token revoked")
+    
+    # Legacy tokens without claims, owners who have not created their gym yet and users
+    # whose claims changed since the token was issued are read from the database
+    if payload.get("id") is None or payload.get("gym_id") is None or revocation_list.claims_expired(payload):
+        user = await db.users.find_one({"email": payload["sub"]})
+        if user is None:
+            raise HTTPException(status_code=401, detail="User not found")
+        return CurrentUser(**user)
+    
+    return CurrentUser(
+        id=payload["id"],
+        email=payload["sub"],
+        name=payload.get("name", ""),
+        role=payload["role"],
+        gym_id=payload["gym_id"]
+    )
 
-async def get_current_owner(current_user: User = Depends(get_current_user)):
+async def get_current_owner(current_user: CurrentUser = Depends(get_current_user)):
     if current_user.role != UserRole.OWNER:
         raise HTTPException(status_code=403, detail="Only owners can access this resource")
     return current_user
 
-async def get_current_owner_or_staff(current_user: User = Depends(get_current_user)):
+async def get_current_owner_or_staff(current_user: CurrentUser = Depends(get_current_user)):
     if current_user.role not in [UserRole.OWNER, UserRole.STAFF]:
         raise HTTPException(status_code=403, detail="Access denied")
     return current_user
 
+# Rate limiting
+class InMemoryRateLimitBackend:
+    """Token buckets held by this process.
+    
+    Any object with the same async take() can replace `rate_limit_backend`.
+    """
+    def __init__(self, prune_every: int = 10000):
+        self.buckets: dict = {}  # key -> (tokens, updated_at, full_at)
+        self.prune_every = prune_every
+        self.takes = 0
+    
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        """Take one token; returns 0 when allowed, otherwise seconds until a token is available"""
+        now = time.monotonic()
+        tokens, updated_at, _ = self.buckets.get(key, (burst, now, now))
+        tokens = min(burst, tokens + (now - updated_at) * rate)
+        
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate
+        self.buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+        
+        self.takes += 1
+        if self.takes % self.prune_every == 0:
+            self.prune(now)
+        return wait
+    
+    def prune(self, now: float):
+        # A bucket that has refilled completely carries no state
+        self.buckets = {key: bucket for key, bucket in self.buckets.items() if bucket[2] > now}
+
+class MongoRateLimitBackend:
+    """Token buckets in the rate_limits collection, shared by every worker and host.
+    
+    Each check is one atomic pipeline update: refill the bucket for the time
+    elapsed since its last update, then take a token if a whole one is left.
+    """
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        now = datetime.utcnow()
+        elapsed = {"$divide": [{"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}, 1000]}
+        bucket = await db.rate_limits.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {
+                    "tokens": {"$min": [burst, {"$add": [{"$ifNull": ["$tokens", burst]}, {"$multiply": [elapsed, rate]}]}]},
+                    "updated_at": now
+                }},
+                {"$set": {"allowed": {"$gte": ["$tokens", 1]}}},
+                {"$set": {"tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", 1]}, "$tokens"]}}}
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return 0.0 if bucket["allowed"] else (1 - bucket["tokens"]) / rate
+
+rate_limit_backend = MongoRateLimitBackend() if RATE_LIMIT_BACKEND == "mongo" else InMemoryRateLimitBackend()
+
+class LoginThrottle:
+    """Failed-login counters with exponential backoff, kept by this process.
+    
+    After `free_failures` failures for a key, each further failure blocks the
+    key for base * 2^n seconds (capped). Throttled attempts are rejected before
+    the user lookup and the bcrypt check, so they cost next to nothing.
+    """
+    def __init__(self, prune_every: int = 1000):
+        self.failures: dict = {}  # key -> (count, blocked_until, last_failure)
+        self.prune_every = prune_every
+        self.recorded = 0
+    
+    def retry_after(self, key: str) -> float:
+        entry = self.failures.get(key)
+        if entry is None:
+            return 0.0
+        return max(0.0, entry[1] - time.monotonic())
+    
+    def record_failure(self, key: str, free_failures: int):
+        now = time.monotonic()
+        count, _, last_failure = self.failures.get(key, (0, 0.0, now))
+        if now - last_failure > LOGIN_FAILURE_WINDOW_SECONDS:
+            count = 0
+        count += 1
+        
+        blocked_until = 0.0
+        if count > free_failures:
+            backoff = LOGIN_BACKOFF_BASE_SECONDS * 2 ** (count - free_failures - 1)
+            blocked_until = now + min(LOGIN_BACKOFF_MAX_SECONDS, backoff)
+        self.failures[key] = (count, blocked_until, now)
+        
+        self.recorded += 1
+        if self.recorded % self.prune_every == 0:
+            self.prune(now)
+    
+    def clear(self, key: str):
+        self.failures.pop(key, None)
+    
+    def prune(self, now: float):
+        self.failures = {
+            key: entry for key, entry in self.failures.items()
+            if now - entry[2] <= LOGIN_FAILURE_WINDOW_SECONDS or entry[1] > now
+        }
+
+login_throttle = LoginThrottle()
+
+async def check_rate_limit(scope: str, keys: dict):
+    """Take a token from each bucket of the route group, most specific key first; 429 when one is empty"""
+    if not RATE_LIMIT_ENABLED:
+        return
+    
+    for key_type, identifier in keys.items():
+        limit = RATE_LIMITS[scope].get(key_type)
+        if limit is None or identifier is None:
+            continue
+        per_minute, burst = limit
+        wait = await rate_limit_backend.take(f"{scope}:{key_type}:{identifier}", per_minute / 60, burst)
+        if wait:
+            metrics.inc("gymble_rate_limit_rejections_total", scope=scope, key=key_type)
+            raise HTTPException(
+                status_code=429,
+                detail=f"Too many {scope} requests, please retry later",
+                headers={"Retry-After": str(max(1, math.ceil(wait)))}
+            )
+
+def rate_limited(scope: str):
+    """Route dependency limiting the current user and their gym"""
+    async def limit_user(current_user: CurrentUser = Depends(get_current_user)):
+        await check_rate_limit(scope, {"user": current_user.id, "gym": current_user.gym_id})
+    return Depends(limit_user)
+
+def rate_limited_by_ip(scope: str):
+    """Route dependency for unauthenticated routes, limiting the client address"""
+    async def limit_ip(request: Request):
+        host = request.client.host if request.client else None
+        if host not in RATE_LIMIT_EXEMPT_IPS:
+            await check_rate_limit(scope, {"ip": host})
+    return Depends(limit_ip)
+
 # API Routes
 
 # Health check endpoint
@@ -712,7 +1911,7 @@ async def root():
     return {"message": "GYMBLE API is running", "status": "success"}
 
 # Authentication Routes
-@api_router.post("/auth/register", response_model=Token)
+@api_router.post("/auth/register", response_model=Token, dependencies=[rate_limited_by_ip("auth")])
 async def register_user(user_data: UserRegister):
     # Check if user already exists
     existing_user = await db.users.find_one({"email": user_data.email})
@@ -730,16 +1929,9 @@ async def register_user(user_data: UserRegister):
     
     await db.users.insert_one(user.dict())
     
-    # Create access token
-    access_token = create_access_token(data={"sub": user.email})
-    
-    return Token(
-        access_token=access_token,
-        token_type="bearer",
-        user=user.dict(exclude={"password_hash"})
-    )
+    return issue_tokens(user)
 
-@api_router.post("/auth/register-member", response_model=Token)
+@api_router.post("/auth/register-member", response_model=Token, dependencies=[rate_limited_by_ip("auth")])
 async def register_member(member_data: MemberRegister):
     # Check if user already exists
     existing_user = await db.users.find_one({"email": member_data.email})
@@ -789,37 +1981,78 @@ async def register_member(member_data: MemberRegister):
     
     await db.members.insert_one(member.dict())
     
-    # Create access token
-    access_token = create_access_token(data={"sub": user.email})
+    return issue_tokens(user)
+
+@api_router.post("/auth/login", response_model=Token, dependencies=[rate_limited_by_ip("auth")])
+async def login(user_data: UserLogin, request: Request):
+    email_key = f"email:{user_data.email.strip().lower()}"
+    ip_key = f"ip:{request.client.host}" if request.client else None
+    
+    # Throttled attempts never reach the database or bcrypt
+    for key in (email_key, ip_key):
+        wait = login_throttle.retry_after(key) if key else 0.0
+        if wait:
+            metrics.inc("gymble_login_throttled_total", key=key.split(":", 1)[0])
+            raise HTTPException(
+                status_code=429,
+                detail="Too many failed login attempts, please retry later",
+                headers={"Retry-After": str(max(1, math.ceil(wait)))}
+            )
     
-    return Token(
-        access_token=access_token,
-        token_type="bearer",
-        user=user.dict(exclude={"password_hash"})
-    )
-
-@api_router.post("/auth/login", response_model=Token)
-async def login(user_data: UserLogin):
     user = await db.users.find_one({"email": user_data.email})
     if not user or not verify_password(user_data.password, user["password_hash"]):
+        metrics.inc("gymble_login_failures_total")
+        login_throttle.record_failure(email_key, LOGIN_FREE_FAILURES_PER_EMAIL)
+        if ip_key:
+            login_throttle.record_failure(ip_key, LOGIN_FREE_FAILURES_PER_IP)
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
-    user_obj = User(**user)
-    access_token = create_access_token(data={"sub": user_obj.email})
+    login_throttle.clear(email_key)
+    return issue_tokens(User(**user))
+
+@api_router.post("/auth/refresh", response_model=Token, dependencies=[rate_limited_by_ip("auth")])
+async def refresh_tokens(refresh_data: RefreshTokenRequest):
+    """Exchange a refresh token for a new token pair; the old refresh token cannot be reused"""
+    payload = decode_token(refresh_data.refresh_token, "refresh")
+    await revocation_list.refresh()
+    if revocation_list.is_revoked(payload):
+        raise HTTPException(status_code=401, detail="Token revoked")
     
-    return Token(
-        access_token=access_token,
-        token_type="bearer",
-        user=user_obj.dict(exclude={"password_hash"})
-    )
+    # Used up before anything is issued, so concurrent or replayed refreshes on any worker get 401
+    await revocation_list.consume_token(payload)
+    
+    # Re-read the user so the new access token carries the current role and gym
+    user = await db.users.find_one({"id": payload["id"]})
+    if user is None:
+        raise HTTPException(status_code=401, detail="User not found")
+    
+    return issue_tokens(User(**user))
+
+@api_router.post("/auth/logout")
+async def logout(
+    logout_data: LogoutRequest,
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Revoke the access token and, when given, the refresh token.
+
+    The access token has usually expired by the time an idle client logs out; its
+    signature still identifies the caller, so the refresh token is revoked anyway.
+    """
+    await revocation_list.revoke_token(decode_token(credentials.credentials, "access", verify_exp=False))
+    if logout_data.refresh_token:
+        await revocation_list.revoke_token(decode_token(logout_data.refresh_token, "refresh"))
+    return {"message": "Logged out successfully"}
 
 @api_router.get("/auth/me")
-async def get_current_user_info(current_user: User = Depends(get_current_user)):
-    return current_user.dict(exclude={"password_hash"})
+async def get_current_user_info(current_user: CurrentUser = Depends(get_current_user)):
+    user = await db.users.find_one({"id": current_user.id})
+    if user is None:
+        raise HTTPException(status_code=401, detail="User not found")
+    return User(**user).dict(exclude={"password_hash"})
 
 # Gym Management Routes
 @api_router.post("/gyms", response_model=Gym)
-async def create_gym(gym_data: GymCreate, current_user: User = Depends(get_current_owner)):
+async def create_gym(gym_data: GymCreate, current_user: CurrentUser = Depends(get_current_owner)):
     # Check if owner already has a gym
     existing_gym = await db.gyms.find_one({"owner_id": current_user.id})
     if existing_gym:
@@ -833,6 +2066,7 @@ async def create_gym(gym_data: GymCreate, current_user: User = Depends(get_curre
         {"id": current_user.id},
         {"$set": {"gym_id": gym.id}}
     )
+    await revocation_list.expire_claims(current_user.id)
     
     return gym
 
@@ -843,7 +2077,7 @@ async def get_all_gyms():
     return [Gym(**gym) for gym in gyms]
 
 @api_router.get("/gyms/my", response_model=Gym)
-async def get_my_gym(current_user: User = Depends(get_current_user)):
+async def get_my_gym(current_user: CurrentUser = Depends(get_current_user)):
     if not current_user.gym_id:
         raise HTTPException(status_code=404, detail="No gym found")
     
@@ -854,7 +2088,7 @@ async def get_my_gym(current_user: User = Depends(get_current_user)):
     return Gym(**gym)
 
 @api_router.put("/gyms/my", response_model=Gym)
-async def update_my_gym(gym_update: GymCreate, current_user: User = Depends(get_current_owner)):
+async def update_my_gym(gym_update: GymCreate, current_user: CurrentUser = Depends(get_current_owner)):
     if not current_user.gym_id:
         raise HTTPException(status_code=404, detail="No gym found")
     
@@ -873,7 +2107,7 @@ class PaymentSettingsUpdate(BaseModel):
     qr_code: Optional[str] = None
 
 @api_router.get("/gym/payment-settings", response_model=dict)
-async def get_payment_settings(current_user: User = Depends(get_current_owner_or_staff)):
+async def get_payment_settings(current_user: CurrentUser = Depends(get_current_owner_or_staff)):
     """Get current gym's payment settings"""
     if not current_user.gym_id:
         raise HTTPException(status_code=404, detail="No gym found")
@@ -888,7 +2122,7 @@ async def get_payment_settings(current_user: User = Depends(get_current_owner_or
     }
 
 @api_router.patch("/gym/payment-settings", response_model=dict)
-async def update_payment_settings(settings: PaymentSettingsUpdate, current_user: User = Depends(get_current_owner)):
+async def update_payment_settings(settings: PaymentSettingsUpdate, current_user: CurrentUser = Depends(get_current_owner)):
     """Update gym payment settings"""
     if not current_user.gym_id:
         raise HTTPException(status_code=404, detail="No gym found")
@@ -917,7 +2151,7 @@ async def update_payment_settings(settings: PaymentSettingsUpdate, current_user:
 
 # Plan Management Routes
 @api_router.post("/plans", response_model=Plan)
-async def create_plan(plan_data: PlanCreate, current_user: User = Depends(get_current_owner)):
+async def create_plan(plan_data: PlanCreate, current_user: CurrentUser = Depends(get_current_owner)):
     if not current_user.gym_id:
         raise HTTPException(status_code=400, detail="No gym associated with user")
     
@@ -926,7 +2160,7 @@ async def create_plan(plan_data: PlanCreate, current_user: User = Depends(get_cu
     return plan
 
 @api_router.get("/plans", response_model=List[Plan])
-async def get_plans(current_user: User = Depends(get_current_user)):
+async def get_plans(current_user: CurrentUser = Depends(get_current_user)):
     if not current_user.gym_id:
         return []
     
@@ -940,14 +2174,14 @@ async def get_gym_plans(gym_id: str):
     return [Plan(**plan) for plan in plans]
 
 @api_router.get("/plans/{plan_id}", response_model=Plan)
-async def get_plan(plan_id: str, current_user: User = Depends(get_current_user)):
+async def get_plan(plan_id: str, current_user: CurrentUser = Depends(get_current_user)):
     plan = await db.plans.find_one({"id": plan_id, "gym_id": current_user.gym_id})
     if not plan:
         raise HTTPException(status_code=404, detail="Plan not found")
     return Plan(**plan)
 
 @api_router.put("/plans/{plan_id}", response_model=Plan)
-async def update_plan(plan_id: str, plan_update: PlanCreate, current_user: User = Depends(get_current_owner)):
+async def update_plan(plan_id: str, plan_update: PlanCreate, current_user: CurrentUser = Depends(get_current_owner)):
     plan = await db.plans.find_one({"id": plan_id, "gym_id": current_user.gym_id})
     if not plan:
         raise HTTPException(status_code=404, detail="Plan not found")
@@ -961,7 +2195,7 @@ async def update_plan(plan_id: str, plan_update: PlanCreate, current_user: User
     return Plan(**updated_plan)
 
 @api_router.delete("/plans/{plan_id}")
-async def delete_plan(plan_id: str, current_user: User = Depends(get_current_owner)):
+async def delete_plan(plan_id: str, current_user: CurrentUser = Depends(get_current_owner)):
     await db.plans.update_one(
         {"id": plan_id, "gym_id": current_user.gym_id},
         {"$set": {"is_active": False}}
@@ -970,10 +2204,20 @@ async def delete_plan(plan_id: str, current_user: User = Depends(get_current_own
 
 # Member Management Routes
 @api_router.post("/members", response_model=Member)
-async def create_member(member_data: MemberCreate, current_user: User = Depends(get_current_owner_or_staff)):
+async def create_member(
+    member_data: MemberCreate,
+    current_user: CurrentUser = Depends(get_current_owner_or_staff),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
     if not current_user.gym_id:
         raise HTTPException(status_code=400, detail="No gym associated with user")
     
+    return await run_idempotent(
+        idempotency_key, current_user, "create_member", member_data,
+        lambda: _create_member(member_data, current_user)
+    )
+
+async def _create_member(member_data: MemberCreate, current_user: CurrentUser) -> Member:
     # Check if email already exists
     existing_member = await db.members.find_one({"email": member_data.email, "gym_id": current_user.gym_id})
     if existing_member:
@@ -1006,8 +2250,6 @@ async def create_member(member_data: MemberCreate, current_user: User = Depends(
         gym_id=current_user.gym_id
     )
     
-    await db.users.insert_one(user.dict())
-    
     # Create member
     member = Member(
         **member_data.dict(exclude={"password", "payment_method", "payment_amount"}),
@@ -1017,8 +2259,6 @@ async def create_member(member_data: MemberCreate, current_user: User = Depends(
         end_date=end_date
     )
     
-    await db.members.insert_one(member.dict())
-    
     # Create payment record
     payment = Payment(
         gym_id=current_user.gym_id,
@@ -1030,12 +2270,19 @@ async def create_member(member_data: MemberCreate, current_user: User = Depends(
         plan_name=plan["name"]
     )
     
-    await db.payments.insert_one(payment.dict())
+    # User, member and payment are written together or not at all
+    async def write_member(session):
+        await db.users.insert_one(user.dict(), session=session)
+        await db.members.insert_one(member.dict(), session=session)
+        await db.payments.insert_one(payment.dict(), session=session)
+    
+    await run_transaction(write_member)
+    invalidate_analytics_cache(current_user.gym_id)
     
     return member
 
 @api_router.get("/members", response_model=List[Member])
-async def get_members(status: Optional[str] = None, search: Optional[str] = None, current_user: User = Depends(get_current_owner_or_staff)):
+async def get_members(status: Optional[str] = None, search: Optional[str] = None, current_user: CurrentUser = Depends(get_current_owner_or_staff)):
     """Get members - restricted to owner/staff only"""
 
     if not current_user.gym_id:
@@ -1057,7 +2304,7 @@ async def get_members(status: Optional[str] = None, search: Optional[str] = None
     return [Member(**member) for member in members]
 
 @api_router.get("/gym-members", response_model=List[Member])
-async def get_gym_members(current_user: User = Depends(get_current_user)):
+async def get_gym_members(current_user: CurrentUser = Depends(get_current_user)):
     """Get all members of the gym that the current user belongs to
     This endpoint is accessible by all users including members"""
     if not current_user.gym_id:
@@ -1135,7 +2382,7 @@ async def get_gym_members(current_user: User = Depends(get_current_user)):
     return [Member(**member) for member in members]
 
 @api_router.get("/members/search/{query}")
-async def search_members(query: str, current_user: User = Depends(get_current_owner_or_staff)):
+async def search_members(query: str, current_user: CurrentUser = Depends(get_current_owner_or_staff)):
     if not current_user.gym_id:
         return []
     
@@ -1151,8 +2398,8 @@ async def search_members(query: str, current_user: User = Depends(get_current_ow
     return [Member(**member) for member in members]
 
 # Check-in Routes
-@api_router.post("/checkin", response_model=CheckIn)
-async def check_in_member(checkin_data: CheckInCreate, current_user: User = Depends(get_current_owner_or_staff)):
+@api_router.post("/checkin", response_model=CheckIn, dependencies=[rate_limited("scan")])
+async def check_in_member(checkin_data: CheckInCreate, current_user: CurrentUser = Depends(get_current_owner_or_staff)):
     member = await db.members.find_one({"id": checkin_data.member_id, "gym_id": current_user.gym_id})
     if not member:
         raise HTTPException(status_code=404, detail="Member not found")
@@ -1187,8 +2434,8 @@ async def check_in_member(checkin_data: CheckInCreate, current_user: User = Depe
     
     return checkin
 
-@api_router.get("/checkins/today", response_model=List[CheckIn])
-async def get_today_checkins(current_user: User = Depends(get_current_owner_or_staff)):
+@api_router.get("/checkins/today", response_model=List[CheckIn], dependencies=[rate_limited("dashboard")])
+async def get_today_checkins(current_user: CurrentUser = Depends(get_current_owner_or_staff)):
     if not current_user.gym_id:
         return []
     
@@ -1201,8 +2448,8 @@ async def get_today_checkins(current_user: User = Depends(get_current_owner_or_s
     return [CheckIn(**checkin) for checkin in checkins]
 
 # Dashboard Routes
-@api_router.get("/dashboard/stats", response_model=DashboardStats)
-async def get_dashboard_stats(current_user: User = Depends(get_current_owner_or_staff)):
+@api_router.get("/dashboard/stats", response_model=DashboardStats, dependencies=[rate_limited("dashboard")])
+async def get_dashboard_stats(current_user: CurrentUser = Depends(get_current_owner_or_staff)):
     if not current_user.gym_id:
         return DashboardStats(
             total_members=0, active_members=0, today_checkins=0,
@@ -1233,13 +2480,16 @@ async def get_dashboard_stats(current_user: User = Depends(get_current_owner_or_
     
     # Monthly revenue
     month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    payments = await db.payments.find({
-        "gym_id": current_user.gym_id,
-        "payment_date": {"$gte": month_start},
-        "status": "paid"
-    }).to_list(1000)
+    revenue = await db.payments.aggregate([
+        {"$match": {
+            "gym_id": current_user.gym_id,
+            "payment_date": {"$gte": month_start},
+            "status": "paid"
+        }},
+        {"$group": {"_id": None, "revenue": {"$sum": "$amount"}}}
+    ]).to_list(1)
     
-    monthly_revenue = sum(payment["amount"] for payment in payments)
+    monthly_revenue = revenue[0]["revenue"] if revenue else 0
     
     # Memberships expiring in next 7 days
     next_week = datetime.utcnow() + timedelta(days=7)
@@ -1255,6 +2505,10 @@ async def get_dashboard_stats(current_user: User = Depends(get_current_owner_or_
         "is_active": True
     })
     
+    # Most popular plan by member count
+    members_by_plan = await get_members_by_plan(current_user.gym_id)
+    popular_plan = members_by_plan[0].plan_name if members_by_plan else None
+    
     return DashboardStats(
         total_members=total_members,
         active_members=active_members,
@@ -1262,12 +2516,205 @@ async def get_dashboard_stats(current_user: User = Depends(get_current_owner_or_
         current_checkedin=current_checkedin,
         monthly_revenue=monthly_revenue,
         expiring_soon=expiring_soon,
-        total_plans=total_plans
+        total_plans=total_plans,
+        popular_plan=popular_plan
+    )
+
+# Analytics Routes
+async def get_revenue_by_month(gym_id: str, months: int = 12) -> List[RevenueData]:
+    """Paid revenue grouped by calendar month for the last N months"""
+    async def compute():
+        now = datetime.utcnow()
+        start_month = now.year * 12 + now.month - months
+        since = datetime(start_month // 12, start_month % 12 + 1, 1)
+        rows = await db.payments.aggregate([
+            {"$match": {"gym_id": gym_id, "status": "paid", "payment_date": {"$gte": since}}},
+            {"$group": {
+                "_id": {"$dateToString": {"format": "%Y-%m", "date": "$payment_date"}},
+                "revenue": {"$sum": "$amount"}
+            }},
+            {"$sort": {"_id": 1}}
+        ]).to_list(None)
+        return [RevenueData(month=row["_id"], revenue=row["revenue"]) for row in rows]
+    
+    return await cached_analytics(gym_id, f"revenue_by_month:{months}", compute)
+
+async def get_revenue_by_method(gym_id: str) -> List[PaymentMethodRevenue]:
+    """Paid revenue and payment count grouped by payment method"""
+    async def compute():
+        rows = await db.payments.aggregate([
+            {"$match": {"gym_id": gym_id, "status": "paid"}},
+            {"$group": {"_id": "$payment_method", "revenue": {"$sum": "$amount"}, "count": {"$sum": 1}}},
+            {"$sort": {"revenue": -1}}
+        ]).to_list(None)
+        return [
+            PaymentMethodRevenue(payment_method=row["_id"], revenue=row["revenue"], count=row["count"])
+            for row in rows
+        ]
+    
+    return await cached_analytics(gym_id, "revenue_by_method", compute)
+
+async def get_members_by_plan(gym_id: str) -> List[MembershipData]:
+    """Member count per plan, most popular plan first"""
+    async def compute():
+        rows = await db.members.aggregate([
+            {"$match": {"gym_id": gym_id}},
+            {"$group": {"_id": "$plan_id", "count": {"$sum": 1}}},
+            {"$sort": {"count": -1}},
+            {"$lookup": {"from": "plans", "localField": "_id", "foreignField": "id", "as": "plan"}}
+        ]).to_list(None)
+        return [
+            MembershipData(plan_name=row["plan"][0]["name"] if row["plan"] else "Unknown Plan", count=row["count"])
+            for row in rows
+        ]
+    
+    return await cached_analytics(gym_id, "members_by_plan", compute)
+
+@api_router.get("/analytics/revenue/monthly", response_model=List[RevenueData], dependencies=[rate_limited("dashboard")])
+async def get_monthly_revenue(months: int = 12, current_user: CurrentUser = Depends(get_current_owner_or_staff)):
+    if not current_user.gym_id:
+        return []
+    
+    return await get_revenue_by_month(current_user.gym_id, min(max(months, 1), 60))
+
+@api_router.get("/analytics/revenue/by-method", response_model=List[PaymentMethodRevenue], dependencies=[rate_limited("dashboard")])
+async def get_payment_method_revenue(current_user: CurrentUser = Depends(get_current_owner_or_staff)):
+    if not current_user.gym_id:
+        return []
+    
+    return await get_revenue_by_method(current_user.gym_id)
+
+@api_router.get("/analytics/members-by-plan", response_model=List[MembershipData], dependencies=[rate_limited("dashboard")])
+async def get_plan_membership(current_user: CurrentUser = Depends(get_current_owner_or_staff)):
+    if not current_user.gym_id:
+        return []
+    
+    return await get_members_by_plan(current_user.gym_id)
+
+@api_router.get("/analytics/dashboard", response_model=RevenueAnalytics, dependencies=[rate_limited("dashboard")])
+async def get_dashboard_analytics(months: int = 12, current_user: CurrentUser = Depends(get_current_owner_or_staff)):
+    """All dashboard chart data in a single request"""
+    if not current_user.gym_id:
+        return RevenueAnalytics()
+    
+    return RevenueAnalytics(
+        revenue_by_month=await get_revenue_by_month(current_user.gym_id, min(max(months, 1), 60)),
+        revenue_by_method=await get_revenue_by_method(current_user.gym_id),
+        members_by_plan=await get_members_by_plan(current_user.gym_id)
     )
 
+class GymVersionedCache:
+    """Per-gym in-process cache invalidated through a version counter on the gym document.
+
+    Writers call bump(), which increments `version_field` on the gym and drops
+    the local entry. Other processes read the counter at most every
+    `check_seconds` and reload with `loader(gym_id)` only when it changed.
+    """
+    def __init__(self, version_field: str, loader, check_seconds: float):
+        self.version_field = version_field
+        self.loader = loader
+        self.check_seconds = check_seconds
+        self.entries: dict = {}  # gym_id -> {"version", "checked_at", "value"}
+    
+    async def get(self, gym_id: str) -> tuple:
+        """Return (version, cached value) for a gym"""
+        now = time.monotonic()
+        entry = self.entries.get(gym_id)
+        if entry and now - entry["checked_at"] < self.check_seconds:
+            return entry["version"], entry["value"]
+        
+        gym = await db.gyms.find_one({"id": gym_id}, {"_id": 0, self.version_field: 1})
+        version = gym.get(self.version_field, 0) if gym else 0
+        if entry and entry["version"] == version:
+            entry["checked_at"] = now
+            return version, entry["value"]
+        
+        value = await self.loader(gym_id)
+        self.entries[gym_id] = {"version": version, "checked_at": now, "value": value}
+        return version, value
+    
+    async def bump(self, gym_id: str):
+        await db.gyms.update_one({"id": gym_id}, {"$inc": {self.version_field: 1}})
+        self.entries.pop(gym_id, None)
+
+def cache_etag(*parts) -> str:
+    return f'"{hashlib.md5(":".join(str(part) for part in parts).encode()).hexdigest()}"'
+
 # Announcement Routes
+async def load_announcements(gym_id: str) -> List[Announcement]:
+    documents = await db.announcements.find({
+        "gym_id": gym_id,
+        "is_active": True
+    }).sort("created_at", -1).to_list(1000)
+    return [Announcement(**document) for document in documents]
+
+# Per-gym announcement cache shared by every member of the gym
+announcement_cache = GymVersionedCache("announcement_version", load_announcements, ANNOUNCEMENT_VERSION_CHECK_SECONDS)
+
+async def get_cached_announcements(gym_id: str) -> tuple[int, List[Announcement]]:
+    """Return the gym's announcement version and active announcements, newest first"""
+    return await announcement_cache.get(gym_id)
+
+class AnnouncementSubscription:
+    def __init__(self, gym_id: str, user_id: str):
+        self.gym_id = gym_id
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=ANNOUNCEMENT_STREAM_QUEUE_SIZE)
+
+class InProcessAnnouncementBroker:
+    """Fans announcements out to the connections of one process.
+
+    Each connection gets a bounded queue; a connection whose queue is full is
+    evicted instead of blocking the publisher. Any object with the same async
+    publish/subscribe/unsubscribe methods can replace `announcement_broker`,
+    e.g. a broker backed by a shared message bus for multi-process setups.
+    """
+    def __init__(self):
+        self.subscriptions: dict = {}  # gym_id -> set of AnnouncementSubscription
+        self.published = 0
+        self.evicted = 0
+    
+    async def subscribe(self, gym_id: str, user_id: str) -> AnnouncementSubscription:
+        subscription = AnnouncementSubscription(gym_id, user_id)
+        self.subscriptions.setdefault(gym_id, set()).add(subscription)
+        return subscription
+    
+    async def unsubscribe(self, subscription: AnnouncementSubscription):
+        subscribers = self.subscriptions.get(subscription.gym_id)
+        if subscribers is None:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self.subscriptions[subscription.gym_id]
+    
+    async def publish(self, gym_id: str, message: dict):
+        self.published += 1
+        for subscription in list(self.subscriptions.get(gym_id, ())):
+            try:
+                subscription.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                await self.evict(subscription)
+    
+    async def evict(self, subscription: AnnouncementSubscription):
+        """Drop a slow consumer and tell its stream to close"""
+        self.evicted += 1
+        await self.unsubscribe(subscription)
+        while not subscription.queue.empty():
+            subscription.queue.get_nowait()
+        subscription.queue.put_nowait(None)
+    
+    def metrics(self) -> dict:
+        return {
+            "connections": sum(len(subscribers) for subscribers in self.subscriptions.values()),
+            "connections_by_gym": {gym_id: len(subscribers) for gym_id, subscribers in self.subscriptions.items()},
+            "published": self.published,
+            "evicted": self.evicted
+        }
+
+announcement_broker = InProcessAnnouncementBroker()
+
 @api_router.post("/announcements", response_model=Announcement)
-async def create_announcement(announcement_data: AnnouncementCreate, current_user: User = Depends(get_current_owner)):
+async def create_announcement(announcement_data: AnnouncementCreate, current_user: CurrentUser = Depends(get_current_owner)):
     if not current_user.gym_id:
         raise HTTPException(status_code=400, detail="No gym associated with user")
     
@@ -1278,23 +2725,122 @@ async def create_announcement(announcement_data: AnnouncementCreate, current_use
     )
     
     await db.announcements.insert_one(announcement.dict())
+    
+    # Bump the feed version so every process reloads its cached list
+    await announcement_cache.bump(current_user.gym_id)
+    
+    await announcement_broker.publish(current_user.gym_id, jsonable_encoder(announcement))
     return announcement
 
 @api_router.get("/announcements", response_model=List[Announcement])
-async def get_announcements(current_user: User = Depends(get_current_user)):
+async def get_announcements(current_user: CurrentUser = Depends(get_current_user)):
     if not current_user.gym_id:
         return []
     
-    announcements = await db.announcements.find({
-        "gym_id": current_user.gym_id,
-        "is_active": True
-    }).sort("created_at", -1).to_list(1000)
+    _, announcements = await get_cached_announcements(current_user.gym_id)
+    return announcements
+
+@api_router.get("/announcements/feed")
+async def get_announcement_feed(
+    request: Request,
+    since: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = ANNOUNCEMENT_FEED_PAGE_SIZE,
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """Paginated announcement feed with ETag support.
+
+    `since` returns only announcements created after that time, `cursor` is the
+    `next_cursor` of the previous page. A matching If-None-Match returns 304.
+    """
+    if not current_user.gym_id:
+        return {"version": 0, "announcements": [], "next_cursor": None}
+    
+    version, announcements = await get_cached_announcements(current_user.gym_id)
+    limit = min(max(limit, 1), 200)
+    
+    etag = cache_etag(current_user.gym_id, version, since, cursor, limit)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    
+    items = announcements
+    if since:
+        since = to_naive_utc(since)
+        items = [announcement for announcement in items if announcement.created_at > since]
+    
+    start = 0
+    if cursor:
+        ids = [announcement.id for announcement in items]
+        if cursor not in ids:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        start = ids.index(cursor) + 1
+    
+    page = items[start:start + limit]
+    next_cursor = page[-1].id if page and start + limit < len(items) else None
+    
+    return JSONResponse(
+        content={
+            "version": version,
+            "announcements": jsonable_encoder(page),
+            "next_cursor": next_cursor
+        },
+        headers=headers
+    )
+
+async def announcement_events(gym_id: str, user_id: str):
+    """Server-sent events for one subscriber, with periodic keep-alive comments.
+    
+    The subscription is made here rather than in the route, so a client that disconnects
+    before the response starts never leaves one behind.
+    """
+    subscription = None
+    try:
+        subscription = await announcement_broker.subscribe(gym_id, user_id)
+        yield ": connected\n\n"
+        while True:
+            try:
+                message = await asyncio.wait_for(subscription.queue.get(), timeout=ANNOUNCEMENT_STREAM_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            
+            if message is None:
+                # Evicted as a slow consumer; the client reconnects and catches up via the feed
+                yield "event: evicted\ndata: {}\n\n"
+                break
+            
+            yield f"event: announcement\nid: {message['id']}\ndata: {json.dumps(message)}\n\n"
+    finally:
+        if subscription is not None:
+            await announcement_broker.unsubscribe(subscription)
+
+@api_router.get("/announcements/stream")
+async def stream_announcements(current_user: CurrentUser = Depends(get_current_user)):
+    """Push new announcements of the user's gym as server-sent events"""
+    if not current_user.gym_id:
+        raise HTTPException(status_code=400, detail="No gym associated with user")
     
-    return [Announcement(**announcement) for announcement in announcements]
+    return StreamingResponse(
+        announcement_events(current_user.gym_id, current_user.id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@api_router.get("/announcements/stream/metrics")
+async def get_announcement_stream_metrics(current_user: CurrentUser = Depends(get_current_owner)):
+    """Open announcement stream connections of the owner's gym; process-wide counters are on /metrics"""
+    if not current_user.gym_id:
+        raise HTTPException(status_code=400, detail="No gym associated with user")
+    
+    return {
+        "gym_id": current_user.gym_id,
+        "connections": announcement_broker.metrics()["connections_by_gym"].get(current_user.gym_id, 0)
+    }
 
 # Member-specific routes for the mobile app
 @api_router.get("/members/me", response_model=Member)
-async def get_my_member_profile(current_user: User = Depends(get_current_user)):
+async def get_my_member_profile(current_user: CurrentUser = Depends(get_current_user)):
     """Get current user's member profile"""
     if current_user.role != UserRole.MEMBER:
         raise HTTPException(status_code=403, detail="Only members can access this endpoint")
@@ -1306,7 +2852,7 @@ async def get_my_member_profile(current_user: User = Depends(get_current_user)):
     return Member(**member)
 
 @api_router.put("/members/me", response_model=Member)
-async def update_my_member_profile(member_update: MemberUpdate, current_user: User = Depends(get_current_user)):
+async def update_my_member_profile(member_update: MemberUpdate, current_user: CurrentUser = Depends(get_current_user)):
     """Update current user's member profile"""
     if current_user.role != UserRole.MEMBER:
         raise HTTPException(status_code=403, detail="Only members can access this endpoint")
@@ -1337,12 +2883,13 @@ async def update_my_member_profile(member_update: MemberUpdate, current_user: Us
             {"id": current_user.id},
             {"$set": user_update_data}
         )
+        await revocation_list.expire_claims(current_user.id)
     
     updated_member = await db.members.find_one({"email": current_user.email, "gym_id": current_user.gym_id})
     return Member(**updated_member)
 
 @api_router.post("/subscriptions/manual-update")
-async def update_subscription_manually(subscription_update: SubscriptionUpdate, current_user: User = Depends(get_current_owner_or_staff)):
+async def update_subscription_manually(subscription_update: SubscriptionUpdate, current_user: CurrentUser = Depends(get_current_owner_or_staff)):
     """Manually update a member's subscription"""
     # Verify the member exists and belongs to the gym
     member = await db.members.find_one({"id": subscription_update.memberId, "gym_id": current_user.gym_id})
@@ -1384,8 +2931,38 @@ async def update_subscription_manually(subscription_update: SubscriptionUpdate,
     
     return {"status": "success", "message": "Subscription updated successfully"}
 
+@api_router.post("/payments", response_model=Payment)
+async def create_payment(
+    payment_data: PaymentCreate,
+    current_user: CurrentUser = Depends(get_current_owner_or_staff),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    """Record a payment for a member of the gym"""
+    if not current_user.gym_id:
+        raise HTTPException(status_code=400, detail="No gym associated with user")
+    
+    async def record_payment():
+        member = await db.members.find_one({"id": payment_data.member_id, "gym_id": current_user.gym_id})
+        if not member:
+            raise HTTPException(status_code=404, detail="Member not found")
+        
+        plan = await db.plans.find_one({"id": member["plan_id"]})
+        payment = Payment(
+            **payment_data.dict(),
+            gym_id=current_user.gym_id,
+            member_name=member["name"],
+            plan_id=member["plan_id"],
+            plan_name=plan["name"] if plan else "Unknown Plan"
+        )
+        
+        await db.payments.insert_one(payment.dict())
+        invalidate_analytics_cache(current_user.gym_id)
+        return payment
+    
+    return await run_idempotent(idempotency_key, current_user, "create_payment", payment_data, record_payment)
+
 @api_router.get("/payments/me", response_model=List[Payment])
-async def get_my_payments(current_user: User = Depends(get_current_user)):
+async def get_my_payments(current_user: CurrentUser = Depends(get_current_user)):
     """Get current member's payment history"""
     if current_user.role != UserRole.MEMBER:
         raise HTTPException(status_code=403, detail="Only members can access this endpoint")
@@ -1403,7 +2980,7 @@ async def get_my_payments(current_user: User = Depends(get_current_user)):
     return [Payment(**payment) for payment in payments]
 
 @api_router.get("/announcements/me", response_model=List[Announcement])
-async def get_my_announcements(current_user: User = Depends(get_current_user)):
+async def get_my_announcements(current_user: CurrentUser = Depends(get_current_user)):
     """Get announcements for current member's gym"""
     if current_user.role != UserRole.MEMBER:
         raise HTTPException(status_code=403, detail="Only members can access this endpoint")
@@ -1411,15 +2988,11 @@ async def get_my_announcements(current_user: User = Depends(get_current_user)):
     if not current_user.gym_id:
         return []
     
-    announcements = await db.announcements.find({
-        "gym_id": current_user.gym_id,
-        "is_active": True
-    }).sort("created_at", -1).to_list(1000)
-    
-    return [Announcement(**announcement) for announcement in announcements]
+    _, announcements = await get_cached_announcements(current_user.gym_id)
+    return announcements
 
 @api_router.get("/members/me/stats")
-async def get_my_member_stats(current_user: User = Depends(get_current_user)):
+async def get_my_member_stats(current_user: CurrentUser = Depends(get_current_user)):
     """Get current member's stats (visits, membership status, etc.)"""
     if current_user.role != UserRole.MEMBER:
         raise HTTPException(status_code=403, detail="Only members can access this endpoint")
@@ -1452,8 +3025,8 @@ async def get_my_member_stats(current_user: User = Depends(get_current_user)):
 
 # Attendance Routes
 
-@api_router.get("/attendance/qr-code", response_model=QRCodeResponse)
-async def get_attendance_qr_code(current_user: User = Depends(get_current_owner_or_staff)):
+@api_router.get("/attendance/qr-code", response_model=QRCodeResponse, dependencies=[rate_limited("scan")])
+async def get_attendance_qr_code(current_user: CurrentUser = Depends(get_current_owner_or_staff)):
     """Generate dynamic QR code for gym attendance"""
     if not current_user.gym_id:
         raise HTTPException(status_code=400, detail="No gym associated with user")
@@ -1467,10 +3040,10 @@ async def get_attendance_qr_code(current_user: User = Depends(get_current_owner_
         expires_at=expires_at
     )
 
-@api_router.post("/attendance/mark", response_model=AttendanceRecord)
+@api_router.post("/attendance/mark", response_model=AttendanceRecord, dependencies=[rate_limited("scan")])
 async def mark_attendance(
     attendance_data: AttendanceMarkRequest, 
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """Mark attendance by scanning QR code or entering numeric code (for members)"""
     if current_user.role != UserRole.MEMBER:
@@ -1552,11 +3125,11 @@ async def mark_attendance(
         
         return attendance_record
 
-@api_router.post("/attendance/mark-manual")
+@api_router.post("/attendance/mark-manual", dependencies=[rate_limited("scan")])
 async def mark_attendance_manual(
     member_id: str,
     verification_code: str,
-    current_user: User = Depends(get_current_owner_or_staff)
+    current_user: CurrentUser = Depends(get_current_owner_or_staff)
 ):
     """Mark attendance manually using numeric code (for gym staff/owners)"""
     if not current_user.gym_id:
@@ -1627,9 +3200,16 @@ async def mark_attendance_manual(
         
         return {"action": "check_in", "attendance": attendance_record.dict()}
 
-@api_router.get("/attendance/live-updates")
-async def get_live_attendance_updates(current_user: User = Depends(get_current_owner_or_staff)):
-    """Get live attendance updates with dashboard stats"""
+@api_router.get("/attendance/live-updates", dependencies=[rate_limited("dashboard")])
+async def get_live_attendance_updates(
+    compact: bool = False,
+    current_user: CurrentUser = Depends(get_current_owner_or_staff)
+):
+    """Get live attendance updates with dashboard stats.
+    
+    With compact=true, recent_checkins is omitted (it repeats the first five entries of
+    all_attendance, which is newest first) and null fields are dropped from each record.
+    """
     if not current_user.gym_id:
         return {"error": "No gym associated with user"}
     
@@ -1645,22 +3225,29 @@ async def get_live_attendance_updates(current_user: User = Depends(get_current_o
     currently_in = len([a for a in today_attendance if not a.get("check_out_time")])
     unique_members = len(set([a["member_id"] for a in today_attendance]))
     
-    # Get recent check-ins (last 5)
-    recent_checkins = today_attendance[:5]
+    stats = {
+        "total_checkins": total_checkins,
+        "currently_in": currently_in,
+        "unique_members": unique_members
+    }
+    if compact:
+        return {
+            "timestamp": datetime.utcnow().isoformat(),
+            "stats": stats,
+            "all_attendance": [AttendanceRecord(**record).dict(exclude_none=True) for record in today_attendance]
+        }
     
+    all_attendance = [AttendanceRecord(**record).dict() for record in today_attendance]
     return {
         "timestamp": datetime.utcnow().isoformat(),
-        "stats": {
-            "total_checkins": total_checkins,
-            "currently_in": currently_in,
-            "unique_members": unique_members
-        },
-        "recent_checkins": [AttendanceRecord(**record).dict() for record in recent_checkins],
-        "all_attendance": [AttendanceRecord(**record).dict() for record in today_attendance]
+        "stats": stats,
+        # Last 5 check-ins
+        "recent_checkins": all_attendance[:5],
+        "all_attendance": all_attendance
     }
 
 @api_router.get("/attendance/my-status")
-async def get_my_attendance_status(current_user: User = Depends(get_current_user)):
+async def get_my_attendance_status(current_user: CurrentUser = Depends(get_current_user)):
     """Get current member's attendance status for today"""
     if current_user.role != UserRole.MEMBER:
         raise HTTPException(status_code=403, detail="Only members can access this endpoint")
@@ -1682,7 +3269,7 @@ async def get_my_attendance_status(current_user: User = Depends(get_current_user
         return {"status": "checked_out", "attendance": attendance}
 
 @api_router.get("/attendance/last")
-async def get_last_attendance_action(memberId: str, current_user: User = Depends(get_current_user)):
+async def get_last_attendance_action(memberId: str, current_user: CurrentUser = Depends(get_current_user)):
     """Get the last attendance action for a member"""
     # Verify the user has access to this member's data
     if current_user.role == UserRole.MEMBER and current_user.id != memberId:
@@ -1718,10 +3305,10 @@ async def get_last_attendance_action(memberId: str, current_user: User = Depends
             "timestamp": last_attendance["check_in_time"].isoformat()
         }
 
-@api_router.post("/attendance/scan")
+@api_router.post("/attendance/scan", dependencies=[rate_limited("scan")])
 async def scan_attendance(
     scan_data: AttendanceScanRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """Process attendance scan for check-in or check-out"""
     if not current_user.gym_id:
@@ -1816,10 +3403,10 @@ async def scan_attendance(
     else:
         raise HTTPException(status_code=400, detail="Invalid action. Must be 'check-in' or 'check-out'")
 
-@api_router.post("/attendance")
+@api_router.post("/attendance", dependencies=[rate_limited("scan")])
 async def mark_attendance(
     request: Request,
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """Mark attendance with dynamic action (check-in or check-out)"""
     if not current_user.gym_id:
@@ -1933,8 +3520,8 @@ async def mark_attendance(
     else:
         raise HTTPException(status_code=400, detail="Invalid action. Must be 'check-in' or 'check-out'")
 
-@api_router.get("/attendance/today", response_model=List[AttendanceRecord])
-async def get_today_attendance(current_user: User = Depends(get_current_owner_or_staff)):
+@api_router.get("/attendance/today", response_model=List[AttendanceRecord], dependencies=[rate_limited("dashboard")])
+async def get_today_attendance(current_user: CurrentUser = Depends(get_current_owner_or_staff)):
     """Get today's attendance for gym owners/staff"""
     if not current_user.gym_id:
         return []
@@ -1947,10 +3534,10 @@ async def get_today_attendance(current_user: User = Depends(get_current_owner_or
     
     return [AttendanceRecord(**attendance) for attendance in attendances]
 
-@api_router.get("/attendance/stats/{days}", response_model=List[AttendanceStats])
+@api_router.get("/attendance/stats/{days}", response_model=List[AttendanceStats], dependencies=[rate_limited("dashboard")])
 async def get_attendance_stats(
     days: int = 30, 
-    current_user: User = Depends(get_current_owner_or_staff)
+    current_user: CurrentUser = Depends(get_current_owner_or_staff)
 ):
     """Get attendance statistics for the last N days"""
     if not current_user.gym_id:
@@ -2004,9 +3591,10 @@ async def get_attendance_stats(
 async def get_attendance_calendar(
     year: int, 
     month: int, 
-    current_user: User = Depends(get_current_owner_or_staff)
+    current_user: CurrentUser = Depends(get_current_owner_or_staff)
 ):
     """Get attendance data for calendar view"""
+    import calendar
     if not current_user.gym_id:
         return {"days": []}
     
@@ -2071,9 +3659,112 @@ async def get_attendance_calendar(
         "days": days
     }
 
+# Template Versions
+# Template snapshots are immutable and addressed by a hash of their content, so
+# identical content is stored once and a version body can be cached forever.
+TEMPLATE_BODY_FIELDS = {
+    "workout": list(WorkoutTemplateCreate.__fields__),
+    "diet": list(DietTemplateCreate.__fields__)
+}
+
+def template_version_id(gym_id: str, template_id: str, plan_type: str, body: dict) -> str:
+    canonical = json.dumps(jsonable_encoder(body), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{gym_id}:{template_id}:{plan_type}:{canonical}".encode()).hexdigest()
+
+def template_body(plan_type: str, template: dict) -> dict:
+    return {field: template.get(field) for field in TEMPLATE_BODY_FIELDS[plan_type]}
+
+async def store_template_version(plan_type: str, template: dict, version_id: Optional[str] = None) -> str:
+    """Write the snapshot of a template's current content unless it already exists"""
+    body = template_body(plan_type, template)
+    version_id = version_id or template_version_id(template["gym_id"], template["id"], plan_type, body)
+    snapshot = TemplateVersion(
+        id=version_id,
+        gym_id=template["gym_id"],
+        template_id=template["id"],
+        plan_type=plan_type,
+        version=template.get("version", 1),
+        body=jsonable_encoder(body)
+    )
+    await db.template_versions.update_one({"id": version_id}, {"$setOnInsert": snapshot.dict()}, upsert=True)
+    return version_id
+
+async def pin_template_version(plan_type: str, template) -> str:
+    """Version id an assignment should pin, snapshotting templates created before versioning"""
+    if template.current_version_id:
+        return template.current_version_id
+    
+    version_id = await store_template_version(plan_type, template.dict())
+    collection = db.workout_templates if plan_type == "workout" else db.diet_templates
+    await collection.update_one({"id": template.id}, {"$set": {"current_version_id": version_id}})
+    template.current_version_id = version_id
+    return version_id
+
+@api_router.get("/template-versions/{version_id}", response_model=TemplateVersion)
+async def get_template_version(
+    version_id: str,
+    request: Request,
+    response: Response,
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """Immutable template snapshot; the id is a content hash, so it never changes.
+
+    Cached by the client only: the snapshot belongs to one gym and needs auth. A
+    client that sends this id as If-None-Match already holds it and gets a 304.
+    """
+    headers = {"ETag": f'"{version_id}"', "Cache-Control": "private, max-age=31536000, immutable"}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    
+    snapshot = await db.template_versions.find_one({"id": version_id, "gym_id": current_user.gym_id}, {"_id": 0})
+    if not snapshot:
+        raise HTTPException(status_code=404, detail="Template version not found")
+    
+    response.headers.update(headers)
+    return TemplateVersion(**snapshot)
+
+@api_router.get("/template-versions", response_model=List[TemplateVersion])
+async def get_template_versions(template_id: str, current_user: CurrentUser = Depends(get_current_owner_or_staff)):
+    """All stored snapshots of a template, newest first"""
+    snapshots = await db.template_versions.find(
+        {"template_id": template_id, "gym_id": current_user.gym_id}, {"_id": 0}
+    ).sort("version", -1).to_list(None)
+    return [TemplateVersion(**snapshot) for snapshot in snapshots]
+
 # Workout Template Routes
+async def load_workout_templates(gym_id: str) -> dict:
+    templates = await db.workout_templates.find({"gym_id": gym_id}).sort("created_at", -1).to_list(None)
+    return {template["id"]: WorkoutTemplate(**template) for template in templates}
+
+async def load_diet_templates(gym_id: str) -> dict:
+    templates = await db.diet_templates.find({"gym_id": gym_id}).sort("created_at", -1).to_list(None)
+    return {template["id"]: DietTemplate(**template) for template in templates}
+
+# Per-gym template caches: id -> template (inactive templates included, for existing assignments)
+workout_template_cache = GymVersionedCache("workout_template_version", load_workout_templates, TEMPLATE_VERSION_CHECK_SECONDS)
+diet_template_cache = GymVersionedCache("diet_template_version", load_diet_templates, TEMPLATE_VERSION_CHECK_SECONDS)
+
+async def get_cached_template(cache: GymVersionedCache, gym_id: str, template_id: str):
+    _, templates = await cache.get(gym_id)
+    return templates.get(template_id)
+
+def cached_list_response(request: Request, response: Response, gym_id: str, version: int, templates: dict):
+    """Active templates of a gym, or 304 when the client already has this version"""
+    etag = cache_etag(gym_id, version)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return [template for template in templates.values() if template.is_active]
+
+def cached_template_response(request: Request, response: Response, template):
+    etag = cache_etag(template.id, template.version)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return template
+
 @api_router.post("/workout-templates", response_model=WorkoutTemplate)
-async def create_workout_template(template_data: WorkoutTemplateCreate, current_user: User = Depends(get_current_owner_or_staff)):
+async def create_workout_template(template_data: WorkoutTemplateCreate, current_user: CurrentUser = Depends(get_current_owner_or_staff)):
     if not current_user.gym_id:
         raise HTTPException(status_code=400, detail="No gym associated with user")
     
@@ -2082,63 +3773,59 @@ async def create_workout_template(template_data: WorkoutTemplateCreate, current_
         gym_id=current_user.gym_id,
         created_by=current_user.name
     )
+    template.current_version_id = await store_template_version("workout", template.dict())
     
     await db.workout_templates.insert_one(template.dict())
+    await workout_template_cache.bump(current_user.gym_id)
     return template
 
 @api_router.get("/workout-templates", response_model=List[WorkoutTemplate])
-async def get_workout_templates(current_user: User = Depends(get_current_user)):
+async def get_workout_templates(request: Request, response: Response, current_user: CurrentUser = Depends(get_current_user)):
     if not current_user.gym_id:
         return []
     
-    templates = await db.workout_templates.find({
-        "gym_id": current_user.gym_id,
-        "is_active": True
-    }).sort("created_at", -1).to_list(1000)
-    
-    return [WorkoutTemplate(**template) for template in templates]
+    version, templates = await workout_template_cache.get(current_user.gym_id)
+    return cached_list_response(request, response, current_user.gym_id, version, templates)
 
 @api_router.get("/workout-templates/{template_id}", response_model=WorkoutTemplate)
-async def get_workout_template(template_id: str, current_user: User = Depends(get_current_user)):
-    template = await db.workout_templates.find_one({
-        "id": template_id,
-        "gym_id": current_user.gym_id
-    })
+async def get_workout_template(template_id: str, request: Request, response: Response, current_user: CurrentUser = Depends(get_current_user)):
+    template = await get_cached_template(workout_template_cache, current_user.gym_id, template_id) if current_user.gym_id else None
     
     if not template:
         raise HTTPException(status_code=404, detail="Workout template not found")
     
-    return WorkoutTemplate(**template)
+    return cached_template_response(request, response, template)
 
 @api_router.put("/workout-templates/{template_id}", response_model=WorkoutTemplate)
-async def update_workout_template(template_id: str, template_update: WorkoutTemplateCreate, current_user: User = Depends(get_current_owner_or_staff)):
-    template = await db.workout_templates.find_one({
-        "id": template_id,
-        "gym_id": current_user.gym_id
-    })
+async def update_workout_template(template_id: str, template_update: WorkoutTemplateCreate, current_user: CurrentUser = Depends(get_current_owner_or_staff)):
+    # Copy-on-write: the template points at a new snapshot, older snapshots stay pinned by assignments
+    version_id = template_version_id(current_user.gym_id, template_id, "workout", template_body("workout", template_update.dict()))
+    updated_template = await db.workout_templates.find_one_and_update(
+        {"id": template_id, "gym_id": current_user.gym_id},
+        {"$set": {**template_update.dict(), "current_version_id": version_id}, "$inc": {"version": 1}},
+        return_document=ReturnDocument.AFTER
+    )
     
-    if not template:
+    if not updated_template:
         raise HTTPException(status_code=404, detail="Workout template not found")
     
-    await db.workout_templates.update_one(
-        {"id": template_id},
-        {"$set": template_update.dict()}
-    )
+    await store_template_version("workout", updated_template, version_id)
     
-    updated_template = await db.workout_templates.find_one({"id": template_id})
+    await workout_template_cache.bump(current_user.gym_id)
     return WorkoutTemplate(**updated_template)
 
 @api_router.delete("/workout-templates/{template_id}")
-async def delete_workout_template(template_id: str, current_user: User = Depends(get_current_owner_or_staff)):
+async def delete_workout_template(template_id: str, current_user: CurrentUser = Depends(get_current_owner_or_staff)):
     await db.workout_templates.update_one(
         {"id": template_id, "gym_id": current_user.gym_id},
-        {"$set": {"is_active": False}}
+        {"$set": {"is_active": False}, "$inc": {"version": 1}}
     )
+    await workout_template_cache.bump(current_user.gym_id)
     return {"message": "Workout template deleted successfully"}
 
 # Diet Template Routes
 @api_router.post("/diet-templates", response_model=DietTemplate)
-async def create_diet_template(template_data: DietTemplateCreate, current_user: User = Depends(get_current_owner_or_staff)):
+async def create_diet_template(template_data: DietTemplateCreate, current_user: CurrentUser = Depends(get_current_owner_or_staff)):
     if not current_user.gym_id:
         raise HTTPException(status_code=400, detail="No gym associated with user")
     
@@ -2147,63 +3834,73 @@ async def create_diet_template(template_data: DietTemplateCreate, current_user:
         gym_id=current_user.gym_id,
         created_by=current_user.name
     )
+    template.current_version_id = await store_template_version("diet", template.dict())
     
     await db.diet_templates.insert_one(template.dict())
+    await diet_template_cache.bump(current_user.gym_id)
     return template
 
 @api_router.get("/diet-templates", response_model=List[DietTemplate])
-async def get_diet_templates(current_user: User = Depends(get_current_user)):
+async def get_diet_templates(request: Request, response: Response, current_user: CurrentUser = Depends(get_current_user)):
     if not current_user.gym_id:
         return []
     
-    templates = await db.diet_templates.find({
-        "gym_id": current_user.gym_id,
-        "is_active": True
-    }).sort("created_at", -1).to_list(1000)
-    
-    return [DietTemplate(**template) for template in templates]
+    version, templates = await diet_template_cache.get(current_user.gym_id)
+    return cached_list_response(request, response, current_user.gym_id, version, templates)
 
 @api_router.get("/diet-templates/{template_id}", response_model=DietTemplate)
-async def get_diet_template(template_id: str, current_user: User = Depends(get_current_user)):
-    template = await db.diet_templates.find_one({
-        "id": template_id,
-        "gym_id": current_user.gym_id
-    })
+async def get_diet_template(template_id: str, request: Request, response: Response, current_user: CurrentUser = Depends(get_current_user)):
+    template = await get_cached_template(diet_template_cache, current_user.gym_id, template_id) if current_user.gym_id else None
     
     if not template:
         raise HTTPException(status_code=404, detail="Diet template not found")
     
-    return DietTemplate(**template)
+    return cached_template_response(request, response, template)
 
 @api_router.put("/diet-templates/{template_id}", response_model=DietTemplate)
-async def update_diet_template(template_id: str, template_update: DietTemplateCreate, current_user: User = Depends(get_current_owner_or_staff)):
-    template = await db.diet_templates.find_one({
-        "id": template_id,
-        "gym_id": current_user.gym_id
-    })
+async def update_diet_template(template_id: str, template_update: DietTemplateCreate, current_user: CurrentUser = Depends(get_current_owner_or_staff)):
+    # Copy-on-write: the template points at a new snapshot, older snapshots stay pinned by assignments
+    version_id = template_version_id(current_user.gym_id, template_id, "diet", template_body("diet", template_update.dict()))
+    updated_template = await db.diet_templates.find_one_and_update(
+        {"id": template_id, "gym_id": current_user.gym_id},
+        {"$set": {**template_update.dict(), "current_version_id": version_id}, "$inc": {"version": 1}},
+        return_document=ReturnDocument.AFTER
+    )
     
-    if not template:
+    if not updated_template:
         raise HTTPException(status_code=404, detail="Diet template not found")
     
-    await db.diet_templates.update_one(
-        {"id": template_id},
-        {"$set": template_update.dict()}
-    )
+    await store_template_version("diet", updated_template, version_id)
     
-    updated_template = await db.diet_templates.find_one({"id": template_id})
+    await diet_template_cache.bump(current_user.gym_id)
     return DietTemplate(**updated_template)
 
 @api_router.delete("/diet-templates/{template_id}")
-async def delete_diet_template(template_id: str, current_user: User = Depends(get_current_owner_or_staff)):
+async def delete_diet_template(template_id: str, current_user: CurrentUser = Depends(get_current_owner_or_staff)):
     await db.diet_templates.update_one(
         {"id": template_id, "gym_id": current_user.gym_id},
-        {"$set": {"is_active": False}}
+        {"$set": {"is_active": False}, "$inc": {"version": 1}}
     )
+    await diet_template_cache.bump(current_user.gym_id)
     return {"message": "Diet template deleted successfully"}
 
 # Plan Assignment Routes
+async def get_plan_template(plan_type: str, plan_id: str, gym_id: str):
+    """Fetch the workout or diet template an assignment refers to, from the template cache"""
+    if plan_type == "workout":
+        cache = workout_template_cache
+    elif plan_type == "diet":
+        cache = diet_template_cache
+    else:
+        raise HTTPException(status_code=400, detail="Invalid plan type. Must be 'workout' or 'diet'")
+    
+    plan = await get_cached_template(cache, gym_id, plan_id)
+    if not plan:
+        raise HTTPException(status_code=404, detail=f"{plan_type.title()} plan not found")
+    return plan
+
 @api_router.post("/plan-assignments", response_model=MemberPlanAssignment)
-async def assign_plan_to_member(assignment_data: PlanAssignmentCreate, current_user: User = Depends(get_current_owner_or_staff)):
+async def assign_plan_to_member(assignment_data: PlanAssignmentCreate, current_user: CurrentUser = Depends(get_current_owner_or_staff)):
     if not current_user.gym_id:
         raise HTTPException(status_code=400, detail="No gym associated with user")
     
@@ -2216,25 +3913,9 @@ async def assign_plan_to_member(assignment_data: PlanAssignmentCreate, current_u
     if not member:
         raise HTTPException(status_code=404, detail="Member not found")
     
-    # Get plan details based on type
-    plan_name = ""
-    if assignment_data.plan_type == "workout":
-        plan = await db.workout_templates.find_one({
-            "id": assignment_data.plan_id,
-            "gym_id": current_user.gym_id
-        })
-        plan_name = plan["name"] if plan else "Unknown Workout"
-    elif assignment_data.plan_type == "diet":
-        plan = await db.diet_templates.find_one({
-            "id": assignment_data.plan_id,
-            "gym_id": current_user.gym_id
-        })
-        plan_name = plan["name"] if plan else "Unknown Diet"
-    else:
-        raise HTTPException(status_code=400, detail="Invalid plan type. Must be 'workout' or 'diet'")
-    
-    if not plan:
-        raise HTTPException(status_code=404, detail=f"{assignment_data.plan_type.title()} plan not found")
+    plan = await get_plan_template(assignment_data.plan_type, assignment_data.plan_id, current_user.gym_id)
+    plan_name = plan.name
+    version_id = await pin_template_version(assignment_data.plan_type, plan)
     
     assignment = MemberPlanAssignment(
         gym_id=current_user.gym_id,
@@ -2246,14 +3927,85 @@ async def assign_plan_to_member(assignment_data: PlanAssignmentCreate, current_u
         assigned_by=current_user.name,
         start_date=assignment_data.start_date or datetime.utcnow(),
         end_date=assignment_data.end_date,
-        notes=assignment_data.notes
+        notes=assignment_data.notes,
+        template_version_id=version_id
     )
     
     await db.plan_assignments.insert_one(assignment.dict())
     return assignment
 
+@api_router.post("/plan-assignments/bulk", response_model=BulkPlanAssignmentResult)
+async def bulk_assign_plan(assignment_data: BulkPlanAssignmentCreate, current_user: CurrentUser = Depends(get_current_owner_or_staff)):
+    """Assign one workout or diet plan to a list of members or to a member cohort"""
+    if not current_user.gym_id:
+        raise HTTPException(status_code=400, detail="No gym associated with user")
+    
+    if not assignment_data.member_ids and not assignment_data.member_filter:
+        raise HTTPException(status_code=400, detail="Either member_ids or member_filter is required")
+    
+    plan = await get_plan_template(assignment_data.plan_type, assignment_data.plan_id, current_user.gym_id)
+    version_id = await pin_template_version(assignment_data.plan_type, plan)
+    
+    query = {"gym_id": current_user.gym_id}
+    if assignment_data.member_ids:
+        query["id"] = {"$in": list(set(assignment_data.member_ids))}
+    cohort = assignment_data.member_filter
+    if cohort:
+        if cohort.plan_id:
+            query["plan_id"] = cohort.plan_id
+        if cohort.membership_status:
+            query["membership_status"] = cohort.membership_status.value
+        if cohort.joined_after:
+            query["created_at"] = {"$gte": to_naive_utc(cohort.joined_after)}
+    
+    members = await db.members.find(query, {"_id": 0, "id": 1, "name": 1}).to_list(None)
+    member_ids = [member["id"] for member in members]
+    
+    # Skip members who already have this plan actively assigned
+    existing = await db.plan_assignments.find({
+        "gym_id": current_user.gym_id,
+        "member_id": {"$in": member_ids},
+        "plan_id": assignment_data.plan_id,
+        "is_active": True
+    }, {"_id": 0, "member_id": 1}).to_list(None)
+    already_assigned = {assignment["member_id"] for assignment in existing}
+    
+    start_date = assignment_data.start_date or datetime.utcnow()
+    assignments = [
+        MemberPlanAssignment(
+            gym_id=current_user.gym_id,
+            member_id=member["id"],
+            member_name=member["name"],
+            plan_type=assignment_data.plan_type,
+            plan_id=assignment_data.plan_id,
+            plan_name=plan.name,
+            assigned_by=current_user.name,
+            start_date=start_date,
+            end_date=assignment_data.end_date,
+            notes=assignment_data.notes,
+            template_version_id=version_id
+        )
+        for member in members
+        if member["id"] not in already_assigned
+    ]
+    
+    if assignments:
+        await db.plan_assignments.insert_many([assignment.dict() for assignment in assignments], ordered=False)
+    
+    found = set(member_ids)
+    return BulkPlanAssignmentResult(
+        plan_type=assignment_data.plan_type,
+        plan_id=assignment_data.plan_id,
+        plan_name=plan.name,
+        matched=len(members),
+        assigned=len(assignments),
+        already_assigned=sorted(already_assigned),
+        not_found=sorted(set(assignment_data.member_ids or []) - found),
+        assignment_ids=[assignment.id for assignment in assignments]
+    )
+
 @api_router.get("/plan-assignments/member/{member_id}", response_model=List[MemberPlanAssignment])
-async def get_member_plan_assignments(member_id: str, current_user: User = Depends(get_current_user)):
+async def get_member_plan_assignments(member_id: str, current_user: CurrentUser = Depends(get_current_user)):
     if not current_user.gym_id:
         return []
     
@@ -2275,7 +4027,7 @@ async def get_member_plan_assignments(member_id: str, current_user: User = Depen
     return [MemberPlanAssignment(**assignment) for assignment in assignments]
 
 @api_router.get("/plan-assignments/my", response_model=List[MemberPlanAssignment])
-async def get_my_plan_assignments(current_user: User = Depends(get_current_user)):
+async def get_my_plan_assignments(current_user: CurrentUser = Depends(get_current_user)):
     """Get current member's plan assignments"""
     if current_user.role != UserRole.MEMBER:
         raise HTTPException(status_code=403, detail="Only members can access this endpoint")
@@ -2297,16 +4049,148 @@ async def get_my_plan_assignments(current_user: User = Depends(get_current_user)
     return [MemberPlanAssignment(**assignment) for assignment in assignments]
 
 @api_router.delete("/plan-assignments/{assignment_id}")
-async def remove_plan_assignment(assignment_id: str, current_user: User = Depends(get_current_owner_or_staff)):
+async def remove_plan_assignment(assignment_id: str, current_user: CurrentUser = Depends(get_current_owner_or_staff)):
     await db.plan_assignments.update_one(
         {"id": assignment_id, "gym_id": current_user.gym_id},
-        {"$set": {"is_active": False}}
+        {"$set": {"is_active": False, "updated_at": datetime.utcnow()}}
     )
     return {"message": "Plan assignment removed successfully"}
 
 # Progress Tracking Routes
+def progress_bucket_month(value: datetime) -> str:
+    return value.strftime("%Y-%m")
+
+class ProgressRepository:
+    """Storage of one kind of progress log (workout or diet) for members.
+
+    In "documents" mode every log is its own document in `name`. In "buckets"
+    mode logs are appended to one `<name>_buckets` document per member per
+    month, so a member's full history is read with one small indexed query.
+    """
+    def __init__(self, name: str, date_field: str, model):
+        self.name = name
+        self.date_field = date_field
+        self.model = model
+    
+    @property
+    def documents(self):
+        return db[self.name]
+    
+    @property
+    def buckets(self):
+        return db[f"{self.name}_buckets"]
+    
+    async def insert(self, progress: BaseModel):
+        await self.insert_many([progress])
+    
+    async def insert_many(self, progress_list: List[BaseModel]):
+        """Store several logs with one round trip"""
+        records = [progress.dict() for progress in progress_list]
+        if not records:
+            return
+        
+        if PROGRESS_STORAGE_MODE == "buckets":
+            entries_by_bucket = defaultdict(list)
+            for record in records:
+                bucket = (record["gym_id"], record["member_id"], progress_bucket_month(record[self.date_field]))
+                entries_by_bucket[bucket].append(record)
+            await self.buckets.bulk_write([
+                UpdateOne(
+                    {"gym_id": gym_id, "member_id": member_id, "month": month},
+                    {
+                        "$push": {"entries": {"$each": entries}},
+                        "$max": {"updated_at": max(entry["updated_at"] for entry in entries)}
+                    },
+                    upsert=True
+                )
+                for (gym_id, member_id, month), entries in entries_by_bucket.items()
+            ])
+        else:
+            await self.documents.insert_many(records)
+    
+    async def list_for_member(self, gym_id: str, member_id: str) -> list:
+        """All progress logs of a member, newest first"""
+        if PROGRESS_STORAGE_MODE == "buckets":
+            buckets = await self.buckets.find(
+                {"gym_id": gym_id, "member_id": member_id},
+                {"_id": 0, "entries": 1}
+            ).sort("month", -1).to_list(None)
+            records = [entry for bucket in buckets for entry in bucket["entries"]]
+            records.sort(key=lambda record: record[self.date_field], reverse=True)
+        else:
+            records = await self.documents.find({
+                "member_id": member_id,
+                "gym_id": gym_id
+            }).sort(self.date_field, -1).to_list(1000)
+        
+        return [self.model(**record) for record in records]
+    
+    async def changed_since(self, gym_id: str, member_id: str, since: Optional[tuple], limit: Optional[int]) -> list:
+        """Logs of a member changed after the (updated_at, id) position `since` (all logs when None),
+        oldest change first"""
+        query = {"gym_id": gym_id, "member_id": member_id}
+        
+        if PROGRESS_STORAGE_MODE == "buckets":
+            if since:
+                # A bucket's updated_at is at least that of its newest entry
+                query["updated_at"] = {"$gte": since[0]}
+            buckets = await self.buckets.find(query, {"_id": 0, "entries": 1}).to_list(None)
+            records = [
+                entry for bucket in buckets for entry in bucket["entries"]
+                if since is None or (entry.get("updated_at") and (entry["updated_at"], entry["id"]) > (since[0], since[1] or "\uffff"))
+            ]
+            records.sort(key=lambda record: (record.get("updated_at") or record[self.date_field], record["id"]))
+            records = records[:limit] if limit else records
+        else:
+            if since:
+                query.update(changed_after(since))
+            records = await find_changed(self.documents, query, limit)
+        
+        return [self.model(**record) for record in records]
+
+workout_progress_repository = ProgressRepository("workout_progress", "scheduled_date", WorkoutProgress)
+diet_progress_repository = ProgressRepository("diet_progress", "date", DietProgress)
+
+def build_workout_progress(progress_data: WorkoutProgressCreate, member: dict, assignment: dict, completed_at: Optional[datetime] = None) -> WorkoutProgress:
+    # Normalise free-form weights once so analytics never re-parse strings
+    for exercise in progress_data.exercises_progress:
+        exercise.weights_kg = [parse_weight_kg(weight) for weight in exercise.weights_used]
+    
+    return WorkoutProgress(
+        gym_id=member["gym_id"],
+        member_id=member["id"],
+        assignment_id=progress_data.assignment_id,
+        workout_template_id=assignment["plan_id"],
+        workout_name=assignment["plan_name"],
+        scheduled_date=progress_data.scheduled_date,
+        completed_at=(completed_at or datetime.utcnow()) if progress_data.status == "completed" else None,
+        duration_minutes=progress_data.duration_minutes,
+        exercises_progress=progress_data.exercises_progress,
+        overall_rating=progress_data.overall_rating,
+        notes=progress_data.notes,
+        status=progress_data.status,
+        template_version_id=assignment.get("template_version_id")
+    )
+
+def build_diet_progress(progress_data: DietProgressCreate, member: dict, assignment: dict) -> DietProgress:
+    return DietProgress(
+        gym_id=member["gym_id"],
+        member_id=member["id"],
+        assignment_id=progress_data.assignment_id,
+        diet_template_id=assignment["plan_id"],
+        diet_name=assignment["plan_name"],
+        date=progress_data.date,
+        meals_progress=progress_data.meals_progress,
+        total_calories_consumed=progress_data.total_calories_consumed,
+        water_intake_liters=progress_data.water_intake_liters,
+        overall_rating=progress_data.overall_rating,
+        notes=progress_data.notes,
+        status="completed",
+        template_version_id=assignment.get("template_version_id")
+    )
+
 @api_router.post("/workout-progress", response_model=WorkoutProgress)
-async def log_workout_progress(progress_data: WorkoutProgressCreate, current_user: User = Depends(get_current_user)):
+async def log_workout_progress(progress_data: WorkoutProgressCreate, current_user: CurrentUser = Depends(get_current_user)):
     """Log workout progress for a member"""
     if current_user.role != UserRole.MEMBER:
         raise HTTPException(status_code=403, detail="Only members can log workout progress")
@@ -2331,34 +4215,22 @@ async def log_workout_progress(progress_data: WorkoutProgressCreate, current_use
     if not assignment:
         raise HTTPException(status_code=404, detail="Workout assignment not found")
     
-    # Get workout template details
-    workout_template = await db.workout_templates.find_one({
-        "id": assignment["plan_id"]
-    })
+    # Validate the workout template against the template cache
+    workout_template = await get_cached_template(workout_template_cache, current_user.gym_id, assignment["plan_id"])
     
     if not workout_template:
         raise HTTPException(status_code=404, detail="Workout template not found")
     
-    progress = WorkoutProgress(
-        gym_id=current_user.gym_id,
-        member_id=member["id"],
-        assignment_id=progress_data.assignment_id,
-        workout_template_id=assignment["plan_id"],
-        workout_name=assignment["plan_name"],
-        scheduled_date=progress_data.scheduled_date,
-        completed_at=datetime.utcnow() if progress_data.status == "completed" else None,
-        duration_minutes=progress_data.duration_minutes,
-        exercises_progress=progress_data.exercises_progress,
-        overall_rating=progress_data.overall_rating,
-        notes=progress_data.notes,
-        status=progress_data.status
-    )
+    progress = build_workout_progress(progress_data, member, assignment)
+    
+    if progress.status == "completed":
+        progress.personal_records = await record_exercise_stats(progress)
     
-    await db.workout_progress.insert_one(progress.dict())
+    await workout_progress_repository.insert(progress)
     return progress
 
 @api_router.post("/diet-progress", response_model=DietProgress)
-async def log_diet_progress(progress_data: DietProgressCreate, current_user: User = Depends(get_current_user)):
+async def log_diet_progress(progress_data: DietProgressCreate, current_user: CurrentUser = Depends(get_current_user)):
     """Log diet progress for a member"""
     if current_user.role != UserRole.MEMBER:
         raise HTTPException(status_code=403, detail="Only members can log diet progress")
@@ -2383,34 +4255,20 @@ async def log_diet_progress(progress_data: DietProgressCreate, current_user: Use
     if not assignment:
         raise HTTPException(status_code=404, detail="Diet assignment not found")
     
-    # Get diet template details
-    diet_template = await db.diet_templates.find_one({
-        "id": assignment["plan_id"]
-    })
+    # Validate the diet template against the template cache
+    diet_template = await get_cached_template(diet_template_cache, current_user.gym_id, assignment["plan_id"])
     
     if not diet_template:
         raise HTTPException(status_code=404, detail="Diet template not found")
     
-    progress = DietProgress(
-        gym_id=current_user.gym_id,
-        member_id=member["id"],
-        assignment_id=progress_data.assignment_id,
-        diet_template_id=assignment["plan_id"],
-        diet_name=assignment["plan_name"],
-        date=progress_data.date,
-        meals_progress=progress_data.meals_progress,
-        total_calories_consumed=progress_data.total_calories_consumed,
-        water_intake_liters=progress_data.water_intake_liters,
-        overall_rating=progress_data.overall_rating,
-        notes=progress_data.notes,
-        status="completed"
-    )
+    progress = build_diet_progress(progress_data, member, assignment)
     
-    await db.diet_progress.insert_one(progress.dict())
+    await diet_progress_repository.insert(progress)
+    await record_nutrition_rollup(progress, diet_template)
     return progress
 
 @api_router.get("/workout-progress/my", response_model=List[WorkoutProgress])
-async def get_my_workout_progress(current_user: User = Depends(get_current_user)):
+async def get_my_workout_progress(current_user: CurrentUser = Depends(get_current_user)):
     """Get current member's workout progress"""
     if current_user.role != UserRole.MEMBER:
         raise HTTPException(status_code=403, detail="Only members can access this endpoint")
@@ -2423,15 +4281,10 @@ async def get_my_workout_progress(current_user: User = Depends(get_current_user)
     if not member:
         raise HTTPException(status_code=404, detail="Member profile not found")
     
-    progress_records = await db.workout_progress.find({
-        "member_id": member["id"],
-        "gym_id": current_user.gym_id
-    }).sort("scheduled_date", -1).to_list(1000)
-    
-    return [WorkoutProgress(**record) for record in progress_records]
+    return await workout_progress_repository.list_for_member(current_user.gym_id, member["id"])
 
 @api_router.get("/diet-progress/my", response_model=List[DietProgress])
-async def get_my_diet_progress(current_user: User = Depends(get_current_user)):
+async def get_my_diet_progress(current_user: CurrentUser = Depends(get_current_user)):
     """Get current member's diet progress"""
     if current_user.role != UserRole.MEMBER:
         raise HTTPException(status_code=403, detail="Only members can access this endpoint")
@@ -2444,38 +4297,729 @@ async def get_my_diet_progress(current_user: User = Depends(get_current_user)):
     if not member:
         raise HTTPException(status_code=404, detail="Member profile not found")
     
-    progress_records = await db.diet_progress.find({
-        "member_id": member["id"],
-        "gym_id": current_user.gym_id
-    }).sort("date", -1).to_list(1000)
-    
-    return [DietProgress(**record) for record in progress_records]
+    return await diet_progress_repository.list_for_member(current_user.gym_id, member["id"])
 
 @api_router.get("/member-progress/{member_id}/workout", response_model=List[WorkoutProgress])
-async def get_member_workout_progress(member_id: str, current_user: User = Depends(get_current_owner_or_staff)):
+async def get_member_workout_progress(member_id: str, current_user: CurrentUser = Depends(get_current_owner_or_staff)):
     """Get workout progress for a specific member (for gym owners/staff)"""
     if not current_user.gym_id:
         return []
     
-    progress_records = await db.workout_progress.find({
-        "member_id": member_id,
-        "gym_id": current_user.gym_id
-    }).sort("scheduled_date", -1).to_list(1000)
-    
-    return [WorkoutProgress(**record) for record in progress_records]
+    return await workout_progress_repository.list_for_member(current_user.gym_id, member_id)
 
 @api_router.get("/member-progress/{member_id}/diet", response_model=List[DietProgress])
-async def get_member_diet_progress(member_id: str, current_user: User = Depends(get_current_owner_or_staff)):
+async def get_member_diet_progress(member_id: str, current_user: CurrentUser = Depends(get_current_owner_or_staff)):
     """Get diet progress for a specific member (for gym owners/staff)"""
     if not current_user.gym_id:
         return []
     
-    progress_records = await db.diet_progress.find({
-        "member_id": member_id,
-        "gym_id": current_user.gym_id
-    }).sort("date", -1).to_list(1000)
+    return await diet_progress_repository.list_for_member(current_user.gym_id, member_id)
+
+# Offline Batch Sync
+def apply_sync_attendance(operation: SyncOperation, member: dict, state: dict) -> SyncOperationResult:
+    """Replay one offline check-in/check-out against the in-memory attendance state"""
+    payload = SyncAttendancePayload(**operation.payload)
+    performed_at = to_naive_utc(operation.client_timestamp)
+    at = performed_at.replace(tzinfo=timezone.utc).timestamp()
+    gym_id = member["gym_id"]
+    
+    # Same rule as the online attendance routes
+    if "membership_status" not in member:
+        logger.warning("Member %s does not have a membership_status field", member["id"])
+    elif member["membership_status"] != "active":
+        raise HTTPException(status_code=400, detail="Membership is not active")
     
-    return [DietProgress(**record) for record in progress_records]
+    if payload.qr_code_data:
+        if not validate_qr_code(payload.qr_code_data, gym_id, at=at):
+            raise HTTPException(status_code=400, detail="Invalid or expired QR code")
+        verification_data = payload.qr_code_data
+    elif payload.numeric_code:
+        if not validate_numeric_code(payload.numeric_code, gym_id, at=at):
+            raise HTTPException(status_code=400, detail="Invalid or expired numeric code")
+        verification_data = f"NUMERIC_CODE:{payload.numeric_code}"
+    else:
+        raise HTTPException(status_code=400, detail="Either QR code or numeric code is required")
+    
+    open_record = state["open"]
+    if payload.action == "check-in":
+        if open_record:
+            raise HTTPException(status_code=400, detail="Already checked in")
+        record = AttendanceRecord(
+            gym_id=gym_id,
+            member_id=member["id"],
+            member_name=member["name"],
+            check_in_time=performed_at,
+            qr_code_data=verification_data,
+            device_info=payload.device_info or "Offline sync"
+        ).dict()
+        state["inserts"].append(record)
+        state["open"] = record
+        state["visits"] += 1
+        state["last_visit"] = max(state["last_visit"] or performed_at, performed_at)
+        return SyncOperationResult(op_id=operation.op_id, status="applied", resource_id=record["id"])
+    elif payload.action == "check-out":
+        if not open_record:
+            raise HTTPException(status_code=400, detail="Not checked in")
+        duration = int((performed_at - open_record["check_in_time"]).total_seconds() / 60)
+        if duration < 0:
+            raise HTTPException(status_code=400, detail="Check-out is earlier than check-in")
+        open_record["check_out_time"] = performed_at
+        open_record["duration_minutes"] = duration
+        if not any(record is open_record for record in state["inserts"]):
+            state["closures"].append(UpdateOne(
+                {"id": open_record["id"]},
+                {"$set": {"check_out_time": performed_at, "duration_minutes": duration}}
+            ))
+        state["open"] = None
+        return SyncOperationResult(op_id=operation.op_id, status="applied", resource_id=open_record["id"])
+    
+    raise HTTPException(status_code=400, detail="Invalid action. Must be 'check-in' or 'check-out'")
+
+async def claim_sync_operations(member_id: str, op_ids: List[str], now: datetime) -> tuple[set, dict]:
+    """Claim op_ids for this request through the unique (member_id, op_id) index.
+
+    Returns the op_ids this request won, and the stored records of the others: results of
+    earlier batches, or claims of a concurrent batch still applying them.
+    """
+    records = {
+        record["op_id"]: record
+        for record in await db.sync_operations.find(
+            {"member_id": member_id, "op_id": {"$in": op_ids}}, {"_id": 0}
+        ).to_list(None)
+    }
+    won = set()
+    new_op_ids = [op_id for op_id in op_ids if op_id not in records]
+    if new_op_ids:
+        try:
+            await db.sync_operations.insert_many([
+                {"member_id": member_id, "op_id": op_id, "claimed_at": now, "created_at": now}
+                for op_id in new_op_ids
+            ], ordered=False)
+            won.update(new_op_ids)
+        except BulkWriteError as e:
+            errors = e.details["writeErrors"]
+            if any(error["code"] != 11000 for error in errors):
+                raise
+            # A concurrent batch claimed these first
+            lost = {new_op_ids[error["index"]] for error in errors}
+            won.update(op_id for op_id in new_op_ids if op_id not in lost)
+            for record in await db.sync_operations.find(
+                {"member_id": member_id, "op_id": {"$in": list(lost)}}, {"_id": 0}
+            ).to_list(None):
+                records[record["op_id"]] = record
+    
+    # Take over claims whose request died before storing a result; matching on the old
+    # claimed_at lets only one retry win
+    expired = now - timedelta(seconds=SYNC_CLAIM_LEASE_SECONDS)
+    for op_id, record in list(records.items()):
+        if "result" in record or record["claimed_at"] > expired:
+            continue
+        taken_over = await db.sync_operations.update_one(
+            {"member_id": member_id, "op_id": op_id, "result": {"$exists": False}, "claimed_at": record["claimed_at"]},
+            {"$set": {"claimed_at": now}}
+        )
+        if taken_over.modified_count:
+            won.add(op_id)
+            del records[op_id]
+    return won, records
+
+@api_router.post("/sync/batch", response_model=SyncBatchResponse)
+async def sync_batch(batch: SyncBatchRequest, current_user: CurrentUser = Depends(get_current_user)):
+    """Replay an ordered list of offline operations from the member app.
+
+    Each op_id is claimed before anything is applied, so overlapping retries of the
+    same batch apply every operation once; operations claimed by a concurrent request
+    come back as "pending". Operations are validated against data fetched once for
+    the whole batch and written with bulk inserts. The returned cursor can be passed
+    to the delta sync endpoint.
+    """
+    if current_user.role != UserRole.MEMBER:
+        raise HTTPException(status_code=403, detail="Only members can sync operations")
+    
+    if len(batch.operations) > SYNC_MAX_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"At most {SYNC_MAX_OPERATIONS} operations per batch")
+    
+    cursor = current_change_cursor()
+    member = await db.members.find_one({"email": current_user.email, "gym_id": current_user.gym_id})
+    if not member:
+        raise HTTPException(status_code=404, detail="Member profile not found")
+    
+    now = datetime.utcnow()
+    op_ids = list(dict.fromkeys(operation.op_id for operation in batch.operations))
+    won, records = await claim_sync_operations(member["id"], op_ids, now)
+    
+    # Assignments and templates referenced by the batch, fetched once
+    assignment_ids = list({
+        operation.payload.get("assignment_id")
+        for operation in batch.operations
+        if operation.type != SyncOperationType.ATTENDANCE and operation.payload.get("assignment_id")
+    })
+    assignments = {
+        assignment["id"]: assignment
+        for assignment in await db.plan_assignments.find(
+            {"id": {"$in": assignment_ids}, "member_id": member["id"], "is_active": True}, {"_id": 0}
+        ).to_list(None)
+    }
+    _, workout_templates = await workout_template_cache.get(current_user.gym_id)
+    _, diet_templates = await diet_template_cache.get(current_user.gym_id)
+    
+    open_attendance = None
+    if any(operation.type == SyncOperationType.ATTENDANCE for operation in batch.operations):
+        open_attendance = await db.attendance.find_one(
+            {"gym_id": member["gym_id"], "member_id": member["id"], "check_out_time": None},
+            {"_id": 0},
+            sort=[("check_in_time", -1)]
+        )
+    attendance_state = {"open": open_attendance, "inserts": [], "closures": [], "visits": 0, "last_visit": None}
+    
+    oldest_allowed = now - timedelta(hours=SYNC_MAX_OFFLINE_HOURS)
+    results = []
+    outcomes = {}  # op_id -> result of its first occurrence in this batch
+    workouts = []
+    diets = []
+    for operation in batch.operations:
+        outcome = outcomes.get(operation.op_id)
+        if outcome:
+            results.append(SyncOperationResult(**{**outcome.dict(), "status": "duplicate"}) if outcome.status == "applied" else outcome)
+            continue
+        
+        if operation.op_id not in won:
+            record = records.get(operation.op_id, {})
+            if "result" in record:
+                result = SyncOperationResult(**{**record["result"], "status": "duplicate"})
+            else:
+                result = SyncOperationResult(op_id=operation.op_id, status="pending", detail="Being applied by another sync request")
+            outcomes[operation.op_id] = result
+            results.append(result)
+            continue
+        
+        try:
+            client_time = to_naive_utc(operation.client_timestamp)
+            if client_time < oldest_allowed or client_time > now + timedelta(minutes=5):
+                raise HTTPException(status_code=400, detail="Operation timestamp is outside the offline sync window")
+            
+            if operation.type == SyncOperationType.ATTENDANCE:
+                result = apply_sync_attendance(operation, member, attendance_state)
+            else:
+                is_workout = operation.type == SyncOperationType.WORKOUT_PROGRESS
+                progress_data = (WorkoutProgressCreate if is_workout else DietProgressCreate)(**operation.payload)
+                assignment = assignments.get(progress_data.assignment_id)
+                if not assignment or assignment["plan_type"] != ("workout" if is_workout else "diet"):
+                    raise HTTPException(status_code=404, detail=f"{'Workout' if is_workout else 'Diet'} assignment not found")
+                
+                if is_workout:
+                    if assignment["plan_id"] not in workout_templates:
+                        raise HTTPException(status_code=404, detail="Workout template not found")
+                    progress = build_workout_progress(progress_data, member, assignment, completed_at=client_time)
+                    workouts.append(progress)
+                else:
+                    if assignment["plan_id"] not in diet_templates:
+                        raise HTTPException(status_code=404, detail="Diet template not found")
+                    progress = build_diet_progress(progress_data, member, assignment)
+                    diets.append(progress)
+                result = SyncOperationResult(op_id=operation.op_id, status="applied", resource_id=progress.id)
+        except HTTPException as e:
+            result = SyncOperationResult(op_id=operation.op_id, status="rejected", detail=str(e.detail))
+        except ValidationError as e:
+            result = SyncOperationResult(op_id=operation.op_id, status="rejected", detail=str(e))
+        
+        outcomes[operation.op_id] = result
+        results.append(result)
+    
+    # Bulk writes for everything that was applied
+    for progress in workouts:
+        if progress.status == "completed":
+            progress.personal_records = await record_exercise_stats(progress)
+    await workout_progress_repository.insert_many(workouts)
+    await diet_progress_repository.insert_many(diets)
+    for progress in diets:
+        await record_nutrition_rollup(progress, diet_templates[progress.diet_template_id])
+    
+    if attendance_state["inserts"]:
+        await db.attendance.insert_many(attendance_state["inserts"])
+    if attendance_state["closures"]:
+        await db.attendance.bulk_write(attendance_state["closures"])
+    if attendance_state["visits"]:
+        await db.members.update_one(
+            {"id": member["id"]},
+            {
+                "$max": {"last_visit": attendance_state["last_visit"]},
+                "$inc": {"total_visits": attendance_state["visits"]}
+            }
+        )
+    
+    # Store results on the claims; rejected operations are released so a corrected retry is re-evaluated
+    applied = [result for op_id, result in outcomes.items() if op_id in won and result.status == "applied"]
+    rejected = [op_id for op_id, result in outcomes.items() if op_id in won and result.status == "rejected"]
+    if applied:
+        await db.sync_operations.bulk_write([
+            UpdateOne({"member_id": member["id"], "op_id": result.op_id}, {"$set": {"result": result.dict()}})
+            for result in applied
+        ], ordered=False)
+    if rejected:
+        await db.sync_operations.delete_many({"member_id": member["id"], "op_id": {"$in": rejected}})
+    
+    return SyncBatchResponse(results=results, cursor=cursor)
+
+# Delta Sync
+async def find_changed(collection, query: dict, limit: Optional[int]) -> list:
+    """Documents matching query in (updated_at, id) order, capped at limit when given"""
+    cursor = collection.find(query, {"_id": 0}).sort([("updated_at", 1), ("id", 1)])
+    if limit:
+        cursor = cursor.limit(limit)
+    return await cursor.to_list(None)
+
+@api_router.get("/sync/changes", response_model=DeltaSyncResponse)
+async def get_sync_changes(cursor: Optional[str] = None, current_user: CurrentUser = Depends(get_current_user)):
+    """Everything the member app caches that changed since `cursor`.
+
+    Without a cursor the full current state is returned. With a cursor only
+    documents created, updated or soft-deleted (is_active false) after it are
+    returned, at most SYNC_DELTA_LIMIT per collection; `has_more` tells the
+    client to call again with the returned cursor. Pages are ordered by
+    (updated_at, id). Documents may repeat across pages and should be upserted by id.
+    """
+    if current_user.role != UserRole.MEMBER:
+        raise HTTPException(status_code=403, detail="Only members can access this endpoint")
+    
+    next_cursor = current_change_cursor(lag_ms=SYNC_CURSOR_LAG_MS)
+    since = parse_change_cursor(cursor) if cursor else None
+    limit = SYNC_DELTA_LIMIT if since else None
+    
+    member = await db.members.find_one({"email": current_user.email, "gym_id": current_user.gym_id})
+    if not member:
+        raise HTTPException(status_code=404, detail="Member profile not found")
+    
+    member_query = {"gym_id": current_user.gym_id, "member_id": member["id"]}
+    gym_query = {"gym_id": current_user.gym_id}
+    if since:
+        member_query.update(changed_after(since))
+        gym_query.update(changed_after(since))
+    
+    if not since:
+        # A full snapshot only needs what is still active
+        assignment_query = {**member_query, "is_active": True}
+        announcement_query = {**gym_query, "is_active": True}
+    else:
+        assignment_query = member_query
+        announcement_query = gym_query
+    
+    changes = {
+        "plan_assignments": [MemberPlanAssignment(**record) for record in await find_changed(db.plan_assignments, assignment_query, limit)],
+        "workout_progress": await workout_progress_repository.changed_since(current_user.gym_id, member["id"], since, limit),
+        "diet_progress": await diet_progress_repository.changed_since(current_user.gym_id, member["id"], since, limit),
+        "payments": [Payment(**record) for record in await find_changed(db.payments, member_query, limit)],
+        "announcements": [Announcement(**record) for record in await find_changed(db.announcements, announcement_query, limit)]
+    }
+    
+    # When a collection filled its page, resume right after the earliest last document of a full
+    # page. The id breaks ties, since one batch sync can write a whole page in the same millisecond.
+    truncated = [(items[-1].updated_at, items[-1].id) for items in changes.values() if limit and len(items) >= limit]
+    if truncated:
+        next_cursor = page_change_cursor(*min(truncated))
+    
+    return DeltaSyncResponse(cursor=next_cursor, has_more=bool(truncated), **changes)
+
+# Exercise Analytics
+def exercise_key(exercise_name: str) -> str:
+    return " ".join(exercise_name.lower().split())
+
+def summarize_exercise(exercise: ExerciseProgress) -> dict:
+    """Sets, reps, volume and best sets of one exercise in one session"""
+    reps = exercise.completed_reps
+    weights = exercise.weights_kg or [parse_weight_kg(weight) for weight in exercise.weights_used]
+    loaded_sets = [
+        (set_reps, weights[index])
+        for index, set_reps in enumerate(reps)
+        if index < len(weights) and weights[index] is not None
+    ]
+    return {
+        "sets": max(exercise.completed_sets, len(reps)),
+        "reps": sum(reps),
+        "volume_kg": round(sum(set_reps * weight for set_reps, weight in loaded_sets), 2),
+        "best_weight_kg": max((weight for _, weight in loaded_sets), default=None),
+        "best_e1rm_kg": round(max((estimate_one_rep_max(weight, set_reps) for set_reps, weight in loaded_sets), default=0), 2) or None
+    }
+
+async def record_exercise_stats(progress: WorkoutProgress) -> List[str]:
+    """Fold a completed workout into the member's per-exercise aggregates.
+
+    Each exercise is one atomic upsert, run concurrently, that raises best_e1rm_kg
+    with $max and returns the document as it was before. A session is a personal
+    record only if it beat that state, so concurrent logs cannot both claim one or
+    overwrite a higher record. Returns the exercises that set a new estimated 1RM.
+    """
+    sessions = {}
+    for exercise in progress.exercises_progress:
+        sessions[exercise_key(exercise.exercise_name)] = (exercise.exercise_name, summarize_exercise(exercise))
+    if not sessions:
+        return []
+    
+    performed_at = progress.scheduled_date
+    
+    async def fold(key: str, exercise_name: str, session: dict) -> Optional[dict]:
+        update = {
+            "$setOnInsert": {"gym_id": progress.gym_id, "exercise_name": exercise_name},
+            "$inc": {
+                "sessions": 1,
+                "total_sets": session["sets"],
+                "total_reps": session["reps"],
+                "total_volume_kg": session["volume_kg"]
+            },
+            "$max": {"last_performed": performed_at},
+            "$push": {
+                "dates": {"$each": [performed_at], "$slice": -EXERCISE_HISTORY_LIMIT},
+                "volume_kg": {"$each": [session["volume_kg"]], "$slice": -EXERCISE_HISTORY_LIMIT},
+                "e1rm_kg": {"$each": [session["best_e1rm_kg"] or 0], "$slice": -EXERCISE_HISTORY_LIMIT}
+            }
+        }
+        if session["best_weight_kg"] is not None:
+            update["$max"]["best_weight_kg"] = session["best_weight_kg"]
+        if session["best_e1rm_kg"]:
+            update["$max"]["best_e1rm_kg"] = session["best_e1rm_kg"]
+        return await db.exercise_stats.find_one_and_update(
+            {"member_id": progress.member_id, "key": key},
+            update,
+            projection={"_id": 0, "best_e1rm_kg": 1},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE
+        )
+    
+    keys = list(sessions)
+    before = await asyncio.gather(*(fold(key, *sessions[key]) for key in keys))
+    
+    personal_records = []
+    record_dates = []
+    for key, previous in zip(keys, before):
+        exercise_name, session = sessions[key]
+        if session["best_e1rm_kg"] and session["best_e1rm_kg"] > ((previous or {}).get("best_e1rm_kg") or 0):
+            personal_records.append(exercise_name)
+            # Only while this session still holds the record; a higher concurrent one sets its own date
+            record_dates.append(UpdateOne(
+                {"member_id": progress.member_id, "key": key, "best_e1rm_kg": session["best_e1rm_kg"]},
+                {"$set": {"best_e1rm_date": performed_at}}
+            ))
+    if record_dates:
+        await db.exercise_stats.bulk_write(record_dates, ordered=False)
+    return personal_records
+
+def compute_exercise_trend(stats: dict, window: int) -> dict:
+    """Vectorised trend metrics over the compact per-session history arrays"""
+    import numpy as np
+    dates = np.array(stats.get("dates", []), dtype="datetime64[ms]")
+    volume = np.asarray(stats.get("volume_kg", []), dtype=float)
+    e1rm = np.asarray(stats.get("e1rm_kg", []), dtype=float)
+    if dates.size == 0:
+        return {"exercise_name": stats["exercise_name"], "sessions": 0}
+    
+    order = np.argsort(dates, kind="stable")
+    dates, volume, e1rm = dates[order], volume[order], e1rm[order]
+    days = (dates - dates[0]) / np.timedelta64(1, "D")
+    
+    # Sessions that beat every earlier estimated 1RM
+    running_best = np.maximum.accumulate(e1rm)
+    previous_best = np.concatenate(([0.0], running_best[:-1]))
+    pr_mask = (e1rm > previous_best) & (e1rm > 0)
+    
+    # Progression in kg per week of estimated 1RM, fitted over loaded sessions
+    loaded = e1rm > 0
+    e1rm_slope = None
+    if np.count_nonzero(loaded) >= 2 and np.ptp(days[loaded]) > 0:
+        e1rm_slope = float(np.polyfit(days[loaded], e1rm[loaded], 1)[0] * 7)
+    
+    window = int(min(max(window, 1), volume.size))
+    moving_volume = np.convolve(volume, np.ones(window) / window, mode="valid")
+    
+    weeks = (days // 7).astype(int)
+    weekly_volume = np.bincount(weeks, weights=volume)
+    week_starts = dates[0] + np.arange(weekly_volume.size) * np.timedelta64(7, "D")
+    
+    return {
+        "exercise_name": stats["exercise_name"],
+        "sessions": int(dates.size),
+        "dates": [str(date) for date in dates.astype("datetime64[s]")],
+        "volume_kg": volume.round(2).tolist(),
+        "e1rm_kg": e1rm.round(2).tolist(),
+        "moving_average_volume_kg": moving_volume.round(2).tolist(),
+        "weekly_volume_kg": [
+            {"week_start": str(week_start), "volume_kg": round(float(total), 2)}
+            for week_start, total in zip(week_starts.astype("datetime64[D]"), weekly_volume)
+        ],
+        "personal_record_dates": [str(date) for date in dates[pr_mask].astype("datetime64[s]")],
+        "e1rm_trend_kg_per_week": round(e1rm_slope, 3) if e1rm_slope is not None else None,
+        "best_e1rm_kg": float(e1rm.max()) if loaded.any() else None
+    }
+
+async def get_exercise_summaries(member_id: str) -> List[ExerciseStats]:
+    stats = await db.exercise_stats.find(
+        {"member_id": member_id},
+        {"_id": 0, "dates": 0, "volume_kg": 0, "e1rm_kg": 0}
+    ).sort("last_performed", -1).to_list(None)
+    return [ExerciseStats(**exercise) for exercise in stats]
+
+async def get_exercise_trend(member_id: str, exercise_name: str, window: int) -> dict:
+    stats = await db.exercise_stats.find_one({"member_id": member_id, "key": exercise_key(exercise_name)}, {"_id": 0})
+    if not stats:
+        raise HTTPException(status_code=404, detail="No progress recorded for this exercise")
+    return compute_exercise_trend(stats, window)
+
+@api_router.get("/analytics/exercises/my", response_model=List[ExerciseStats])
+async def get_my_exercise_stats(current_user: CurrentUser = Depends(get_current_user)):
+    """Volume and personal-record summary per exercise for the current member"""
+    if current_user.role != UserRole.MEMBER:
+        raise HTTPException(status_code=403, detail="Only members can access this endpoint")
+    
+    member = await db.members.find_one({"email": current_user.email, "gym_id": current_user.gym_id})
+    if not member:
+        raise HTTPException(status_code=404, detail="Member profile not found")
+    
+    return await get_exercise_summaries(member["id"])
+
+@api_router.get("/analytics/exercises/my/{exercise_name}/trend")
+async def get_my_exercise_trend(exercise_name: str, window: int = 4, current_user: CurrentUser = Depends(get_current_user)):
+    """Volume and estimated 1RM trend of one exercise for the current member"""
+    if current_user.role != UserRole.MEMBER:
+        raise HTTPException(status_code=403, detail="Only members can access this endpoint")
+    
+    member = await db.members.find_one({"email": current_user.email, "gym_id": current_user.gym_id})
+    if not member:
+        raise HTTPException(status_code=404, detail="Member profile not found")
+    
+    return await get_exercise_trend(member["id"], exercise_name, window)
+
+@api_router.get("/member-progress/{member_id}/exercises", response_model=List[ExerciseStats])
+async def get_member_exercise_stats(member_id: str, current_user: CurrentUser = Depends(get_current_owner_or_staff)):
+    """Per-exercise summary for a specific member (for gym owners/staff)"""
+    member = await db.members.find_one({"id": member_id, "gym_id": current_user.gym_id})
+    if not member:
+        raise HTTPException(status_code=404, detail="Member not found")
+    
+    return await get_exercise_summaries(member_id)
+
+@api_router.get("/member-progress/{member_id}/exercises/{exercise_name}/trend")
+async def get_member_exercise_trend(member_id: str, exercise_name: str, window: int = 4, current_user: CurrentUser = Depends(get_current_owner_or_staff)):
+    """Exercise trend for a specific member (for gym owners/staff)"""
+    member = await db.members.find_one({"id": member_id, "gym_id": current_user.gym_id})
+    if not member:
+        raise HTTPException(status_code=404, detail="Member not found")
+    
+    return await get_exercise_trend(member_id, exercise_name, window)
+
+# Nutrition Rollups
+NUTRITION_TARGET_TOLERANCE = 0.1  # a day is "within target" when calories are within 10% of it
+
+def nutrition_periods(date: datetime) -> tuple[str, str]:
+    year, week, _ = date.isocalendar()
+    return f"{year}-W{week:02d}", date.strftime("%Y-%m")
+
+async def record_nutrition_rollup(progress: DietProgress, diet_template: DietTemplate):
+    """Add one diet log to the member's weekly and monthly adherence counters.
+
+    The counters live in a single nutrition_summaries document per member, keyed
+    by period and then by date, so several logs on one day add up to one day and
+    summaries never rescan diet history.
+    """
+    calories = progress.total_calories_consumed
+    if calories is None:
+        meal_calories = [meal.total_calories for meal in progress.meals_progress if meal.total_calories is not None]
+        calories = sum(meal_calories) if meal_calories else None
+    target = diet_template.total_calories
+    
+    sums = {
+        "logs": 1,
+        "meals_completed": len([meal for meal in progress.meals_progress if meal.items_consumed]),
+    }
+    # The plan is the same for every log of the day, so take it once
+    maxima = {"meals_planned": len(diet_template.meals)}
+    if calories is not None:
+        sums["calories_consumed"] = calories
+        if target:
+            maxima["calorie_target"] = target
+    if progress.water_intake_liters is not None:
+        sums["water_liters"] = progress.water_intake_liters
+    
+    week, month = nutrition_periods(progress.date)
+    day = progress.date.strftime("%Y-%m-%d")
+    increments, maximums = {}, {}
+    for period in (f"weeks.{week}", f"months.{month}"):
+        for name, value in sums.items():
+            increments[f"{period}.days.{day}.{name}"] = value
+        for name, value in maxima.items():
+            maximums[f"{period}.days.{day}.{name}"] = value
+    
+    await db.nutrition_summaries.update_one(
+        {"member_id": progress.member_id},
+        {
+            "$setOnInsert": {"gym_id": progress.gym_id},
+            "$set": {"updated_at": datetime.utcnow()},
+            "$inc": increments,
+            "$max": maximums
+        },
+        upsert=True
+    )
+
+def period_counters(period: dict) -> dict:
+    """Per-period totals from its per-date entries, added to counters written before those existed"""
+    counters = {name: value for name, value in period.items() if name != "days"}
+    for day in period.get("days", {}).values():
+        counters["days_logged"] = counters.get("days_logged", 0) + 1
+        for name in ("meals_planned", "meals_completed"):
+            counters[name] = counters.get(name, 0) + day.get(name, 0)
+        if "water_liters" in day:
+            counters["water_days"] = counters.get("water_days", 0) + 1
+            counters["water_liters"] = counters.get("water_liters", 0) + day["water_liters"]
+        if "calories_consumed" not in day:
+            continue
+        calories = day["calories_consumed"]
+        counters["calorie_days"] = counters.get("calorie_days", 0) + 1
+        counters["calories_consumed"] = counters.get("calories_consumed", 0) + calories
+        target = day.get("calorie_target")
+        if target:
+            counters["calorie_target"] = counters.get("calorie_target", 0) + target
+            counters["target_calories_consumed"] = counters.get("target_calories_consumed", 0) + calories
+            within = abs(calories - target) <= target * NUTRITION_TARGET_TOLERANCE
+            counters["days_within_target"] = counters.get("days_within_target", 0) + int(within)
+    return counters
+
+def counter_ratio(counters: dict, numerator: str, denominator: str) -> Optional[float]:
+    if not counters.get(denominator):
+        return None
+    return round(counters.get(numerator, 0) / counters[denominator], 3)
+
+def build_nutrition_periods(periods: dict, limit: int) -> List[NutritionPeriod]:
+    result = []
+    for period in sorted(periods, reverse=True)[:limit]:
+        counters = period_counters(periods[period])
+        result.append(NutritionPeriod(
+            period=period,
+            days_logged=counters.get("days_logged", 0),
+            average_calories=counter_ratio(counters, "calories_consumed", "calorie_days"),
+            calorie_adherence=counter_ratio(counters, "target_calories_consumed", "calorie_target"),
+            days_within_target=counters.get("days_within_target", 0),
+            average_water_liters=counter_ratio(counters, "water_liters", "water_days"),
+            completion_ratio=counter_ratio(counters, "meals_completed", "meals_planned")
+        ))
+    return result
+
+async def get_nutrition_summary(member_id: str, periods: int) -> NutritionSummary:
+    summary = await db.nutrition_summaries.find_one({"member_id": member_id}, {"_id": 0})
+    if not summary:
+        return NutritionSummary(member_id=member_id)
+    
+    periods = min(max(periods, 1), 120)
+    return NutritionSummary(
+        member_id=member_id,
+        weekly=build_nutrition_periods(summary.get("weeks", {}), periods),
+        monthly=build_nutrition_periods(summary.get("months", {}), periods),
+        updated_at=summary.get("updated_at")
+    )
+
+@api_router.get("/nutrition/summary/my", response_model=NutritionSummary)
+async def get_my_nutrition_summary(periods: int = 12, current_user: CurrentUser = Depends(get_current_user)):
+    """Weekly and monthly diet adherence for the current member"""
+    if current_user.role != UserRole.MEMBER:
+        raise HTTPException(status_code=403, detail="Only members can access this endpoint")
+    
+    member = await db.members.find_one({"email": current_user.email, "gym_id": current_user.gym_id})
+    if not member:
+        raise HTTPException(status_code=404, detail="Member profile not found")
+    
+    return await get_nutrition_summary(member["id"], periods)
+
+@api_router.get("/member-progress/{member_id}/nutrition", response_model=NutritionSummary)
+async def get_member_nutrition_summary(member_id: str, periods: int = 12, current_user: CurrentUser = Depends(get_current_owner_or_staff)):
+    """Weekly and monthly diet adherence for a specific member (for gym owners/staff)"""
+    member = await db.members.find_one({"id": member_id, "gym_id": current_user.gym_id})
+    if not member:
+        raise HTTPException(status_code=404, detail="Member not found")
+    
+    return await get_nutrition_summary(member_id, periods)
+
+# Export Routes
+MEMBER_EXPORT_COLUMNS = [field for field in Member.__fields__ if field != "password_hash"]
+PAYMENT_EXPORT_COLUMNS = list(Payment.__fields__)
+ATTENDANCE_EXPORT_COLUMNS = list(AttendanceRecord.__fields__)
+
+@api_router.get("/exports/members")
+async def export_members(
+    format: ExportFormat = ExportFormat.CSV,
+    status: Optional[MembershipStatus] = None,
+    current_user: CurrentUser = Depends(get_current_owner_or_staff)
+):
+    """Stream all members of the gym as CSV or NDJSON"""
+    if not current_user.gym_id:
+        raise HTTPException(status_code=400, detail="No gym associated with user")
+    
+    query = {"gym_id": current_user.gym_id}
+    if status:
+        query["membership_status"] = status.value
+    
+    cursor = db.members.find(query, {"_id": 0, "password_hash": 0}).sort("created_at", 1).batch_size(EXPORT_BATCH_SIZE)
+    return export_response(cursor, MEMBER_EXPORT_COLUMNS, format, "members")
+
+@api_router.get("/exports/payments")
+async def export_payments(
+    format: ExportFormat = ExportFormat.CSV,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    current_user: CurrentUser = Depends(get_current_owner_or_staff)
+):
+    """Stream payments of the gym, optionally filtered by payment_date range"""
+    if not current_user.gym_id:
+        raise HTTPException(status_code=400, detail="No gym associated with user")
+    
+    query = {"gym_id": current_user.gym_id}
+    payment_date = date_range_filter(start_date, end_date)
+    if payment_date:
+        query["payment_date"] = payment_date
+    
+    cursor = db.payments.find(query, {"_id": 0}).sort("payment_date", 1).batch_size(EXPORT_BATCH_SIZE)
+    return export_response(cursor, PAYMENT_EXPORT_COLUMNS, format, "payments")
+
+@api_router.get("/exports/attendance")
+async def export_attendance(
+    format: ExportFormat = ExportFormat.CSV,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    current_user: CurrentUser = Depends(get_current_owner_or_staff)
+):
+    """Stream attendance records of the gym, optionally filtered by check_in_time range"""
+    if not current_user.gym_id:
+        raise HTTPException(status_code=400, detail="No gym associated with user")
+    
+    query = {"gym_id": current_user.gym_id}
+    check_in_time = date_range_filter(start_date, end_date)
+    if check_in_time:
+        query["check_in_time"] = check_in_time
+    
+    cursor = db.attendance.find(query, {"_id": 0}).sort("check_in_time", 1).batch_size(EXPORT_BATCH_SIZE)
+    return export_response(cursor, ATTENDANCE_EXPORT_COLUMNS, format, "attendance")
+
+# Query Monitoring Routes
+async def explain_slow_queries():
+    """Run explain once per slow shape and remember whether its winning plan scans the collection"""
+    for key, command in query_monitor.unexplained():
+        try:
+            explain = await db.command("explain", command, verbosity="queryPlanner")
+            stages = winning_plan_stages(explain)
+            plan = {"stages": stages, "collection_scan": "COLLSCAN" in stages}
+        except Exception as e:
+            plan = {"error": str(e)}
+        query_monitor.set_plan(key, plan)
+
+@app.get("/query-stats", include_in_schema=False)
+async def get_query_stats(explain: bool = False):
+    """MongoDB latency per collection/operation and the slowest filter shapes seen by this process.
+    
+    With explain=true every slow shape not yet explained is run through explain, so shapes whose
+    winning plan is a COLLSCAN point at a missing index. Process-wide, so it is served beside
+    /metrics rather than to gym owners, and only when QUERY_STATS_ENABLED is set.
+    """
+    if not QUERY_STATS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if explain:
+        await explain_slow_queries()
+    return query_monitor.report()
 
 # Include the router in the main app
 app.include_router(api_router)
@@ -2488,6 +5032,41 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def ensure_indexes():
+    """Create the compound indexes that range scans and sorted exports rely on"""
+    await db.members.create_index([("gym_id", 1), ("created_at", 1)])
+    await db.members.create_index([("gym_id", 1), ("plan_id", 1)])
+    await db.plans.create_index("id")
+    await db.payments.create_index([("gym_id", 1), ("payment_date", 1)])
+    await db.payments.create_index([("gym_id", 1), ("status", 1), ("payment_date", 1)])
+    await db.attendance.create_index([("gym_id", 1), ("check_in_time", 1)])
+    await db.idempotency_keys.create_index([("user_id", 1), ("key", 1)], unique=True)
+    await db.idempotency_keys.create_index("created_at", expireAfterSeconds=IDEMPOTENCY_KEY_TTL_SECONDS)
+    await db.workout_progress.create_index([("member_id", 1), ("gym_id", 1), ("scheduled_date", -1)])
+    await db.diet_progress.create_index([("member_id", 1), ("gym_id", 1), ("date", -1)])
+    await db.exercise_stats.create_index([("member_id", 1), ("key", 1)], unique=True)
+    await db.nutrition_summaries.create_index("member_id", unique=True)
+    await db.plan_assignments.create_index([("member_id", 1), ("gym_id", 1), ("is_active", 1), ("assigned_at", -1)])
+    await db.sync_operations.create_index([("member_id", 1), ("op_id", 1)], unique=True)
+    await db.template_versions.create_index("id", unique=True)
+    await db.template_versions.create_index([("template_id", 1), ("version", -1)])
+    for collection in (db.plan_assignments, db.workout_progress, db.diet_progress, db.payments,
+                       db.workout_progress_buckets, db.diet_progress_buckets):
+        await collection.create_index([("member_id", 1), ("updated_at", 1)])
+    await db.announcements.create_index([("gym_id", 1), ("updated_at", 1)])
+    await db.sync_operations.create_index("created_at", expireAfterSeconds=SYNC_OPERATION_TTL_SECONDS)
+    await db.revoked_tokens.create_index("expires_at", expireAfterSeconds=0)
+    if RATE_LIMIT_BACKEND == "mongo":
+        # Idle buckets are full again long before this
+        await db.rate_limits.create_index("updated_at", expireAfterSeconds=3600)
+    await db.workout_progress_buckets.create_index([("gym_id", 1), ("member_id", 1), ("month", -1)], unique=True)
+    await db.diet_progress_buckets.create_index([("gym_id", 1), ("member_id", 1), ("month", -1)], unique=True)
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
+    """Runs after the server has stopped accepting connections and drained in-flight requests"""
+    global client, db
+    if client is not None:
+        client.close()
+    client, db = None, None
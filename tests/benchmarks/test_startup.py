@@ -0,0 +1,23 @@
+"""Cold-start budget for the API process.
+
+Imports server.py in fresh interpreters under -X importtime (see backend/import_profile.py)
+and fails when the import is slower than IMPORT_TIME_BUDGET_MS, or when a module that
+should load lazily is imported up front. Run the profile by hand for the full breakdown:
+
+    cd backend && python import_profile.py
+"""
+import os
+
+from import_profile import LAZY_MODULES, profile_imports
+
+# Generous enough for a shared CI runner; tighten it per runner type with the env var
+IMPORT_TIME_BUDGET_MS = float(os.environ.get("IMPORT_TIME_BUDGET_MS", "1500"))
+
+def test_server_import_stays_within_budget():
+    report = profile_imports("server", runs=3)
+
+    summary = ", ".join(f"{entry['module']} {entry['cumulative_ms']:.0f}ms" for entry in report["top_direct_imports"][:5])
+    assert report["import_ms"] <= IMPORT_TIME_BUDGET_MS, (
+        f"import server took {report['import_ms']:.0f}ms, budget {IMPORT_TIME_BUDGET_MS:.0f}ms; slowest: {summary}"
+    )
+    assert report["lazy_modules_loaded"] == [], f"imported eagerly: {report['lazy_modules_loaded']} (expected lazy: {LAZY_MODULES})"
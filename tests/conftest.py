@@ -0,0 +1,210 @@
+"""Shared pytest setup: make backend/server.py importable without a configured .env, and
+run the FastAPI app in-process against an in-memory MongoDB stand-in.
+
+Fixtures:
+
+- mock_db: the raw in-memory database (mongomock-motor). Seed test data through it;
+  those writes are not counted. The stand-in is not bound to an event loop, so
+  tests seed it synchronously with asyncio.run().
+- query_counter: counts the round trips server.py makes through `server.db`.
+  `with query_counter.assert_max(7): ...` fails the test when a block makes more.
+- api_client: a TestClient for `server.app` with `server.db` set to the stand-in.
+- gym: an owner with a gym and two plans, plus the owner's auth headers.
+- member: an active member of that gym with a member login, plus its auth headers.
+"""
+import asyncio
+import os
+import sys
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from datetime import datetime, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+# server.py reads the JWT secret at import time; MONGO_URL is only needed by the startup hook,
+# which the fixtures below never run
+os.environ.setdefault("JWT_SECRET_KEY", "test-secret-key-of-at-least-32-bytes")
+
+# Collection methods that return a cursor: one round trip is counted when the cursor is created
+CURSOR_METHODS = {"find", "aggregate", "list_indexes"}
+
+class QueryCounter:
+    """Round trips made through CountingDatabase, as (collection, operation) pairs"""
+    def __init__(self):
+        self.calls = []
+
+    @property
+    def count(self):
+        return len(self.calls)
+
+    def record(self, collection, operation):
+        self.calls.append((collection, operation))
+
+    def reset(self):
+        self.calls.clear()
+
+    @contextmanager
+    def assert_max(self, limit):
+        start = len(self.calls)
+        yield
+        made = self.calls[start:]
+        assert len(made) <= limit, (
+            f"expected at most {limit} MongoDB round trips, got {len(made)}:\n"
+            + "\n".join(f"  {collection}.{operation}" for collection, operation in made)
+        )
+
+class CountingCollection:
+    """Motor collection proxy that records every call that would reach the server"""
+    def __init__(self, collection, counter):
+        self._collection = collection
+        self._counter = counter
+
+    def __getattr__(self, name):
+        attribute = getattr(self._collection, name)
+        if not callable(attribute) or name.startswith("_") or name == "with_options":
+            return attribute
+
+        collection_name = self._collection.name
+        counter = self._counter
+
+        if name in CURSOR_METHODS:
+            def cursor_method(*args, **kwargs):
+                counter.record(collection_name, name)
+                return attribute(*args, **kwargs)
+            return cursor_method
+
+        async def method(*args, **kwargs):
+            counter.record(collection_name, name)
+            return await attribute(*args, **kwargs)
+        return method
+
+class CountingDatabase:
+    """Database proxy handing out CountingCollections, so server.py code runs unchanged"""
+    def __init__(self, database, counter):
+        self._database = database
+        self._counter = counter
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def __getitem__(self, name):
+        return CountingCollection(self._database[name], self._counter)
+
+    async def command(self, *args, **kwargs):
+        self._counter.record("$cmd", args[0] if args else "command")
+        return await self._database.command(*args, **kwargs)
+
+@pytest.fixture
+def query_counter():
+    return QueryCounter()
+
+@pytest.fixture
+def mock_db(monkeypatch, query_counter):
+    from mongomock_motor import AsyncMongoMockClient
+
+    import server
+
+    database = AsyncMongoMockClient()["gymble_test"]
+    monkeypatch.setattr(server, "db", CountingDatabase(database, query_counter))
+    # mongomock has no replica set, so writes run without a session
+    monkeypatch.setattr(server, "transactions_supported", False)
+
+    # Module-level caches and rate-limit buckets must not leak between tests
+    monkeypatch.setattr(server, "rate_limit_backend", server.InMemoryRateLimitBackend())
+    monkeypatch.setattr(server, "login_throttle", server.LoginThrottle())
+    revocation_list = server.TokenRevocationList(server.TOKEN_REVOCATION_CHECK_SECONDS)
+    revocation_list.loaded_at = time.monotonic()  # start with an empty, freshly loaded list
+    monkeypatch.setattr(server, "revocation_list", revocation_list)
+    server.analytics_cache.clear()
+    for value in vars(server).values():
+        if isinstance(value, server.GymVersionedCache):
+            value.entries.clear()
+    return database
+
+@pytest.fixture
+def api_client(mock_db):
+    from fastapi.testclient import TestClient
+
+    import server
+
+    # Not used as a context manager: startup hooks would build indexes on the stand-in
+    return TestClient(server.app)
+
+@lru_cache(maxsize=None)
+def password_hash(password):
+    """bcrypt is slow on purpose; hash each test password once per session"""
+    import server
+
+    return server.hash_password(password)
+
+def auth_headers(user):
+    import server
+
+    return {"Authorization": f"Bearer {server.issue_tokens(user).access_token}"}
+
+@pytest.fixture
+def gym(mock_db):
+    """An owner with a gym and two plans, inserted directly into the stand-in"""
+    import server
+
+    owner = server.User(
+        email="owner@gym.com",
+        password_hash=password_hash("password123"),
+        name="Gym Owner",
+        phone="+91 9876543210",
+        role=server.UserRole.OWNER,
+    )
+    gym = server.Gym(name="Test Gym", owner_id=owner.id, address="1 Test Street", phone="+91 9876543210", email=owner.email)
+    owner.gym_id = gym.id
+    plans = [
+        server.Plan(gym_id=gym.id, name="Basic Plan", description="Monthly", price=1500, duration_days=30, plan_type=server.PlanType.BASIC),
+        server.Plan(gym_id=gym.id, name="VIP Plan", description="Yearly", price=18000, duration_days=365, plan_type=server.PlanType.VIP),
+    ]
+
+    asyncio.run(mock_db.users.insert_one(owner.dict()))
+    asyncio.run(mock_db.gyms.insert_one(gym.dict()))
+    asyncio.run(mock_db.plans.insert_many([plan.dict() for plan in plans]))
+    return SimpleNamespace(owner=owner, gym=gym, plans=plans, headers=auth_headers(owner))
+
+@pytest.fixture
+def member(mock_db, gym):
+    """A member of the gym with a user account, inserted directly into the stand-in"""
+    import server
+
+    # mongomock cannot $max against a null last_visit
+    record = insert_members(mock_db, gym, 1, last_visit=datetime.utcnow() - timedelta(days=1))[0]
+    user = server.User(
+        email=record.email, password_hash="x", name=record.name, phone=record.phone,
+        role=server.UserRole.MEMBER, gym_id=gym.gym.id
+    )
+    asyncio.run(mock_db.users.insert_one(user.dict()))
+    return SimpleNamespace(member=record, user=user, headers=auth_headers(user))
+
+def insert_members(mock_db, gym, count, plan=None, **overrides):
+    """Insert `count` Member documents into the gym and return them"""
+    import server
+
+    now = datetime.utcnow()
+    members = [
+        server.Member(**{
+            "gym_id": gym.gym.id,
+            "name": f"Member {index}",
+            "email": f"member{index}@example.com",
+            "phone": "+91 9876543211",
+            "plan_id": (plan or gym.plans[0]).id,
+            "end_date": now + timedelta(days=30),
+            **overrides,
+        })
+        for index in range(count)
+    ]
+    if members:
+        asyncio.run(mock_db.members.insert_many([member.dict() for member in members]))
+    return members
@@ -0,0 +1,37 @@
+"""Announcement stream subscriptions and per-gym connection counts"""
+import asyncio
+
+import server
+
+def test_stream_that_never_starts_leaves_no_subscription(monkeypatch):
+    broker = server.InProcessAnnouncementBroker()
+    monkeypatch.setattr(server, "announcement_broker", broker)
+
+    events = server.announcement_events("gym-1", "user-1")
+    asyncio.run(events.aclose())
+
+    assert broker.subscriptions == {}
+
+def test_closed_stream_unsubscribes(monkeypatch):
+    broker = server.InProcessAnnouncementBroker()
+    monkeypatch.setattr(server, "announcement_broker", broker)
+
+    async def open_and_close():
+        events = server.announcement_events("gym-1", "user-1")
+        assert await events.__anext__() == ": connected\n\n"
+        assert broker.metrics()["connections"] == 1
+        await events.aclose()
+
+    asyncio.run(open_and_close())
+
+    assert broker.subscriptions == {}
+
+def test_stream_metrics_only_cover_the_owners_gym(api_client, gym, monkeypatch):
+    broker = server.InProcessAnnouncementBroker()
+    monkeypatch.setattr(server, "announcement_broker", broker)
+    asyncio.run(broker.subscribe(gym.gym.id, "member-1"))
+    asyncio.run(broker.subscribe("other-gym", "member-2"))
+
+    response = api_client.get("/api/announcements/stream/metrics", headers=gym.headers)
+
+    assert response.json() == {"gym_id": gym.gym.id, "connections": 1}
@@ -0,0 +1,93 @@
+"""Claims-carrying access tokens, refresh rotation and revocation"""
+import asyncio
+from datetime import timedelta
+
+import server
+from tests.conftest import auth_headers
+
+def login(api_client):
+    response = api_client.post("/api/auth/login", json={"email": "owner@gym.com", "password": "password123"})
+    assert response.status_code == 200
+    return response.json()
+
+def test_owner_routes_authorize_from_token_claims(api_client, gym, query_counter):
+    api_client.get("/api/dashboard/stats", headers=gym.headers)
+
+    assert ("users", "find_one") not in query_counter.calls
+
+def test_refresh_rotates_the_refresh_token(api_client, gym):
+    tokens = login(api_client)
+
+    refreshed = api_client.post("/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    reused = api_client.post("/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+
+    assert refreshed.status_code == 200
+    assert refreshed.json()["access_token"] != tokens["access_token"]
+    assert reused.status_code == 401
+
+def test_refresh_token_is_not_an_access_token(api_client, gym):
+    tokens = login(api_client)
+
+    response = api_client.get("/api/auth/me", headers={"Authorization": f"Bearer {tokens['refresh_token']}"})
+
+    assert response.status_code == 401
+
+def test_logout_revokes_the_access_token(api_client, gym):
+    tokens = login(api_client)
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+
+    assert api_client.post("/api/auth/logout", json={"refresh_token": tokens["refresh_token"]}, headers=headers).status_code == 200
+
+    assert api_client.get("/api/auth/me", headers=headers).status_code == 401
+    assert api_client.post("/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+
+def test_expired_claims_are_reloaded_from_the_database(api_client, mock_db, gym, query_counter):
+    asyncio.run(mock_db.users.update_one({"id": gym.owner.id}, {"$set": {"role": "member"}}))
+    asyncio.run(server.revocation_list.expire_claims(gym.owner.id))
+
+    response = api_client.get("/api/dashboard/stats", headers=gym.headers)
+
+    assert response.status_code == 403
+    assert ("users", "find_one") in query_counter.calls
+
+def test_tokens_issued_after_the_change_use_claims_again(api_client, gym, query_counter):
+    asyncio.run(server.revocation_list.expire_claims(gym.owner.id))
+    server.revocation_list.users[gym.owner.id] -= 5  # the change happened a few seconds ago
+
+    api_client.get("/api/dashboard/stats", headers=auth_headers(gym.owner))
+
+    assert ("users", "find_one") not in query_counter.calls
+
+def test_refresh_replay_is_rejected_before_this_process_reloads(api_client, gym):
+    tokens = login(api_client)
+    assert api_client.post("/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 200
+
+    # Another worker has not reloaded its revocation list yet
+    server.revocation_list.token_ids.clear()
+    replay = api_client.post("/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+
+    assert replay.status_code == 401
+
+def test_logout_with_an_expired_access_token_revokes_the_refresh_token(api_client, gym):
+    tokens = login(api_client)
+    expired = server.create_access_token(
+        data={"sub": gym.owner.email, "id": gym.owner.id, "type": "access"},
+        expires_delta=timedelta(minutes=-1)
+    )
+
+    response = api_client.post(
+        "/api/auth/logout", json={"refresh_token": tokens["refresh_token"]},
+        headers={"Authorization": f"Bearer {expired}"}
+    )
+
+    assert response.status_code == 200
+    assert api_client.post("/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+
+def test_used_refresh_tokens_are_not_loaded_into_memory(api_client, gym):
+    tokens = login(api_client)
+    api_client.post("/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+
+    server.revocation_list.loaded_at = float("-inf")
+    asyncio.run(server.revocation_list.refresh())
+
+    assert server.revocation_list.token_ids == set()
@@ -0,0 +1,63 @@
+"""Negotiated response compression, response-size metrics and compact live updates"""
+import asyncio
+from datetime import datetime
+
+import server
+from tests.conftest import insert_members
+
+def test_negotiate_encoding_honours_q_values(monkeypatch):
+    monkeypatch.setattr(server, "brotli", None)
+
+    assert server.negotiate_encoding("gzip, deflate, br") == "gzip"
+    assert server.negotiate_encoding("gzip;q=0, deflate") is None
+    assert server.negotiate_encoding("*") == "gzip"
+    assert server.negotiate_encoding("") is None
+
+def test_large_list_is_gzipped(api_client, mock_db, gym):
+    insert_members(mock_db, gym, 30)
+
+    response = api_client.get("/api/gym-members", headers={**gym.headers, "Accept-Encoding": "gzip"})
+
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert len(response.json()) == 30
+
+def test_small_response_is_not_compressed(api_client, gym):
+    response = api_client.get("/api/plans", headers={**gym.headers, "Accept-Encoding": "gzip"})
+
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+
+def test_identity_when_client_does_not_ask(api_client, mock_db, gym):
+    insert_members(mock_db, gym, 30)
+
+    response = api_client.get("/api/gym-members", headers={**gym.headers, "Accept-Encoding": "identity"})
+
+    assert "content-encoding" not in response.headers
+
+def test_response_size_is_recorded_per_route(api_client, mock_db, gym):
+    insert_members(mock_db, gym, 30)
+    api_client.get("/api/gym-members", headers={**gym.headers, "Accept-Encoding": "gzip"})
+
+    rendered = api_client.get("/metrics").text
+
+    assert 'gymble_http_response_bytes_total{encoding="gzip",method="GET",route="/api/gym-members"}' in rendered
+    assert 'gymble_http_response_size_bytes_count{method="GET",route="/api/gym-members"}' in rendered
+
+def test_compact_live_updates_drop_duplicated_checkins(api_client, mock_db, gym):
+    members = insert_members(mock_db, gym, 3)
+    asyncio.run(mock_db.attendance.insert_many([
+        server.AttendanceRecord(gym_id=gym.gym.id, member_id=member.id, member_name=member.name,
+                                check_in_time=datetime.utcnow(), qr_code_data="qr").dict()
+        for member in members
+    ]))
+
+    full = api_client.get("/api/attendance/live-updates", headers=gym.headers).json()
+    compact = api_client.get("/api/attendance/live-updates?compact=true", headers=gym.headers).json()
+
+    assert len(full["recent_checkins"]) == 3
+    assert "recent_checkins" not in compact
+    assert compact["stats"] == full["stats"]
+    assert [record["id"] for record in compact["all_attendance"]] == [record["id"] for record in full["all_attendance"]]
+    assert all(None not in record.values() for record in compact["all_attendance"])
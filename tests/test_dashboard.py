@@ -0,0 +1,58 @@
+"""In-process tests for the owner dashboard, run against the in-memory MongoDB stand-in"""
+import asyncio
+from datetime import datetime, timedelta
+
+import server
+from tests.conftest import auth_headers, insert_members
+
+# Six counts + revenue aggregate + members-by-plan aggregate; the user comes from the token
+DASHBOARD_QUERY_BUDGET = 8
+
+def test_dashboard_stats(api_client, mock_db, gym):
+    members = insert_members(mock_db, gym, 3)
+    insert_members(mock_db, gym, 1, plan=gym.plans[1], membership_status=server.MembershipStatus.EXPIRED, email="old@example.com")
+    now = datetime.utcnow()
+    asyncio.run(mock_db.payments.insert_many([
+        server.Payment(
+            gym_id=gym.gym.id, member_id=member.id, member_name=member.name, amount=1500,
+            payment_method=server.PaymentMethod.UPI, plan_id=gym.plans[0].id, plan_name=gym.plans[0].name
+        ).dict()
+        for member in members
+    ]))
+    asyncio.run(mock_db.checkins.insert_one({
+        "gym_id": gym.gym.id, "member_id": members[0].id, "check_in_time": now, "check_out_time": None
+    }))
+
+    response = api_client.get("/api/dashboard/stats", headers=gym.headers)
+
+    assert response.status_code == 200
+    stats = response.json()
+    assert stats["total_members"] == 4
+    assert stats["active_members"] == 3
+    assert stats["today_checkins"] == 1
+    assert stats["current_checkedin"] == 1
+    assert stats["monthly_revenue"] == 4500
+    assert stats["total_plans"] == 2
+    assert stats["popular_plan"] == "Basic Plan"
+
+def test_dashboard_stats_query_budget(api_client, mock_db, gym, query_counter):
+    insert_members(mock_db, gym, 5)
+
+    with query_counter.assert_max(DASHBOARD_QUERY_BUDGET):
+        assert api_client.get("/api/dashboard/stats", headers=gym.headers).status_code == 200
+
+    # members-by-plan is served from the analytics cache on the next refresh
+    with query_counter.assert_max(DASHBOARD_QUERY_BUDGET - 1):
+        assert api_client.get("/api/dashboard/stats", headers=gym.headers).status_code == 200
+
+def test_dashboard_requires_owner_or_staff(api_client, mock_db, gym):
+    member = insert_members(mock_db, gym, 1)[0]
+    user = server.User(
+        email=member.email, password_hash="x", name=member.name, phone=member.phone,
+        role=server.UserRole.MEMBER, gym_id=gym.gym.id
+    )
+    asyncio.run(mock_db.users.insert_one(user.dict()))
+
+    response = api_client.get("/api/dashboard/stats", headers=auth_headers(user))
+
+    assert response.status_code == 403
@@ -0,0 +1,70 @@
+"""Delta sync pagination when many documents share one updated_at"""
+import asyncio
+from datetime import datetime, timedelta
+
+import mongomock
+
+import migrate_progress_storage
+import server
+
+def insert_payments(mock_db, gym, member, count, updated_at):
+    payments = [
+        server.Payment(
+            gym_id=gym.gym.id, member_id=member.member.id, member_name=member.member.name, amount=1500,
+            payment_method="cash", plan_id=gym.plans[0].id, plan_name=gym.plans[0].name, updated_at=updated_at
+        ).dict()
+        for _ in range(count)
+    ]
+    asyncio.run(mock_db.payments.insert_many(payments))
+    return {payment["id"] for payment in payments}
+
+def test_pages_through_a_page_sized_batch_written_in_one_millisecond(api_client, mock_db, gym, member, monkeypatch):
+    monkeypatch.setattr(server, "SYNC_DELTA_LIMIT", 3)
+    written_at = datetime.utcnow().replace(microsecond=0) - timedelta(minutes=5)
+    expected = insert_payments(mock_db, gym, member, 7, written_at)
+    cursor = server.datetime_to_change_cursor(written_at - timedelta(seconds=1))
+
+    seen = set()
+    for _ in range(5):
+        page = api_client.get(f"/api/sync/changes?cursor={cursor}", headers=member.headers).json()
+        seen.update(payment["id"] for payment in page["payments"])
+        cursor = page["cursor"]
+        if not page["has_more"]:
+            break
+
+    assert not page["has_more"]
+    assert seen == expected
+
+def test_plain_time_cursors_still_work(api_client, mock_db, gym, member):
+    written_at = datetime.utcnow().replace(microsecond=0) - timedelta(minutes=5)
+    insert_payments(mock_db, gym, member, 2, written_at)
+
+    page = api_client.get(f"/api/sync/changes?cursor={server.datetime_to_change_cursor(written_at)}", headers=member.headers).json()
+
+    assert page["payments"] == []
+    assert ":" not in page["cursor"]
+
+def test_bucketed_progress_resumes_after_the_cursor_id(mock_db, monkeypatch):
+    monkeypatch.setattr(server, "PROGRESS_STORAGE_MODE", "buckets")
+    written_at = datetime(2025, 1, 1, 12, 0, 0)
+    entries = [{"id": f"log-{index}", "updated_at": written_at} for index in range(4)]
+    asyncio.run(mock_db.diet_progress_buckets.insert_one(
+        {"gym_id": "gym-1", "member_id": "member-1", "month": "2025-01", "updated_at": written_at, "entries": entries}
+    ))
+    monkeypatch.setattr(server.diet_progress_repository, "model", lambda **record: record["id"])
+
+    first = asyncio.run(server.diet_progress_repository.changed_since("gym-1", "member-1", (written_at - timedelta(seconds=1), None), 2))
+    rest = asyncio.run(server.diet_progress_repository.changed_since("gym-1", "member-1", (written_at, first[-1]), 2))
+
+    assert first + rest == ["log-0", "log-1", "log-2", "log-3"]
+
+def test_migrated_buckets_carry_their_newest_change():
+    db = mongomock.MongoClient()["gymble"]
+    db.workout_progress.insert_many([
+        {"id": "log-1", "gym_id": "gym-1", "member_id": "member-1", "scheduled_date": datetime(2025, 1, 3), "updated_at": datetime(2025, 1, 5)},
+        {"id": "log-2", "gym_id": "gym-1", "member_id": "member-1", "scheduled_date": datetime(2025, 1, 4), "updated_at": datetime(2025, 1, 4)},
+    ])
+
+    migrate_progress_storage.migrate(db, "workout", batch_size=10)
+
+    assert db.workout_progress_buckets.find_one({"month": "2025-01"})["updated_at"] == datetime(2025, 1, 5)
@@ -0,0 +1,48 @@
+"""Personal records in the per-exercise aggregates"""
+import asyncio
+from datetime import datetime
+
+import server
+
+def log_session(weight_kg, reps, scheduled_date, exercise_name="Back Squat"):
+    return server.WorkoutProgress(
+        gym_id="gym-1", member_id="member-1", assignment_id="assignment-1", workout_template_id="workout-1",
+        workout_name="Legs", scheduled_date=scheduled_date,
+        exercises_progress=[server.ExerciseProgress(
+            exercise_name=exercise_name, completed_sets=1, completed_reps=[reps],
+            weights_used=[f"{weight_kg}kg"], weights_kg=[weight_kg]
+        )]
+    )
+
+def stats(mock_db):
+    return asyncio.run(mock_db.exercise_stats.find_one({"member_id": "member-1"}, {"_id": 0}))
+
+def test_first_session_sets_the_record(mock_db):
+    records = asyncio.run(server.record_exercise_stats(log_session(100, 5, datetime(2025, 1, 1))))
+
+    assert records == ["Back Squat"]
+    assert stats(mock_db)["best_e1rm_date"] == datetime(2025, 1, 1)
+
+def test_lower_session_logged_later_keeps_the_higher_record(mock_db):
+    asyncio.run(server.record_exercise_stats(log_session(140, 5, datetime(2025, 1, 2))))
+    best = stats(mock_db)["best_e1rm_kg"]
+
+    # An older, lighter session synced after the heavier one
+    records = asyncio.run(server.record_exercise_stats(log_session(100, 5, datetime(2025, 1, 1))))
+
+    assert records == []
+    assert stats(mock_db)["best_e1rm_kg"] == best
+    assert stats(mock_db)["best_e1rm_date"] == datetime(2025, 1, 2)
+    assert stats(mock_db)["sessions"] == 2
+
+def test_concurrent_sessions_claim_one_record(mock_db):
+    async def log_both():
+        return await asyncio.gather(
+            server.record_exercise_stats(log_session(120, 5, datetime(2025, 1, 1))),
+            server.record_exercise_stats(log_session(120, 5, datetime(2025, 1, 2)))
+        )
+
+    first, second = asyncio.run(log_both())
+
+    assert sorted([first, second]) == [[], ["Back Squat"]]
+    assert stats(mock_db)["sessions"] == 2
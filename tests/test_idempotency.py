@@ -0,0 +1,64 @@
+"""Idempotency-Key claims: replay, in-progress conflicts and takeover of abandoned claims"""
+import asyncio
+import hashlib
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from pydantic import BaseModel
+
+import server
+
+class Payload(BaseModel):
+    amount: int
+
+USER = server.CurrentUser(id="user-1", email="owner@gym.com", name="Owner", role=server.UserRole.OWNER, gym_id="gym-1")
+
+def claim(mock_db, age_seconds):
+    request_hash = server.idempotency_fingerprint("create", Payload(amount=1))
+    claimed_at = datetime.utcnow() - timedelta(seconds=age_seconds)
+    asyncio.run(mock_db.idempotency_keys.create_index([("user_id", 1), ("key", 1)], unique=True))
+    asyncio.run(mock_db.idempotency_keys.insert_one({
+        "user_id": USER.id, "key": "key-1", "endpoint": "create", "request_hash": request_hash,
+        "status": "in_progress", "claimed_at": claimed_at, "created_at": claimed_at
+    }))
+
+def run(handler):
+    return asyncio.run(server.run_idempotent("key-1", USER, "create", Payload(amount=1), handler))
+
+def test_live_claim_is_a_conflict(mock_db):
+    claim(mock_db, age_seconds=1)
+
+    async def handler():
+        raise AssertionError("must not run while another request holds the key")
+
+    with pytest.raises(HTTPException) as error:
+        run(handler)
+    assert error.value.status_code == 409
+
+def test_abandoned_claim_is_taken_over(mock_db):
+    claim(mock_db, age_seconds=server.IDEMPOTENCY_LEASE_SECONDS + 1)
+
+    async def handler():
+        return {"id": "payment-1"}
+
+    assert run(handler) == {"id": "payment-1"}
+    stored = asyncio.run(mock_db.idempotency_keys.find_one({"key": "key-1"}))
+    assert stored["status"] == "completed"
+    assert run(handler).headers["Idempotent-Replayed"] == "true"
+
+class MemberPayload(BaseModel):
+    email: str
+    password: str
+
+def test_stored_claim_keeps_no_password_material(mock_db):
+    payload = MemberPayload(email="member@gym.com", password="hunter22")
+
+    async def handler():
+        return {"id": "member-1", "email": payload.email, "password_hash": "$2b$12$hash"}
+
+    asyncio.run(server.run_idempotent("key-2", USER, "create_member", payload, handler))
+    stored = asyncio.run(mock_db.idempotency_keys.find_one({"key": "key-2"}))
+
+    assert "password_hash" not in stored["response"]
+    assert stored["request_hash"] != hashlib.sha256(f"create_member:{payload.json()}".encode()).hexdigest()
@@ -0,0 +1,47 @@
+"""Failed-login backoff: throttled attempts must be rejected before bcrypt runs"""
+import server
+
+def login(api_client, password, email="owner@gym.com"):
+    return api_client.post("/api/auth/login", json={"email": email, "password": password})
+
+def test_backoff_after_free_failures_skips_password_check(api_client, gym, monkeypatch):
+    checks = []
+    verify_password = server.verify_password
+    monkeypatch.setattr(server, "verify_password", lambda *args: checks.append(args) or verify_password(*args))
+
+    for _ in range(server.LOGIN_FREE_FAILURES_PER_EMAIL + 1):
+        assert login(api_client, "wrong-password").status_code == 401
+    checked = len(checks)
+
+    response = login(api_client, "password123")
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert len(checks) == checked
+
+def test_backoff_doubles_per_failure():
+    throttle = server.LoginThrottle()
+
+    waits = []
+    for _ in range(3):
+        throttle.record_failure("email:a@b.com", free_failures=1)
+        waits.append(throttle.retry_after("email:a@b.com"))
+
+    assert waits[0] == 0.0
+    assert 0 < waits[1] <= server.LOGIN_BACKOFF_BASE_SECONDS
+    assert server.LOGIN_BACKOFF_BASE_SECONDS < waits[2] <= 2 * server.LOGIN_BACKOFF_BASE_SECONDS
+
+def test_successful_login_resets_email_failures(api_client, gym):
+    for _ in range(server.LOGIN_FREE_FAILURES_PER_EMAIL - 1):
+        login(api_client, "wrong-password")
+
+    assert login(api_client, "password123").status_code == 200
+    assert "email:owner@gym.com" not in server.login_throttle.failures
+
+def test_unknown_emails_count_against_the_client_address(api_client, gym, monkeypatch):
+    monkeypatch.setattr(server, "LOGIN_FREE_FAILURES_PER_IP", 2)
+
+    for index in range(3):
+        assert login(api_client, "wrong-password", email=f"nobody{index}@example.com").status_code == 401
+
+    assert login(api_client, "password123").status_code == 429
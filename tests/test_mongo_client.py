@@ -0,0 +1,25 @@
+"""The MongoDB client is created per worker at startup, not at import"""
+import asyncio
+
+import server
+
+def test_client_is_created_at_startup_and_closed_at_shutdown(monkeypatch):
+    monkeypatch.setattr(server, "client", None)
+    monkeypatch.setattr(server, "db", None)
+    monkeypatch.setenv("MONGO_URL", "mongodb://localhost:27017")
+    monkeypatch.setenv("DB_NAME", "gymble_test")
+    monkeypatch.setattr(server, "MONGO_MAX_POOL_SIZE", 7)
+
+    asyncio.run(server.connect_to_mongo())
+    client = server.client
+
+    assert server.db.name == "gymble_test"
+    assert client.options.pool_options.max_pool_size == 7
+    assert client.options.pool_options.min_pool_size == server.MONGO_MIN_POOL_SIZE
+
+    asyncio.run(server.shutdown_db_client())
+
+    assert server.client is None and server.db is None
+
+def test_connect_hook_runs_before_other_startup_hooks():
+    assert server.app.router.on_startup[0] is server.connect_to_mongo
@@ -0,0 +1,44 @@
+"""Nutrition rollups count days, not diet logs"""
+import asyncio
+from datetime import datetime
+
+import server
+
+TEMPLATE = server.DietTemplate(
+    gym_id="gym-1", name="Cut", description="", goal="Cutting", total_calories=2000, created_by="owner-1",
+    meals=[server.Meal(meal_type=meal_type, time="8:00 AM") for meal_type in ("Breakfast", "Lunch", "Dinner")]
+)
+
+def log_meal(meal_type, calories, date, water_liters=None):
+    progress = server.DietProgress(
+        gym_id="gym-1", member_id="member-1", assignment_id="assignment-1", diet_template_id=TEMPLATE.id,
+        diet_name=TEMPLATE.name, date=date, water_intake_liters=water_liters,
+        meals_progress=[server.MealProgress(meal_type=meal_type, items_consumed=["rice"], total_calories=calories)]
+    )
+    asyncio.run(server.record_nutrition_rollup(progress, TEMPLATE))
+
+def test_meals_logged_separately_make_one_day(mock_db):
+    log_meal("Breakfast", 500, datetime(2025, 1, 6, 8), water_liters=1.0)
+    log_meal("Lunch", 700, datetime(2025, 1, 6, 13), water_liters=1.0)
+    log_meal("Dinner", 800, datetime(2025, 1, 6, 20))
+    log_meal("Breakfast", 600, datetime(2025, 1, 7, 8))
+
+    week = asyncio.run(server.get_nutrition_summary("member-1", 1)).weekly[0]
+
+    assert week.days_logged == 2
+    assert week.average_calories == 1300
+    assert week.days_within_target == 1
+    assert week.average_water_liters == 2.0
+    assert week.completion_ratio == round(4 / 6, 3)
+
+def test_counters_written_before_per_day_entries_still_count(mock_db):
+    asyncio.run(mock_db.nutrition_summaries.insert_one({
+        "member_id": "member-1", "gym_id": "gym-1",
+        "weeks": {"2025-W02": {"days_logged": 1, "calorie_days": 1, "calories_consumed": 1000}}
+    }))
+    log_meal("Lunch", 2000, datetime(2025, 1, 7, 13))
+
+    week = asyncio.run(server.get_nutrition_summary("member-1", 1)).weekly[0]
+
+    assert week.days_logged == 2
+    assert week.average_calories == 1500
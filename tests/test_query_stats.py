@@ -0,0 +1,14 @@
+"""Process-wide query statistics are an operator endpoint, not a tenant one"""
+import server
+
+def test_query_stats_are_off_by_default(api_client, gym):
+    assert api_client.get("/query-stats", headers=gym.headers).status_code == 404
+    assert api_client.get("/api/admin/query-stats", headers=gym.headers).status_code == 404
+
+def test_query_stats_are_served_when_enabled(api_client, monkeypatch):
+    monkeypatch.setattr(server, "QUERY_STATS_ENABLED", True)
+
+    response = api_client.get("/query-stats")
+
+    assert response.status_code == 200
+    assert "operations" in response.json()
@@ -0,0 +1,56 @@
+"""Token-bucket rate limiting, in isolation and on real routes"""
+import asyncio
+
+import server
+from tests.conftest import auth_headers
+
+def test_bucket_allows_burst_then_reports_wait():
+    backend = server.InMemoryRateLimitBackend()
+
+    waits = [asyncio.run(backend.take("scan:user:1", rate=1.0, burst=3)) for _ in range(4)]
+
+    assert waits[:3] == [0.0, 0.0, 0.0]
+    assert 0 < waits[3] <= 1.0
+
+def test_buckets_are_independent_per_key():
+    backend = server.InMemoryRateLimitBackend()
+
+    asyncio.run(backend.take("scan:user:1", rate=1.0, burst=1))
+
+    assert asyncio.run(backend.take("scan:user:2", rate=1.0, burst=1)) == 0.0
+
+def test_prune_drops_refilled_buckets():
+    backend = server.InMemoryRateLimitBackend()
+    asyncio.run(backend.take("scan:user:1", rate=1.0, burst=1))
+
+    backend.prune(now=float("inf"))
+
+    assert backend.buckets == {}
+
+def test_dashboard_polling_gets_429_with_retry_after(api_client, gym, monkeypatch):
+    monkeypatch.setitem(server.RATE_LIMITS, "dashboard", {"user": (60, 2), "gym": (600, 100)})
+
+    statuses = [api_client.get("/api/dashboard/stats", headers=gym.headers) for _ in range(3)]
+
+    assert [response.status_code for response in statuses] == [200, 200, 429]
+    assert int(statuses[2].headers["Retry-After"]) >= 1
+
+def test_gym_budget_is_shared_by_its_users(api_client, mock_db, gym, monkeypatch):
+    monkeypatch.setitem(server.RATE_LIMITS, "dashboard", {"user": (60, 10), "gym": (60, 1)})
+    staff = server.User(
+        email="staff@gym.com", password_hash="x", name="Front Desk", phone="+91 9876543212",
+        role=server.UserRole.STAFF, gym_id=gym.gym.id
+    )
+    asyncio.run(mock_db.users.insert_one(staff.dict()))
+
+    assert api_client.get("/api/dashboard/stats", headers=gym.headers).status_code == 200
+    assert api_client.get("/api/dashboard/stats", headers=auth_headers(staff)).status_code == 429
+
+def test_auth_bucket_is_per_ip_unless_exempt(api_client, mock_db, monkeypatch):
+    monkeypatch.setitem(server.RATE_LIMITS, "auth", {"ip": (1, 1)})
+    refresh = lambda: api_client.post("/api/auth/refresh", json={"refresh_token": "not-a-token"}).status_code
+
+    assert [refresh(), refresh()] == [401, 429]
+
+    monkeypatch.setattr(server, "RATE_LIMIT_EXEMPT_IPS", {"testclient"})
+    assert refresh() == 401
@@ -0,0 +1,80 @@
+"""Offline batch sync: op_ids are claimed before anything is applied"""
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import server
+
+@pytest.fixture(autouse=True)
+def op_id_index(mock_db):
+    asyncio.run(mock_db.sync_operations.create_index([("member_id", 1), ("op_id", 1)], unique=True))
+
+def check_in(gym, op_id="op-1"):
+    slot = int(time.time()) // 300 * 300
+    return {"operations": [{
+        "op_id": op_id,
+        "type": "attendance",
+        "client_timestamp": datetime.utcnow().isoformat() + "Z",
+        "payload": {"action": "check-in", "qr_code_data": f"GYMBLE_ATTENDANCE:{gym.gym.id}:{slot}"},
+    }]}
+
+def claim(mock_db, member_id, age_seconds):
+    claimed_at = datetime.utcnow() - timedelta(seconds=age_seconds)
+    asyncio.run(mock_db.sync_operations.insert_one(
+        {"member_id": member_id, "op_id": "op-1", "claimed_at": claimed_at, "created_at": claimed_at}
+    ))
+
+def attendance_count(mock_db):
+    return asyncio.run(mock_db.attendance.count_documents({}))
+
+def test_retried_batch_is_applied_once(api_client, mock_db, gym, member):
+    headers = member.headers
+
+    first = api_client.post("/api/sync/batch", json=check_in(gym), headers=headers).json()
+    retry = api_client.post("/api/sync/batch", json=check_in(gym), headers=headers).json()
+
+    assert first["results"][0]["status"] == "applied"
+    assert retry["results"][0]["status"] == "duplicate"
+    assert retry["results"][0]["resource_id"] == first["results"][0]["resource_id"]
+    assert attendance_count(mock_db) == 1
+
+def test_operation_claimed_by_a_concurrent_batch_is_pending(api_client, mock_db, gym, member):
+    record, headers = member.member, member.headers
+    claim(mock_db, record.id, age_seconds=1)
+
+    response = api_client.post("/api/sync/batch", json=check_in(gym), headers=headers).json()
+
+    assert response["results"][0]["status"] == "pending"
+    assert attendance_count(mock_db) == 0
+
+def test_abandoned_claim_is_taken_over(api_client, mock_db, gym, member):
+    record, headers = member.member, member.headers
+    claim(mock_db, record.id, age_seconds=server.SYNC_CLAIM_LEASE_SECONDS + 1)
+
+    response = api_client.post("/api/sync/batch", json=check_in(gym), headers=headers).json()
+
+    assert response["results"][0]["status"] == "applied"
+    assert attendance_count(mock_db) == 1
+
+def test_rejected_operation_releases_its_claim(api_client, mock_db, gym, member):
+    headers = member.headers
+    batch = check_in(gym)
+    batch["operations"][0]["payload"]["qr_code_data"] = "GYMBLE_ATTENDANCE:other-gym:0"
+
+    response = api_client.post("/api/sync/batch", json=batch, headers=headers).json()
+
+    assert response["results"][0]["status"] == "rejected"
+    assert asyncio.run(mock_db.sync_operations.count_documents({})) == 0
+
+def test_inactive_member_cannot_check_in_offline(api_client, mock_db, gym, member):
+    record, headers = member.member, member.headers
+    asyncio.run(mock_db.members.update_one({"id": record.id}, {"$set": {"membership_status": "expired"}}))
+
+    response = api_client.post("/api/sync/batch", json=check_in(gym), headers=headers).json()
+
+    assert response["results"][0] == {
+        "op_id": "op-1", "status": "rejected", "resource_id": None, "detail": "Membership is not active"
+    }
+    assert attendance_count(mock_db) == 0
@@ -0,0 +1,29 @@
+"""Template snapshots are cached privately and revalidated with their content hash"""
+import asyncio
+
+import server
+
+def store_version(mock_db, gym):
+    version = server.TemplateVersion(
+        id="version-1", gym_id=gym.gym.id, template_id="template-1", plan_type="workout", version=1, body={"name": "Legs"}
+    )
+    asyncio.run(mock_db.template_versions.insert_one(version.dict()))
+    return version
+
+def test_snapshot_is_cached_by_the_client_only(api_client, mock_db, gym):
+    store_version(mock_db, gym)
+
+    response = api_client.get("/api/template-versions/version-1", headers=gym.headers)
+
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"].startswith("private,")
+    assert response.headers["ETag"] == '"version-1"'
+
+def test_matching_etag_returns_not_modified(api_client, mock_db, gym, query_counter):
+    store_version(mock_db, gym)
+    query_counter.reset()
+
+    response = api_client.get("/api/template-versions/version-1", headers={**gym.headers, "If-None-Match": '"version-1"'})
+
+    assert response.status_code == 304
+    assert ("template_versions", "find_one") not in query_counter.calls